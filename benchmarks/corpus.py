@@ -0,0 +1,156 @@
+"""Deterministic synthetic corpora for the benchmarks.
+
+Generates text PDFs (written by hand, no PDF library needed), OneNote InkML
+files and grayscale page images. The same seed gives byte-identical files.
+
+    python benchmarks/corpus.py /tmp/corpus --pdfs 20 --inkml 20 --images 10
+"""
+import argparse
+import os
+import random
+from typing import Dict, List
+
+WORDS = (
+    "network attention gradient model learning memory signal layer "
+    "inference probability distribution kernel matrix vector optimisation "
+    "training dataset benchmark convolution transformer embedding token "
+    "sequence language vision graph spectral bayesian variational sampling "
+    "estimator regression classifier entropy divergence manifold").split()
+
+
+def synthetic_words(rng: random.Random, n_words: int) -> List[str]:
+    return rng.choices(WORDS, k=n_words)
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(path: str,
+             rng: random.Random,
+             pages: int = 5,
+             lines_per_page: int = 45,
+             words_per_line: int = 12):
+    """Write a text PDF with Helvetica lines of random words"""
+    # object numbers: 1 catalog, 2 pages, 3 font, then page/content pairs
+    objects: Dict[int, bytes] = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for page in range(pages):
+        page_obj, content_obj = 4 + 2 * page, 5 + 2 * page
+        kids.append(f"{page_obj} 0 R")
+        lines = [
+            "(" + _pdf_escape(" ".join(synthetic_words(rng, words_per_line))) +
+            ") Tj T*" for _ in range(lines_per_page)
+        ]
+        stream = ("BT /F1 10 Tf 14 TL 50 780 Td\n" + "\n".join(lines) +
+                  "\nET").encode("latin-1")
+        objects[content_obj] = (b"<< /Length %d >>\nstream\n" % len(stream) +
+                                stream + b"\nendstream")
+        objects[page_obj] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % content_obj)
+    objects[2] = ("<< /Type /Pages /Kids [%s] /Count %d >>" %
+                  (" ".join(kids), pages)).encode("ascii")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n" % number + objects[number] + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for number in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[number]
+    out += (b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" %
+            (len(objects) + 1, xref))
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_inkml(path: str,
+               rng: random.Random,
+               traces: int = 300,
+               points: int = 40):
+    """Write an InkML note of random pen strokes, as `read_file` expects"""
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<inkml:ink xmlns:inkml="http://www.w3.org/2003/InkML">\n'
+    ]
+    for _ in range(traces):
+        x, y = rng.randint(0, 20000), rng.randint(0, 30000)
+        coords = []
+        for _ in range(points):
+            x = max(0, x + rng.randint(-40, 40))
+            y = max(0, y + rng.randint(-40, 40))
+            coords.append(f"{x} {y} {rng.randint(1, 8)}")
+        parts.append(f"<inkml:trace>{', '.join(coords)}</inkml:trace>\n")
+    parts.append("</inkml:ink>\n")
+    with open(path, "w") as f:
+        f.write("".join(parts))
+
+
+def make_page_image(rng: random.Random,
+                    height: int = 3500,
+                    width: int = 2500,
+                    lines: int = 30):
+    """Grayscale page (uint8 array) with dark handwriting-like line bands"""
+    import numpy as np
+    np_rng = np.random.default_rng(rng.randint(0, 2**32 - 1))
+    img = np.full((height, width), 255, dtype=np.uint8)
+    line_height = height // (lines + 1)
+    for line in range(lines):
+        top = line_height * line + line_height // 4
+        band = img[top:top + line_height // 2]
+        ink = np_rng.random(band.shape) < 0.15
+        band[ink] = np_rng.integers(0, 80, size=int(ink.sum()),
+                                    dtype=np.uint8)
+    return img
+
+
+def build_corpus(directory: str,
+                 seed: int = 0,
+                 pdfs: int = 20,
+                 inkml: int = 20,
+                 images: int = 10,
+                 pdf_pages: int = 5) -> Dict[str, List[str]]:
+    """Generate the corpus files
+    :returns: paths of the files per kind
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    corpus = {"pdf": [], "inkml": [], "image": []}
+    for i in range(pdfs):
+        path = os.path.join(directory, f"paper_{i:04d}.pdf")
+        make_pdf(path, rng, pages=pdf_pages)
+        corpus["pdf"].append(path)
+    for i in range(inkml):
+        path = os.path.join(directory, f"note_{i:04d}.xml")
+        make_inkml(path, rng)
+        corpus["inkml"].append(path)
+    if images:
+        import numpy as np
+        for i in range(images):
+            path = os.path.join(directory, f"page_{i:04d}.npy")
+            np.save(path, make_page_image(rng))
+            corpus["image"].append(path)
+    return corpus
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a test corpus")
+    parser.add_argument("directory", type=str, help="Output directory")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--pdfs", type=int, default=20, help="Number of PDFs")
+    parser.add_argument("--pdf-pages", type=int, default=5,
+                        help="Pages per PDF")
+    parser.add_argument("--inkml", type=int, default=20,
+                        help="Number of InkML files")
+    parser.add_argument("--images", type=int, default=10,
+                        help="Number of page images")
+    args = parser.parse_args()
+    build_corpus(args.directory, args.seed, args.pdfs, args.inkml,
+                 args.images, args.pdf_pages)
@@ -0,0 +1,127 @@
+"""Measure the import cost of each `onenutil` CLI subcommand.
+
+Each subcommand's imports are run in a fresh interpreter with
+`-X importtime` and the cumulative time of the top-level imports is summed.
+
+    python benchmarks/import_time.py --repeat 5 --json import_time.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                       "src")
+
+# imports done by the CLI itself and by each of the subcommand bodies
+CLI_IMPORTS = ["import onenutil.__main__"]
+SUBCOMMAND_IMPORTS = {
+    "cli": [],
+    # the search imports of the default elastic backend are done when it is
+    # created and queried
+    "search": [
+        "from onenutil.interface.backends import get_backend",
+        "from onenutil.interface.search import passage_search, search_format",
+        "from onenutil.elastic import create_es_instance",
+        "from onenutil.interface.search import basic_search",
+    ],
+    "search-sqlite": [
+        "from onenutil.interface.backends import get_backend",
+        "from onenutil.interface.search import passage_search, search_format",
+    ],
+    "start": ["from onenutil.interface.term import SearchApp"],
+    "upload": ["from onenutil.elastic import run_note_upload, stream_pdfs"],
+    "zotero-upload": [
+        "from onenutil.elastic import run_zotero_upload",
+        "from onenutil.interface.zotero_con import ZoteroCon",
+    ],
+    "models": ["from onenutil.extract.models import preload"],
+}
+
+importtime_line = re.compile(
+    r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> Tuple[int, List[Tuple[str, int]]]:
+    """Parse the `-X importtime` output
+    :returns: total microseconds and the (module, cumulative us) of
+        the top-level imports
+    """
+    top_level = []
+    for line in stderr.splitlines():
+        match = importtime_line.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, module = match.groups()
+        # nested imports are indented by two spaces per level
+        if len(indent) <= 1:
+            top_level.append((module, int(cumulative)))
+    return sum(us for _, us in top_level), top_level
+
+
+def measure(statements: List[str]) -> Tuple[int, List[Tuple[str, int]]]:
+    """Run the import statements in a fresh interpreter"""
+    code = "; ".join(CLI_IMPORTS + statements)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [SRC_DIR, env.get("PYTHONPATH", "")]))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          env=env,
+                          capture_output=True,
+                          text=True)
+    if proc.returncode:
+        error = proc.stderr.strip().splitlines()[-1]
+        raise RuntimeError(f"Import failed: {error}")
+    return parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import time per onenutil subcommand")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=3,
+                        help="Number of runs per subcommand")
+    parser.add_argument("--top",
+                        type=int,
+                        default=5,
+                        help="Number of slowest top-level imports to show")
+    parser.add_argument("--json",
+                        type=str,
+                        help="Save the results to a JSON file")
+    args = parser.parse_args()
+
+    results: Dict[str, dict] = {}
+    for subcommand, statements in SUBCOMMAND_IMPORTS.items():
+        try:
+            runs = [measure(statements) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{subcommand:>14}: {e}")
+            continue
+        totals = [total for total, _ in runs]
+        slowest = sorted(runs[-1][1], key=lambda x: x[1],
+                         reverse=True)[:args.top]
+        results[subcommand] = {
+            "median_ms": statistics.median(totals) / 1000,
+            "min_ms": min(totals) / 1000,
+            "slowest": [{
+                "module": module,
+                "ms": us / 1000
+            } for module, us in slowest]
+        }
+        print(f"{subcommand:>14}: {results[subcommand]['median_ms']:8.1f} ms "
+              f"(min {results[subcommand]['min_ms']:.1f} ms)")
+        for module, us in slowest:
+            print(f"{'':>16}{module:<40}{us / 1000:8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""Benchmark the ingestion and search hot paths of `onenutil`.
+
+Each stage runs on a deterministic synthetic corpus (see `corpus.py`) and
+reports its throughput and peak traced memory (Python and numpy allocations,
+native libraries such as SQLite are only seen in the process max RSS, which
+is reported at the end). Stages whose dependencies
+(or models) are missing are skipped. The search runs against an in-process
+SQLite index, and also against Elasticsearch when `--es-host` is given.
+
+    python benchmarks/ingestion.py --json base.json
+    python benchmarks/ingestion.py --json new.json --compare base.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import WORDS, build_corpus, synthetic_words  # noqa: E402
+
+# a prepared stage: the workload, the number of items and bytes it processes
+Prepared = Tuple[Callable[[], None], int, int]
+
+
+class Context:
+    """Corpus and intermediate results shared by the stages"""
+
+    def __init__(self, corpus: Dict[str, List[str]], seed: int,
+                 queries: int, es_host: str, workdir: str):
+        self.corpus = corpus
+        # scratch directory, removed after the run
+        self.workdir = workdir
+        self.rng = random.Random(seed)
+        self.es_host = es_host
+        self.queries = [
+            " ".join(synthetic_words(self.rng, 2)) for _ in range(queries)
+        ]
+        self._texts = None
+
+    @property
+    def texts(self) -> List[str]:
+        """Text of the PDFs, synthetic if pdfminer is missing"""
+        if self._texts is None:
+            try:
+                from onenutil.extract.pdf import extract_text_pdf
+                self._texts = [
+                    extract_text_pdf(fn) for fn in self.corpus["pdf"]
+                ]
+            except ImportError:
+                self._texts = [
+                    " ".join(synthetic_words(self.rng, 3000))
+                    for _ in self.corpus["pdf"]
+                ]
+        return self._texts
+
+    def note_docs(self) -> List[dict]:
+        return [{
+            "_index": "notes",
+            "_source": {
+                "name": os.path.basename(fn),
+                "keywords": synthetic_words(self.rng, 5),
+                "summary": [],
+                "path": fn,
+                "content": text
+            }
+        } for fn, text in zip(self.corpus["pdf"], self.texts)]
+
+
+def _size(paths: List[str]) -> int:
+    return sum(os.path.getsize(p) for p in paths)
+
+
+def prepare_pdf_extract(ctx: Context) -> Prepared:
+    from onenutil.extract.pdf import extract_text_pdf
+    paths = ctx.corpus["pdf"]
+
+    def run():
+        for fn in paths:
+            extract_text_pdf(fn)
+
+    return run, len(paths), _size(paths)
+
+
+def prepare_format_pdf(ctx: Context) -> Prepared:
+    from onenutil.extract.pdf import format_pdf
+    texts = ctx.texts
+
+    def run():
+        for text in texts:
+            format_pdf(text)
+
+    return run, len(texts), sum(len(t) for t in texts)
+
+
+def prepare_tags(ctx: Context) -> Prepared:
+    from onenutil.extract.ranking import TagExtractor
+    extractor = TagExtractor()
+    texts = [text[:20000] for text in ctx.texts]
+    # load the model outside of the measurement
+    extractor(texts[0])
+
+    def run():
+        extractor.batch(texts)
+
+    return run, len(texts), sum(len(t) for t in texts)
+
+
+def prepare_embeddings(ctx: Context) -> Prepared:
+    from onenutil.extract.embeddings import EmbeddingsExtractor
+    extractor = EmbeddingsExtractor()
+    sentences = [text[:500] for text in ctx.texts]
+    extractor(sentences[0])
+
+    def run():
+        extractor.batch(sentences)
+
+    return run, len(sentences), sum(len(s) for s in sentences)
+
+
+def prepare_y_histogram(ctx: Context) -> Prepared:
+    import numpy as np
+    from onenutil.extract.ocr import y_intensity_histogram
+    images = [np.load(fn) for fn in ctx.corpus["image"]]
+
+    def run():
+        for img in images:
+            y_intensity_histogram(img)
+
+    return run, len(images), sum(img.nbytes for img in images)
+
+
+def prepare_inkml_read(ctx: Context) -> Prepared:
+    from onenutil.extract.ink import read_file
+    paths = ctx.corpus["inkml"]
+
+    def run():
+        for fn in paths:
+            read_file(fn)
+
+    return run, len(paths), _size(paths)
+
+
+def prepare_sqlite_index(ctx: Context) -> Prepared:
+    from onenutil.interface.backends import SQLiteBackend
+    docs = ctx.note_docs()
+
+    def run():
+        backend = SQLiteBackend(os.path.join(ctx.workdir, "index.sqlite"))
+        backend.create_index("notes")
+        backend.index(docs)
+        backend.close()
+
+    return run, len(docs), sum(len(d["_source"]["content"]) for d in docs)
+
+
+def prepare_sqlite_search(ctx: Context) -> Prepared:
+    from onenutil.interface.backends import SQLiteBackend
+    backend = SQLiteBackend(os.path.join(ctx.workdir, "search.sqlite"))
+    backend.index(ctx.note_docs())
+    queries = ctx.queries
+
+    def run():
+        for query in queries:
+            backend.search(query)
+
+    return run, len(queries), 0
+
+
+def prepare_es_search_dsl(ctx: Context) -> Prepared:
+    if not ctx.es_host:
+        raise RuntimeError("no --es-host given")
+    import numpy as np
+    from elasticsearch import Elasticsearch
+    from elasticsearch.helpers import bulk
+    from elasticsearch_dsl.connections import connections
+    from onenutil.elastic import FastJSONSerializer, create_article_index
+    from onenutil.interface.search import search_dsl
+
+    index = "bench_articles"
+    es = Elasticsearch([ctx.es_host], serializer=FastJSONSerializer())
+    connections.create_connection(hosts=[ctx.es_host])
+    create_article_index(es, index=index)
+    np_rng = np.random.default_rng(0)
+    authors = [f"Author {i}" for i in range(200)]
+    bulk(es, ({
+        "_index": index,
+        "_id": str(i),
+        "_source": {
+            "title": " ".join(synthetic_words(ctx.rng, 8)),
+            "summary": [" ".join(synthetic_words(ctx.rng, 40))],
+            "keywords": synthetic_words(ctx.rng, 6),
+            "authors": ctx.rng.sample(authors, 3),
+            "path": str(i),
+            "embedding": np_rng.random(384, dtype=np.float32),
+        }
+    } for i in range(2000)),
+         refresh=True)
+    queries = ctx.queries
+
+    def run():
+        for query in queries:
+            search_dsl(query, index=index)
+
+    return run, len(queries), 0
+
+
+STAGES: Dict[str, Callable[[Context], Prepared]] = {
+    "pdf_extract": prepare_pdf_extract,
+    "format_pdf": prepare_format_pdf,
+    "tags": prepare_tags,
+    "embeddings": prepare_embeddings,
+    "y_histogram": prepare_y_histogram,
+    "inkml_read": prepare_inkml_read,
+    "sqlite_index": prepare_sqlite_index,
+    "sqlite_search": prepare_sqlite_search,
+    "es_search_dsl": prepare_es_search_dsl,
+}
+
+
+def measure(run: Callable[[], None], items: int, nbytes: int,
+            repeat: int) -> Dict[str, float]:
+    """Time the workload, then run it once more under tracemalloc
+    for the peak memory (tracing slows the code down)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    seconds = statistics.median(times)
+    return {
+        "items": items,
+        "seconds": seconds,
+        "min_seconds": min(times),
+        "items_per_s": items / seconds if seconds else 0.0,
+        "mb_per_s": nbytes / 2**20 / seconds if seconds else 0.0,
+        "peak_mb": peak / 2**20,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=BENCH_DIR,
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: Dict, baseline: Dict):
+    """Print the throughput and memory against a previous run"""
+    print(f"\ncompared to {baseline['meta'].get('commit') or 'baseline'}:")
+    for name, stage in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if not base or not base.get("items_per_s"):
+            continue
+        speedup = stage["items_per_s"] / base["items_per_s"]
+        print(f"{name:>14}: {speedup:6.2f}x throughput, "
+              f"peak {base['peak_mb']:.1f} -> {stage['peak_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingestion and search benchmarks")
+    parser.add_argument("--stages",
+                        nargs="+",
+                        choices=list(STAGES),
+                        default=list(STAGES),
+                        help="Stages to run")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--pdfs", type=int, default=20, help="Number of PDFs")
+    parser.add_argument("--pdf-pages",
+                        type=int,
+                        default=5,
+                        help="Pages per PDF")
+    parser.add_argument("--inkml",
+                        type=int,
+                        default=20,
+                        help="Number of InkML files")
+    parser.add_argument("--images",
+                        type=int,
+                        default=10,
+                        help="Number of page images")
+    parser.add_argument("--queries",
+                        type=int,
+                        default=100,
+                        help="Number of search queries")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=3,
+                        help="Number of timed runs per stage")
+    parser.add_argument("--corpus",
+                        type=str,
+                        help="Corpus directory, kept between runs "
+                        "(default: a temporary directory)")
+    parser.add_argument("--es-host",
+                        type=str,
+                        help="Elasticsearch host for the search_dsl stage, "
+                        "e.g. localhost:9200 (test container)")
+    parser.add_argument("--json",
+                        type=str,
+                        help="Save the results to a JSON file")
+    parser.add_argument("--compare",
+                        type=str,
+                        help="JSON results of a previous run to compare to")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus = build_corpus(args.corpus or tmpdir,
+                              seed=args.seed,
+                              pdfs=args.pdfs,
+                              inkml=args.inkml,
+                              images=args.images,
+                              pdf_pages=args.pdf_pages)
+        ctx = Context(corpus, args.seed, args.queries, args.es_host, tmpdir)
+        results = {
+            "meta": {
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "pdfs": args.pdfs,
+                "pdf_pages": args.pdf_pages,
+                "inkml": args.inkml,
+                "images": args.images,
+                "queries": args.queries,
+                "words": len(WORDS),
+            },
+            "stages": {},
+            "skipped": {},
+        }
+        for name in args.stages:
+            try:
+                run, items, nbytes = STAGES[name](ctx)
+            except Exception as e:
+                results["skipped"][name] = f"{type(e).__name__}: {e}"
+                print(f"{name:>14}: skipped ({results['skipped'][name]})")
+                continue
+            stage = results["stages"][name] = measure(
+                run, items, nbytes, args.repeat)
+            print(f"{name:>14}: {stage['items_per_s']:10.1f} items/s "
+                  f"{stage['mb_per_s']:8.2f} MB/s "
+                  f"{stage['seconds'] * 1000:9.1f} ms "
+                  f"peak {stage['peak_mb']:7.1f} MB")
+
+    try:
+        import resource
+        # kilobytes on Linux
+        results["meta"]["max_rss_mb"] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{'max rss':>14}: {results['meta']['max_rss_mb']:.1f} MB")
+    except ImportError:
+        pass
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark the Obsidian note rendering of the Kindle agent.
+
+Renders (and optionally writes) notes for synthetic books, no model involved.
+
+    python benchmarks/kindle_render.py --books 10000 --write --json render.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "kindle")
+)
+
+from render import render_obsidian_note, write_atomic  # noqa: E402
+
+WORDS = (
+    "memory attention habit model market signal theory practice system "
+    "evidence decision learning history power network language"
+).split()
+
+
+def synthetic_book(rng: random.Random, i: int, n_highlights: int) -> Dict:
+    def sentence(n_words: int) -> str:
+        return " ".join(rng.choices(WORDS, k=n_words)).capitalize() + "."
+
+    highlights = [sentence(rng.randint(10, 60)) for _ in range(n_highlights)]
+
+    def refs() -> List[int]:
+        return rng.sample(range(n_highlights), k=min(3, n_highlights))
+
+    summary = "\n\n".join(
+        f"{sentence(40)} (ref: {', '.join(f'[{r + 1}]' for r in refs())})"
+        for _ in range(5)
+    )
+    concepts = [
+        {
+            "name": f"{sentence(3)[:-1]}, part {j}.",
+            "description": sentence(30),
+            "references": refs(),
+        }
+        for j in range(8)
+    ]
+    return {
+        "title": f"Book {i}: {sentence(4)[:-1]}",
+        "author": f"By: Author {i}",
+        "highlights": highlights,
+        "summary": summary,
+        "concepts": concepts,
+        "tags": [f"#{w}" for w in rng.sample(WORDS, k=6)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Obsidian note rendering benchmark")
+    parser.add_argument("--books", type=int, default=10000, help="Number of books")
+    parser.add_argument(
+        "--highlights", type=int, default=50, help="Highlights per book"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--write", action="store_true", help="Also write the notes to a temp dir"
+    )
+    parser.add_argument("--json", type=str, help="Save the results to a JSON file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    books = [synthetic_book(rng, i, args.highlights) for i in range(args.books)]
+
+    start = time.perf_counter()
+    notes = [
+        render_obsidian_note(
+            book["title"],
+            book["author"],
+            book["highlights"],
+            book["summary"],
+            book["concepts"],
+            book["tags"],
+            date="2024-01-01",
+        )
+        for book in books
+    ]
+    render_time = time.perf_counter() - start
+    results = {
+        "books": args.books,
+        "highlights_per_book": args.highlights,
+        "render_s": render_time,
+        "render_books_per_s": args.books / render_time,
+        "note_mb": sum(len(note) for note in notes) / 2**20,
+    }
+
+    if args.write:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            start = time.perf_counter()
+            for i, note in enumerate(notes):
+                write_atomic(os.path.join(tmpdir, f"book-{i}.md"), note)
+            write_time = time.perf_counter() - start
+        results.update(
+            {"write_s": write_time, "write_books_per_s": args.books / write_time}
+        )
+
+    for key, value in results.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        print(f"{key:>22}: {value}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,104 @@
 import json
 import os
+import random
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import argparse
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 from itertools import batched
 from smolagents.agents import ToolCallingAgent
 from smolagents.models import HfApiModel, OpenAIServerModel
 from smolagents import DuckDuckGoSearchTool
-from functools import lru_cache
+
+from files import write_atomic
+from highlights import highlights_fingerprint, open_highlights
+from render import parse_summary_references, render_obsidian_note
+from response_cache import ResponseCache
 
 load_dotenv()
 
+# a 429 status in an error message, not any 429 (token counts, ids, sizes)
+status_429_pattern = re.compile(
+    r"\b(?:status|http(?:/[\d.]+)?|error)(?:[ _]code)?\W{0,3}429\b", re.IGNORECASE
+)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check if the model API rejected the request because of rate limiting."""
+    for err in (error, error.__cause__, error.__context__):
+        if err is None:
+            continue
+        status = getattr(err, "status_code", None) or getattr(
+            getattr(err, "response", None), "status_code", None
+        )
+        if status == 429:
+            return True
+        message = str(err).lower()
+        if "rate limit" in message or "too many requests" in message:
+            return True
+        if status_429_pattern.search(message):
+            return True
+    return False
+
+
+class CachedSearchTool(DuckDuckGoSearchTool):
+    """DuckDuckGo search with the results cached on disk."""
+
+    def __init__(self, cache: ResponseCache, **kwargs):
+        super().__init__(**kwargs)
+        self.response_cache = cache
+
+    def forward(self, query: str) -> str:
+        key = ResponseCache.make_key("duckduckgo", query, [], 0)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached
+        results = super().forward(query)
+        self.response_cache.set(key, "search", results)
+        return results
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text, about 4 characters per token."""
+    return len(text) // 4 + 1
+
+
+def chunk_highlights(
+    highlights: List[str], token_budget: int
+) -> List[Tuple[int, List[str]]]:
+    """Split highlights into consecutive chunks of at most `token_budget` tokens.
+
+    Returns (offset, chunk) pairs, where offset is the index of the first highlight
+    of the chunk in the whole list. A single highlight over budget gets its own chunk.
+    """
+    chunks = []
+    start, tokens = 0, 0
+    for i, highlight in enumerate(highlights):
+        highlight_tokens = estimate_tokens(highlight)
+        if i > start and tokens + highlight_tokens > token_budget:
+            chunks.append((start, highlights[start:i]))
+            start, tokens = i, 0
+        tokens += highlight_tokens
+    if start < len(highlights):
+        chunks.append((start, highlights[start:]))
+    return chunks
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the Retry-After header of a rate limited response, if there is one."""
+    for err in (error, error.__cause__, error.__context__):
+        headers = getattr(getattr(err, "response", None), "headers", None)
+        if headers and headers.get("retry-after"):
+            try:
+                return float(headers["retry-after"])
+            except ValueError:
+                return None
+    return None
+
 
 class KindleToObsidianAgent:
     def __init__(
@@ -22,12 +108,63 @@ class KindleToObsidianAgent:
         model_name: str = "gpt-4o-mini",
         openai_api_key: str = os.getenv("OPENAI_API_KEY"),
         log_file: str = None,
+        api_base: str = None,
+        concurrency: int = 1,
+        max_retries: int = 5,
+        initial_backoff: float = 2.0,
+        cache_file: str = None,
+        cache_max_mb: int = 100,
+        refresh: bool = False,
+        incremental: bool = False,
+        enrich_workers: int = 4,
+        map_reduce: bool = False,
+        chunk_tokens: int = 3000,
+        reduce_fan_in: int = 8,
+        map_workers: int = 4,
     ):
-        """Initialize the agent with the path to highlights file and output directory."""
+        """Initialize the agent with the path to highlights file and output directory.
+
+        With concurrency > 1, up to that many books are processed at once and the
+        independent model calls of a book (summary vs. concepts and tags) run in
+        parallel. Rate limited calls are retried with exponential backoff.
+
+        Model responses are cached on disk (`cache_file`, by default in the output
+        directory), so unchanged books are not sent to the model again. Use
+        `refresh` to ignore the cached responses and overwrite them.
+
+        In `incremental` mode the highlights of every processed book are
+        fingerprinted in a manifest in the output directory. Unchanged books are
+        skipped, and books with appended highlights only get their summary
+        extended instead of being processed from scratch.
+
+        With `map_reduce`, the highlights of a book are split into chunks of about
+        `chunk_tokens` tokens. Concepts and summaries are generated for up to
+        `map_workers` chunks at a time and then merged, at most `reduce_fan_in`
+        parts per call.
+        """
         self.highlights_file = highlights_file
         self.output_dir = output_dir
         self.model_name = model_name
         self.openai_api_key = openai_api_key
+        self.concurrency = max(1, concurrency)
+        self.enrich_workers = max(1, enrich_workers)
+        self.map_reduce = map_reduce
+        self.chunk_tokens = chunk_tokens
+        self.reduce_fan_in = max(2, reduce_fan_in)
+        self.map_workers = max(1, map_workers)
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self._local = threading.local()
+        self._log_lock = threading.Lock()
+        self.refresh = refresh
+        self.cache = ResponseCache(
+            cache_file or os.path.join(output_dir, ".response_cache.sqlite"),
+            max_bytes=cache_max_mb * 2**20,
+        )
+        self.incremental = incremental
+        self.manifest_file = os.path.join(output_dir, ".sync_manifest.json")
+        self._manifest_lock = threading.Lock()
+        self.manifest = self._load_manifest() if incremental else {}
 
         # Set up log file
         self.log_file = log_file or os.path.join(output_dir, "processing_log.txt")
@@ -36,24 +173,31 @@ class KindleToObsidianAgent:
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        # Clear log file if it exists
-        with open(self.log_file, "w", encoding="utf-8") as f:
-            f.write(
-                f"Kindle to Obsidian Processing Log - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-            )
+        # Clear log file if it exists, keep the history of incremental runs
+        # The handle stays open (buffered) for the whole run, see `close`
+        self._log_handle = open(
+            self.log_file, "a" if incremental else "w", encoding="utf-8"
+        )
+        self._log_handle.write(
+            f"Kindle to Obsidian Processing Log - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+        )
 
         # Load highlights
-        with open(highlights_file, "r", encoding="utf-8") as f:
-            self.book_data = json.load(f)
+        self.book_data = open_highlights(highlights_file)
 
         # Setup search tool
-        self.search_tool = DuckDuckGoSearchTool()
+        self.search_tool = CachedSearchTool(self.cache)
 
         # Define custom tools
         self.tools = [self.search_tool]
 
         # Initialize model based on type
-        if "gpt" in model_name.lower():
+        if api_base:
+            # Any OpenAI-compatible server, e.g. a local one
+            self.model = OpenAIServerModel(
+                model_id=model_name, api_base=api_base, api_key=openai_api_key
+            )
+        elif "gpt" in model_name.lower():
             # Using OpenAI model
             if not openai_api_key:
                 raise ValueError("OpenAI API key is required for OpenAI models")
@@ -63,27 +207,91 @@ class KindleToObsidianAgent:
             # Using HuggingFace model
             self.model = HfApiModel(model_id=model_name)
 
-        # Initialize agent with tools
-        self.agent = ToolCallingAgent(
-            model=self.model,
-            tools=self.tools,
-            max_steps=5,
-            name="Kindle to Obsidian Agent",
-            description="Generates kindle highlights in obsidian format",
+    @property
+    def agent(self) -> ToolCallingAgent:
+        """Agent of the current thread. Agents keep the memory of their run,
+        so concurrent calls cannot share one."""
+        if not hasattr(self._local, "agent"):
+            # Initialize agent with tools
+            self._local.agent = ToolCallingAgent(
+                model=self.model,
+                tools=self.tools,
+                max_steps=5,
+                name="Kindle to Obsidian Agent",
+                description="Generates kindle highlights in obsidian format",
+            )
+        return self._local.agent
+
+    def run_agent(self, prompt: str, stage: str = "agent") -> str:
+        """Run the agent, backing off and retrying when the model is rate limited.
+
+        Responses are served from the cache unless `refresh` is set.
+        """
+        key = ResponseCache.make_key(
+            self.model_name,
+            prompt,
+            [tool.name for tool in self.tools],
+            self.agent.max_steps,
         )
+        return self._cached_call(key, stage, lambda: self.agent.run(prompt))
+
+    def run_model(self, prompt: str, stage: str = "model") -> str:
+        """Send a single prompt straight to the model, without the agent loop
+        and tools. Cached and retried like `run_agent`."""
+        key = ResponseCache.make_key(self.model_name, prompt, [], 0)
+        messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+        return self._cached_call(key, stage, lambda: self.model(messages).content)
+
+    def _cached_call(self, key: str, stage: str, call: Callable) -> str:
+        if not self.refresh:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        response = str(self._call_with_backoff(call))
+        self.cache.set(key, stage, response)
+        return response
+
+    def _call_with_backoff(self, call: Callable):
+        delay = self.initial_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                return call()
+            except Exception as e:
+                if attempt == self.max_retries or not is_rate_limit_error(e):
+                    raise
+                wait = retry_after_seconds(e) or delay * (1 + random.random())
+                self.log(
+                    f"Rate limited, retrying in {wait:.1f}s "
+                    f"({attempt + 1}/{self.max_retries})"
+                )
+                time.sleep(wait)
+                delay *= 2
 
     def log(self, message):
         """Write a message to the log file and also print it to console."""
-        print(message)
-        with open(self.log_file, "a", encoding="utf-8") as f:
-            f.write(f"{message}\n")
+        with self._log_lock:
+            print(message)
+            self._log_handle.write(f"{message}\n")
+
+    def flush_log(self):
+        with self._log_lock:
+            self._log_handle.flush()
+
+    def close(self):
+        """Flush and close the log and the response cache."""
+        with self._log_lock:
+            self._log_handle.close()
+        self.cache.close()
 
     def extract_key_concepts(
-        self, title: str, author: str, highlights: List[str]
+        self, title: str, author: str, highlights: List[str], offset: int = 0
     ) -> List[Dict[str, str]]:
-        """Extract key concepts from the book highlights with source references."""
+        """Extract key concepts from the book highlights with source references.
+
+        `offset` is the index of the first highlight in the whole book.
+        """
         highlights_text = "\n\n".join(
-            [f"[{i+1}] {h}" for i, h in enumerate(highlights)]
+            [f"[{i+1}] {h}" for i, h in enumerate(highlights, start=offset)]
         )
         prompt = f"""
         Analyze these highlights from the book "{title}" by {author}. 
@@ -99,8 +307,11 @@ class KindleToObsidianAgent:
         Return your answer as a list of concepts with descriptions including highlight references.
         """
 
-        response = self.agent.run(prompt)
+        response = self.run_agent(prompt, stage="concepts")
+        return self.parse_concepts(response)
 
+    def parse_concepts(self, response: str) -> List[Dict[str, str]]:
+        """Parse the model response into structured concepts."""
         # Parse response into structured concepts
         concepts = []
         # Enhanced pattern to capture references
@@ -125,46 +336,145 @@ class KindleToObsidianAgent:
 
         return concepts
 
+    def extract_key_concepts_map_reduce(
+        self, title: str, author: str, highlights: List[str]
+    ) -> List[Dict[str, str]]:
+        """Extract concepts from each chunk of highlights concurrently and merge them."""
+        chunks = chunk_highlights(highlights, self.chunk_tokens)
+        if len(chunks) == 1:
+            return self.extract_key_concepts(title, author, highlights)
+
+        self.log(f"Extracting concepts from {len(chunks)} chunks")
+        with ThreadPoolExecutor(max_workers=self.map_workers) as pool:
+            partial_concepts = pool.map(
+                lambda chunk: self.extract_key_concepts(
+                    title, author, chunk[1], offset=chunk[0]
+                ),
+                chunks,
+            )
+            concepts = [c for chunk_concepts in partial_concepts for c in chunk_concepts]
+        return self.merge_concepts(title, author, concepts)
+
+    def merge_concepts(
+        self, title: str, author: str, concepts: List[Dict[str, str]]
+    ) -> List[Dict[str, str]]:
+        """Merge the concepts extracted from separate chunks into 5-10 concepts."""
+        concepts_text = "\n".join(
+            [
+                f"- {c['name']}: {c['description']} "
+                f"(ref: {', '.join(f'[{ref + 1}]' for ref in c['references'])})"
+                if c["references"]
+                else f"- {c['name']}: {c['description']}"
+                for c in concepts
+            ]
+        )
+        prompt = f"""
+        These concepts were extracted from separate parts of the highlights from
+        the book "{title}" by {author}. Merge them into the 5-10 most important key
+        concepts, combining duplicates and closely related ones.
+
+        IMPORTANT: Keep the highlight references of every merged concept, exactly as
+        they are numbered below. Use the format (ref: [1], [3], [5]) at the end of
+        each description.
+
+        CONCEPTS:
+        {concepts_text}
+
+        Return your answer as a list of concepts with descriptions including highlight references.
+        """
+
+        return self.parse_concepts(self.run_model(prompt, stage="concepts_merge"))
+
+    def select_concepts_to_enrich(self, concepts: List[Dict[str, str]]) -> List[int]:
+        """Decide in a single model call which concepts need more information.
+
+        Returns the indices of the selected concepts.
+        """
+        if not concepts:
+            return []
+        concepts_text = "\n".join(
+            [
+                f"{i + 1}. {c['name']}: {c['description']}"
+                for i, c in enumerate(concepts)
+            ]
+        )
+        prompt = f"""
+        For each of the concepts below, decide if we need additional information
+        from the web to describe it well.
+
+        CONCEPTS:
+        {concepts_text}
+
+        Return ONLY a JSON list with the numbers of the concepts that need
+        additional information, e.g. [1, 4]. Return [] if none of them do.
+        """
+
+        response = self.run_model(prompt, stage="enrich_decision")
+        match = re.search(r"\[[0-9,\s]*\]", response)
+        if not match:
+            self.log(f"Could not parse the enrichment decision: {response}")
+            return []
+        # not json.loads, the model may return e.g. [1, 3,]
+        selected = {int(number) - 1 for number in re.findall(r"\d+", match.group(0))}
+        return sorted(i for i in selected if 0 <= i < len(concepts))
+
+    def enrich_concept(self, concept: Dict[str, str]) -> str:
+        """Search the web for the concept and return an improved description."""
+        # Ask the agent to search for and integrate information
+        integration_prompt = f"""
+        I need more information about this concept:
+        Name: {concept['name']}
+        Description: {concept['description']}
+        
+        Please search for more information about this concept using the search tool,
+        and then create an improved description that integrates any new information 
+        while maintaining relevance to the original concept.
+        """
+
+        return self.run_agent(integration_prompt, stage="enrich").strip()
+
     def enrich_concepts(self, concepts: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        """Enrich concepts with additional information from the web if needed."""
-        enriched_concepts = []
-
-        for concept in concepts:
-            prompt = f"""
-            Do we need additional information about the concept: "{concept['name']}" 
-            with description: "{concept['description']}"?
-            
-            Answer with YES or NO first, then explain why.
-            """
-
-            decision = self.agent.run(prompt)
-
-            if "YES" in decision.upper():
-                # Ask the agent to search for and integrate information
-                integration_prompt = f"""
-                I need more information about this concept:
-                Name: {concept['name']}
-                Description: {concept['description']}
-                
-                Please search for more information about this concept using the search tool,
-                and then create an improved description that integrates any new information 
-                while maintaining relevance to the original concept.
-                """
-
-                improved_description = self.agent.run(integration_prompt)
-                concept["description"] = improved_description.strip()
-
-            enriched_concepts.append(concept)
-
-        return enriched_concepts
+        """Enrich concepts with additional information from the web if needed.
+
+        The concepts to enrich are chosen in one batched call, then enriched
+        concurrently.
+        """
+        selected = self.select_concepts_to_enrich(concepts)
+        self.log(f"Enriching {len(selected)} of {len(concepts)} concepts")
+        if not selected:
+            return concepts
+
+        with ThreadPoolExecutor(max_workers=self.enrich_workers) as pool:
+            descriptions = pool.map(
+                self.enrich_concept, [concepts[i] for i in selected]
+            )
+            for i, description in zip(selected, descriptions):
+                concepts[i]["description"] = description
+
+        return concepts
 
     def generate_summary(
-        self, title: str, author: str, highlights: List[str], max_highlights: int = 10
+        self,
+        title: str,
+        author: str,
+        highlights: List[str],
+        max_highlights: int = 10,
+        start: int = 0,
+        previous_summaries: Optional[List[str]] = None,
     ) -> str:
-        previous_summaries = []
-        for highlight_group in batched(highlights, max_highlights):
+        """Summarize the highlights in batches, each batch refining the previous
+        summaries. Passing `start` and `previous_summaries` continues an earlier
+        summary with the highlights from index `start` on."""
+        previous_summaries = list(previous_summaries or [])
+        for i, highlight_group in enumerate(
+            batched(highlights[start:], max_highlights)
+        ):
             summary = self._generate_summary_prompt(
-                title, author, highlight_group, previous_summaries
+                title,
+                author,
+                highlight_group,
+                previous_summaries,
+                offset=start + i * max_highlights,
             )
             previous_summaries.append(summary)
 
@@ -176,8 +486,13 @@ class KindleToObsidianAgent:
         author: str,
         highlights: List[str],
         previous_summaries: List[str],
+        offset: int = 0,
     ) -> str:
-        """Generate a summary of the highlights with citations."""
+        """Generate a summary of the highlights with citations.
+
+        `offset` is the index of the first highlight in the whole book, so that the
+        highlight numbers match the note.
+        """
         if previous_summaries:
             previous_summaries_text = "\n\n".join(previous_summaries)
         else:
@@ -199,31 +514,61 @@ class KindleToObsidianAgent:
         {previous_summaries_text}
         
         Highlights:
-        {" ".join([f"[{i+1}] {h}" for i, h in enumerate(highlights)])}
+        {" ".join([f"[{i+1}] {h}" for i, h in enumerate(highlights, start=offset)])}
 
         Return only the summarized and organized pieces of knowledge with citations, no other text.
         """
-        return self.agent.run(prompt)
+        return self.run_agent(prompt, stage="summary")
+
+    def generate_summary_map_reduce(
+        self, title: str, author: str, highlights: List[str]
+    ) -> str:
+        """Summarize each chunk of highlights concurrently and merge the summaries."""
+        chunks = chunk_highlights(highlights, self.chunk_tokens)
+        self.log(f"Summarizing {len(chunks)} chunks")
+        with ThreadPoolExecutor(max_workers=self.map_workers) as pool:
+            summaries = list(
+                pool.map(
+                    lambda chunk: self._generate_summary_prompt(
+                        title, author, chunk[1], [], offset=chunk[0]
+                    ),
+                    chunks,
+                )
+            )
+            while len(summaries) > 1:
+                summaries = list(
+                    pool.map(
+                        lambda group: self.merge_summaries(title, author, list(group)),
+                        batched(summaries, self.reduce_fan_in),
+                    )
+                )
+        return summaries[0]
+
+    def merge_summaries(self, title: str, author: str, summaries: List[str]) -> str:
+        """Merge partial summaries of consecutive highlight chunks into one."""
+        if len(summaries) == 1:
+            return summaries[0]
+        summaries_text = "\n\n".join(
+            [f"Part {i + 1}:\n{summary}" for i, summary in enumerate(summaries)]
+        )
+        prompt = f"""
+        These are summaries of consecutive parts of the highlights from the book
+        "{title}" by {author}. Merge them into one organized summary.
+        Do not loose the details or precision of the parts. Avoid generalities and
+        generic statements.
+
+        IMPORTANT: Keep the highlight references exactly as they are numbered in the
+        parts. Use the format (ref: [1], [3], [5]) at the end of each paragraph.
+
+        {summaries_text}
+
+        Return only the merged summary with citations, no other text.
+        """
+        return self.run_model(prompt, stage="summary_merge")
 
     def parse_summary_references(self, summary: str) -> Dict[str, List[int]]:
         """Extract references from the summary text."""
-        paragraphs = {}
-        # Split by paragraphs and process each one
-        for i, para in enumerate(summary.split("\n\n")):
-            # Check if the paragraph has references
-            ref_match = re.search(r"\(ref: ((?:\[[0-9]+\](?:, )?)+)\)", para)
-            if ref_match:
-                # Extract the paragraph content without the reference part
-                content = para.replace(ref_match.group(0), "").strip()
-                # Extract reference numbers
-                ref_numbers = re.findall(r"\[([0-9]+)\]", ref_match.group(1))
-                # Convert to zero-based indices (for array access)
-                references = [int(num) - 1 for num in ref_numbers]
-                paragraphs[f"para_{i}"] = {"content": content, "references": references}
-            else:
-                paragraphs[f"para_{i}"] = {"content": para, "references": []}
-
-        return paragraphs
+        return parse_summary_references(summary)
 
     def generate_tags(
         self,
@@ -248,7 +593,7 @@ class KindleToObsidianAgent:
         abbreviations when creating tags. Avoid creating generic tags like "history" or "science".
         """
 
-        response = self.agent.run(prompt)
+        response = self.run_agent(prompt, stage="tags")
 
         # Extract tags from response
         return re.findall(r"#[a-zA-Z0-9_-]+", response)
@@ -263,90 +608,7 @@ class KindleToObsidianAgent:
         tags: List[str],
     ) -> str:
         """Create the content for an Obsidian note with citations."""
-        date = datetime.now().strftime("%Y-%m-%d")
-
-        # Parse the summary to extract references
-        parsed_summary = self.parse_summary_references(summary)
-
-        # Format summary with citations
-        summary_md = []
-        for _, para_data in parsed_summary.items():
-            para_text = para_data["content"]
-
-            # Add references if available
-            if para_data["references"]:
-                # Create links to the highlight section
-                ref_links = []
-                for ref_idx in para_data["references"]:
-                    if 0 <= ref_idx < len(highlights):
-                        # Create a link to the highlight in the format ^highlight-N
-                        ref_links.append(f"[[#^highlight-{ref_idx + 1}]]")
-
-                if ref_links:
-                    para_text += f" (Sources: {', '.join(ref_links)})"
-
-            summary_md.append(para_text)
-
-        summary_md = "\n\n".join(summary_md)
-
-        # Format concepts as markdown + tags with citations
-        concepts_md = []
-        for c in concepts:
-            concept_text = (
-                f"### {c['name']}\n#{'-'.join(c['name'].replace('*', '').replace(",", "").replace(".", "").replace("'", "").lower().split())}"
-                f" \n{c['description']}"
-            )
-
-            # Add references if available
-            if "references" in c and c["references"]:
-                # Create links to the highlight section
-                ref_links = []
-                for ref_idx in c["references"]:
-                    if 0 <= ref_idx < len(highlights):
-                        # Create a link to the highlight in the format ^highlight-N
-                        ref_links.append(f"[[#^highlight-{ref_idx + 1}]]")
-
-                if ref_links:
-                    concept_text += f"\n\nSources: {', '.join(ref_links)}"
-
-            concepts_md.append(concept_text)
-
-        concepts_md = "\n\n".join(concepts_md)
-
-        # Format highlights as markdown with quote blocks and unique IDs for linking
-        highlights_md = []
-        for i, highlight in enumerate(highlights):
-            # Add a unique ID to each highlight for referencing
-            highlights_md.append(f"> {highlight} ^highlight-{i + 1}")
-
-        highlights_md = "\n\n".join(highlights_md)
-
-        # Format tags
-        tags_str = " ".join(tags)
-
-        # Create the note content
-        return f"""---
-title: "{title}"
-author: "{author.replace('by: ', '').replace('By: ', '').replace('By:', '').replace('by:', '').strip()}"
-date: {date}
-tags: {tags_str}
----
-
-# {title}
-*{author}*
-
-## Summary
-
-{summary_md}
-
-## Key Concepts
-
-{concepts_md}
-
-## Highlights
-
-{highlights_md}
-"""
+        return render_obsidian_note(title, author, highlights, summary, concepts, tags)
 
     def save_note(self, title: str, content: str) -> str:
         """Save the note to a file."""
@@ -357,8 +619,7 @@ tags: {tags_str}
         filename = f"{clean_title}.md"
         filepath = os.path.join(self.output_dir, filename)
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content)
+        write_atomic(filepath, content)
 
         return filepath
 
@@ -372,21 +633,15 @@ tags: {tags_str}
             title, author, highlights_tuple, min_highlights
         )
 
-    # @lru_cache(maxsize=None)
-    def _prepare_book_data_impl(
-        self, title: str, author: str, highlights_tuple: tuple, min_highlights: int = 3
+    def _generate_concepts_and_tags(
+        self, title: str, author: str, highlights: List[str]
     ):
-        """Implementation of prepare_book_data that works with hashable types."""
-        # Convert tuple back to list for processing
-        highlights = list(highlights_tuple)
-
-        if not highlights or len(highlights) < min_highlights:
-            return None
-
-        self.log(f"Processing book: {title}")
-
+        """Extract, enrich and tag the key concepts of a book."""
         # Extract key concepts
-        concepts = self.extract_key_concepts(title, author, highlights)
+        if self.map_reduce:
+            concepts = self.extract_key_concepts_map_reduce(title, author, highlights)
+        else:
+            concepts = self.extract_key_concepts(title, author, highlights)
         self.log(f"Extracted concepts: {concepts}")
 
         # Enrich concepts if needed
@@ -396,9 +651,37 @@ tags: {tags_str}
         # Generate tags
         tags = self.generate_tags(title, author, enriched_concepts)
         self.log(f"Generated tags: {tags}")
+        return enriched_concepts, tags
+
+    def _prepare_book_data_impl(
+        self, title: str, author: str, highlights_tuple: tuple, min_highlights: int = 3
+    ):
+        """Implementation of prepare_book_data that works with hashable types."""
+        # Convert tuple back to list for processing
+        highlights = list(highlights_tuple)
+
+        if not highlights or len(highlights) < min_highlights:
+            return None
+
+        self.log(f"Processing book: {title}")
 
-        # Generate summary
-        summary = self.generate_summary(title, author, highlights)
+        summarize = (
+            self.generate_summary_map_reduce if self.map_reduce else self.generate_summary
+        )
+        if self.concurrency > 1:
+            # The summary does not depend on the concepts, run both chains at once
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                summary_future = pool.submit(summarize, title, author, highlights)
+                enriched_concepts, tags = self._generate_concepts_and_tags(
+                    title, author, highlights
+                )
+                summary = summary_future.result()
+        else:
+            enriched_concepts, tags = self._generate_concepts_and_tags(
+                title, author, highlights
+            )
+            # Generate summary
+            summary = summarize(title, author, highlights)
         self.log(f"Generated summary of {len(summary.split())} words")
 
         return {
@@ -410,39 +693,137 @@ tags: {tags_str}
             "tags": tags,
         }
 
-    def process_all_books(self, min_highlights: int = 3):
-        """Process all books in the highlights file and create Obsidian notes."""
-        for title, book_data in self.book_data.items():
-            # Add a separator for each book in the log
-            separator = f"\n\n#### {title} ####\n"
-            self.log(separator)
+    def _load_manifest(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.manifest_file):
+            return {}
+        with open(self.manifest_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _update_manifest(self, title: str, prepared_data: Dict, filepath: str):
+        """Record the fingerprint and the generated sections of a book."""
+        with self._manifest_lock:
+            self.manifest[title] = {
+                "fingerprint": highlights_fingerprint(prepared_data["highlights"]),
+                "highlight_count": len(prepared_data["highlights"]),
+                "note": filepath,
+                "summary": prepared_data["summary"],
+                "concepts": prepared_data["concepts"],
+                "tags": prepared_data["tags"],
+            }
+            write_atomic(
+                self.manifest_file,
+                json.dumps(self.manifest, indent=4, ensure_ascii=False),
+            )
 
-            highlights = book_data["highlights"]
-            author = book_data.get("author", "Unknown")
+    def extend_book_data(
+        self, title: str, author: str, highlights: List[str], entry: Dict
+    ):
+        """Update a previously processed book with appended highlights.
 
+        The concepts and tags are kept, since the existing highlight numbers do not
+        change, and the summary is continued with the new highlights only.
+        """
+        start = entry["highlight_count"]
+        self.log(f"Extending book: {title} with {len(highlights) - start} highlights")
+        summary = self.generate_summary(
+            title,
+            author,
+            highlights,
+            start=start,
+            previous_summaries=[entry["summary"]],
+        )
+        self.log(f"Generated summary of {len(summary.split())} words")
+        return {
+            "title": title,
+            "author": author,
+            "highlights": highlights,
+            "summary": summary,
+            "concepts": entry["concepts"],
+            "tags": entry["tags"],
+        }
+
+    def process_book(self, title: str, book_data: Dict, min_highlights: int = 3):
+        """Process a single book and create its Obsidian note."""
+        # Add a separator for each book in the log
+        separator = f"\n\n#### {title} ####\n"
+        self.log(separator)
+
+        highlights = book_data["highlights"]
+        author = book_data.get("author", "Unknown")
+
+        entry = self.manifest.get(title)
+        if entry and not os.path.exists(entry["note"]):
+            # the note was removed, regenerate it
+            entry = None
+        if entry and entry["fingerprint"] == highlights_fingerprint(highlights):
+            self.log(f"Highlights unchanged, skipping book: {title}")
+            return
+
+        start = entry["highlight_count"] if entry else 0
+        if entry and start < len(highlights) and entry[
+            "fingerprint"
+        ] == highlights_fingerprint(highlights[:start]):
+            # Only new highlights were appended
+            prepared_data = self.extend_book_data(title, author, highlights, entry)
+        else:
             # This part can be cached
             prepared_data = self.prepare_book_data(
                 title, author, highlights, min_highlights
             )
 
-            if prepared_data:
-                # Create note (this part uses the cached data)
-                note_content = self.create_obsidian_note(
-                    prepared_data["title"],
-                    prepared_data["author"],
-                    prepared_data["highlights"],
-                    summary=prepared_data["summary"],
-                    concepts=prepared_data["concepts"],
-                    tags=prepared_data["tags"],
-                )
+        if prepared_data:
+            # Create note (this part uses the cached data)
+            note_content = self.create_obsidian_note(
+                prepared_data["title"],
+                prepared_data["author"],
+                prepared_data["highlights"],
+                summary=prepared_data["summary"],
+                concepts=prepared_data["concepts"],
+                tags=prepared_data["tags"],
+            )
 
-                # Save note
-                filepath = self.save_note(title, note_content)
-                self.log(f"Created note at: {filepath}")
-            else:
-                self.log(f"No highlights found for book: {title}")
+            # Save note
+            filepath = self.save_note(title, note_content)
+            self.log(f"Created note at: {filepath}")
+            if self.incremental:
+                self._update_manifest(title, prepared_data, filepath)
+        else:
+            self.log(f"No highlights found for book: {title}")
 
-            self.log("\n" + "-" * 80)  # Add a line after each book's processing
+        self.log("\n" + "-" * 80)  # Add a line after each book's processing
+        self.flush_log()
+
+    def process_all_books(self, min_highlights: int = 3):
+        """Process all books in the highlights file and create Obsidian notes.
+
+        Up to `concurrency` books are processed at the same time.
+        """
+        try:
+            self._process_books(min_highlights)
+        finally:
+            self.log(f"Response cache: {self.cache.stats()}")
+            self.flush_log()
+
+    def _process_books(self, min_highlights: int):
+        # A failing book is logged and skipped, whatever the concurrency
+        if self.concurrency == 1:
+            for title, book_data in self.book_data.items():
+                try:
+                    self.process_book(title, book_data, min_highlights)
+                except Exception as e:
+                    self.log(f"Failed to process book: {title} - {e}")
+            return
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {
+                pool.submit(self.process_book, title, book_data, min_highlights): title
+                for title, book_data in self.book_data.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.log(f"Failed to process book: {futures[future]} - {e}")
 
 
 def main():
@@ -453,7 +834,7 @@ def main():
         "--highlights",
         type=str,
         required=True,
-        help="Path to Kindle highlights JSON file",
+        help="Path to Kindle highlights file (.jsonl or .json)",
     )
     parser.add_argument(
         "--output",
@@ -477,22 +858,93 @@ def main():
         action="store_true",
         help="Run in interactive mode to select specific books",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of books processed at the same time",
+    )
+    parser.add_argument(
+        "--api-base",
+        type=str,
+        help="Base URL of an OpenAI-compatible API (e.g. a local model server)",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        help="Path to the model response cache "
+        "(defaults to '.response_cache.sqlite' in output directory)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=100,
+        help="Maximum size of the response cache in MB",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore the cached model responses and query the model again",
+    )
+    parser.add_argument(
+        "--enrich-workers",
+        type=int,
+        default=4,
+        help="Number of concepts enriched with web search at the same time",
+    )
+    parser.add_argument(
+        "--map-reduce",
+        action="store_true",
+        help="Process the highlights of large books in concurrent chunks",
+    )
+    parser.add_argument(
+        "--chunk-tokens",
+        type=int,
+        default=3000,
+        help="Approximate number of highlight tokens per chunk in map-reduce mode",
+    )
+    parser.add_argument(
+        "--map-workers",
+        type=int,
+        default=4,
+        help="Number of chunks of a book processed at the same time in map-reduce mode",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip books whose highlights did not change since the last run",
+    )
 
     args = parser.parse_args()
 
     # Load highlights file
-    with open(args.highlights, "r", encoding="utf-8") as f:
-        book_data = json.load(f)
+    book_data = open_highlights(args.highlights)
 
     # Create agent instance
     agent = KindleToObsidianAgent(
-        args.highlights, args.output, args.model, log_file=args.log
+        args.highlights,
+        args.output,
+        args.model,
+        log_file=args.log,
+        api_base=args.api_base,
+        concurrency=args.concurrency,
+        cache_file=args.cache,
+        cache_max_mb=args.cache_size,
+        refresh=args.refresh,
+        incremental=args.incremental,
+        enrich_workers=args.enrich_workers,
+        map_reduce=args.map_reduce,
+        chunk_tokens=args.chunk_tokens,
+        map_workers=args.map_workers,
     )
 
-    if args.interactive:
-        process_books_interactively(agent, book_data)
-    else:
-        agent.process_all_books()
+    try:
+        if args.interactive:
+            process_books_interactively(agent, book_data)
+        else:
+            agent.process_all_books()
+    finally:
+        agent.close()
 
 
 def process_books_interactively(agent, book_data):
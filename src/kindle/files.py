@@ -0,0 +1,31 @@
+"""File helpers shared by the Kindle scraper and agent."""
+import os
+import stat
+import tempfile
+
+# read once, os.umask can only be read by setting it, which races with threads
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+def write_atomic(filepath: str, content: str):
+    """Write through a temporary file in the same directory and rename it, so that
+    a crash never leaves a half-written file behind.
+
+    The file keeps its permissions, a new one gets the default ones (the umask),
+    not the owner-only ones of the temporary file.
+    """
+    directory = os.path.dirname(filepath) or "."
+    try:
+        mode = stat.S_IMODE(os.stat(filepath).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_umask
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,229 @@
+"""Kindle highlights storage.
+
+Highlights are stored as JSON lines, one book ({"title", "author", "highlights"})
+per line, so that the scraper can append books as it goes and the agent can read
+them lazily. A sidecar offset index (`<file>.idx`) maps titles to line offsets, so
+a single book can be read without parsing the whole file. The older single JSON
+object format ({title: book}) is still supported for reading.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from files import write_atomic
+
+title_prefix = re.compile(rb'^\{\s*"title"\s*:\s*')
+_decoder = json.JSONDecoder()
+# bytes hashed at both ends of the indexed part, to tell a rewritten file from
+# an appended one
+EDGE_BYTES = 4096
+
+
+def highlights_fingerprint(highlights: List[str]) -> str:
+    """Fingerprint of a book's highlight list, used to detect changed books."""
+    return hashlib.sha256(
+        json.dumps(highlights, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+def append_book(highlights_file: str, book_info: Dict):
+    """Append one book ({"title", "author", "highlights"}) as a JSON line."""
+    book_info = {"title": book_info["title"], **book_info}
+    with open(highlights_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(book_info, ensure_ascii=False) + "\n")
+        f.flush()
+
+
+def iter_books(highlights_file: str) -> Iterator[Dict]:
+    """Iterate over the books of a JSON lines highlights file."""
+    with open(highlights_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # a partially written last line, e.g. after a crash
+                continue
+
+
+def _line_title(line: bytes) -> Optional[str]:
+    """Read the title of a book line, without decoding the highlights if possible."""
+    match = title_prefix.match(line)
+    if match:
+        try:
+            title, _ = _decoder.raw_decode(line.decode("utf-8"), match.end())
+            if isinstance(title, str):
+                return title
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            pass
+    try:
+        return json.loads(line)["title"]
+    except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+        return None
+
+
+class HighlightsFile(Mapping):
+    """Read-only {title: book_info} view of a JSON lines highlights file.
+
+    Only the offset index is kept in memory; books are parsed when accessed.
+    The index is stored next to the file and extended with the lines appended
+    since it was written. It is rebuilt when the file was replaced or rewritten,
+    which is told from its inode, its modification time and a hash of the start
+    and the end of the indexed part.
+    """
+
+    def __init__(self, highlights_file: str):
+        self.highlights_file = highlights_file
+        self.index_file = f"{highlights_file}.idx"
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._indexed_size = 0
+        self._load_index()
+        self._update_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if self._is_stale(index):
+            return
+        self._indexed_size = index["size"]
+        self._offsets = {
+            title: tuple(position) for title, position in index["offsets"].items()
+        }
+
+    def _file_stat(self, indexed_size: int) -> Dict[str, Union[int, str]]:
+        """Identity of the file whose first `indexed_size` bytes are indexed."""
+        stat = os.stat(self.highlights_file)
+        digest = hashlib.sha256()
+        if stat.st_size >= indexed_size:
+            with open(self.highlights_file, "rb") as f:
+                digest.update(f.read(min(indexed_size, EDGE_BYTES)))
+                f.seek(max(indexed_size - EDGE_BYTES, 0))
+                digest.update(f.read(indexed_size - f.tell()))
+        return {
+            "inode": stat.st_ino,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "edges": digest.hexdigest(),
+        }
+
+    def _is_stale(self, index: Dict) -> bool:
+        """Check if the file was replaced or rewritten since the index was saved.
+
+        Appending changes the modification time, so the time is only compared
+        when the size did not change.
+        """
+        saved = index.get("file")
+        if not saved:
+            return True
+        current = self._file_stat(index["size"])
+        if current["size"] < index["size"]:
+            return True
+        if (saved["inode"], saved["edges"]) != (current["inode"], current["edges"]):
+            return True
+        return saved["size"] == current["size"] and saved["mtime"] != current["mtime"]
+
+    def _update_index(self):
+        size = os.path.getsize(self.highlights_file)
+        if size == self._indexed_size:
+            return
+        with open(self.highlights_file, "rb") as f:
+            f.seek(self._indexed_size)
+            offset = self._indexed_size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # partially written line, index it once it is complete
+                    break
+                title = _line_title(line.strip())
+                if title is not None:
+                    self._offsets[title] = (offset, len(line))
+                offset += len(line)
+        self._indexed_size = offset
+        self._save_index()
+
+    def _save_index(self):
+        try:
+            write_atomic(
+                self.index_file,
+                json.dumps(
+                    {
+                        "size": self._indexed_size,
+                        "file": self._file_stat(self._indexed_size),
+                        "offsets": self._offsets,
+                    }
+                ),
+            )
+        except OSError:
+            # the index is only an optimisation, e.g. for read-only directories
+            pass
+
+    def __getitem__(self, title: str) -> Dict:
+        offset, length = self._offsets[title]
+        with open(self.highlights_file, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __contains__(self, title) -> bool:
+        return title in self._offsets
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        """Stream the books in file order, parsing one at a time."""
+        with open(self.highlights_file, "rb") as f:
+            for title, (offset, length) in sorted(
+                self._offsets.items(), key=lambda item: item[1][0]
+            ):
+                f.seek(offset)
+                yield title, json.loads(f.read(length))
+
+    def values(self) -> Iterator[Dict]:
+        return (book for _, book in self.items())
+
+
+def open_highlights(highlights_file: str) -> Union[HighlightsFile, Dict[str, Dict]]:
+    """Open a highlights file as a {title: book_info} mapping.
+
+    JSON lines files are read lazily, older JSON files are loaded whole.
+    """
+    if highlights_file.endswith(".jsonl"):
+        return HighlightsFile(highlights_file)
+    with open(highlights_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_highlights(highlights_file: str) -> Dict[str, Dict]:
+    """Load a highlights file (either format) as a {title: book_info} dict."""
+    return dict(open_highlights(highlights_file).items())
+
+
+def convert_to_jsonl(json_file: str, jsonl_file: str):
+    """Convert an older JSON highlights file to the JSON lines format."""
+    with open(json_file, "r", encoding="utf-8") as f:
+        book_data = json.load(f)
+    for title, book_info in book_data.items():
+        append_book(jsonl_file, {"title": title, **book_info})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert a Kindle highlights JSON file to JSON lines"
+    )
+    parser.add_argument("json_file", type=str, help="Input highlights JSON file")
+    parser.add_argument("jsonl_file", type=str, help="Output JSON lines file")
+    args = parser.parse_args()
+    convert_to_jsonl(args.json_file, args.jsonl_file)
@@ -6,76 +6,69 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
 import argparse
-import time
-import json
-
-parse = argparse.ArgumentParser(
-    description="Extract Kindle highlights from your Amazon account"
-)
-parse.add_argument("--email", type=str, required=True, help="Your Amazon email")
-parse.add_argument("--password", type=str, required=True, help="Your Amazon password")
-parse.add_argument(
-    "--wait-time",
-    type=int,
-    required=False,
-    default=3,
-    help="Time to wait for the highlights to load",
-)
+import os
+from typing import Dict, Iterator, Set, Tuple
+
+from highlights import HighlightsFile, append_book
+
 url = "https://read.amazon.com/notebook"
 
-if __name__ == "__main__":
-    args = parse.parse_args()
+BOOK_CLASS = "kp-notebook-library-each-book"
+ANNOTATIONS_ID = "kp-notebook-annotations"
+BOOK_TITLE_CLASS = "kp-notebook-metadata"
+HIGHLIGHT_ID = "highlight"
+# shown in the annotation pane of a book without highlights
+NO_HIGHLIGHTS_ID = "kp-notebook-annotations-empty"
+
+
+def create_driver() -> webdriver.Chrome:
     chrome_options = Options()
     chrome_options.add_argument("--incognito")
-    driver = webdriver.Chrome(options=chrome_options)
+    return webdriver.Chrome(options=chrome_options)
+
+
+def login(driver, email: str, password: str):
+    """Log into the Amazon account, raises on failure."""
     driver.get(url)
-    
+
     # Wait for email field to be present and interact with it
+    print("Waiting for login page to load...")
+    email_el = WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.ID, "ap_email"))
+    )
+    email_el.clear()
+    email_el.send_keys(email)
+    print("Email entered")
+
+    # Look for password field
     try:
-        print("Waiting for login page to load...")
-        email_el = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "ap_email"))
-        )
-        email_el.clear()
-        email_el.send_keys(args.email)
-        print("Email entered")
-        
-        # Look for password field
-        try:
-            # Try to find the next button if it exists (Amazon sometimes has a two-step login)
-            next_button = WebDriverWait(driver, 3).until(
-                EC.presence_of_element_located((By.ID, "continue"))
-            )
-            next_button.click()
-            print("Clicked continue button")
-        except (TimeoutException, NoSuchElementException):
-            print("No continue button found, assuming single-page login")
-        
-        # Now wait for password field
-        pass_el = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "ap_password"))
+        # Try to find the next button if it exists (Amazon sometimes has a two-step login)
+        next_button = WebDriverWait(driver, 3).until(
+            EC.presence_of_element_located((By.ID, "continue"))
         )
-        pass_el.clear()
-        pass_el.send_keys(args.password)
-        print("Password entered")
-        
-        # Click sign in button
-        sigin_el = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "signInSubmit"))
-        )
-        sigin_el.click()
-        print("Sign in button clicked")
-        
-    except Exception as e:
-        print(f"Error during login process: {e}")
-        driver.save_screenshot("login_error.png")
-        print(f"Current URL: {driver.current_url}")
-        print("Page source snippet:")
-        print(driver.page_source[:500] + "...")
-        driver.quit()
-        exit(1)
-    
-    # Rest of the login handling
+        next_button.click()
+        print("Clicked continue button")
+    except (TimeoutException, NoSuchElementException):
+        print("No continue button found, assuming single-page login")
+
+    # Now wait for password field
+    pass_el = WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.ID, "ap_password"))
+    )
+    pass_el.clear()
+    pass_el.send_keys(password)
+    print("Password entered")
+
+    # Click sign in button
+    sigin_el = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.ID, "signInSubmit"))
+    )
+    sigin_el.click()
+    print("Sign in button clicked")
+
+
+def handle_security_challenge(driver):
+    """Ask for the one time password if Amazon shows a security challenge."""
     try:
         sec_challenge = WebDriverWait(driver, 5).until(
             EC.presence_of_element_located((By.CLASS_NAME, "single-input-box-otp"))
@@ -89,32 +82,157 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Error during security challenge: {e}")
 
-    # Continue with the rest of the code
-    book_data = {}
+
+def wait_for_library(driver, timeout: float = 30):
+    """Wait until the book list of the notebook page is loaded."""
     print("Waiting for highlights page to load...")
-    time.sleep(5)  # Give some time for the highlights page to load
-    
-    for book in driver.find_elements(By.CLASS_NAME, "kp-notebook-library-each-book"):
-        time.sleep(0.1)
-        print("Extracting highlights for: " + book.text.split("\n")[0])
-        book_title, book_author = book.text.split("\n")
-        book_data[book_title] = []
-        book_info = {
-            "title": book_title,
-            "author": book_author,
-            "highlights": [],
-        }
-        book.click()
-        # needs some sleep in order to load the highlights
-        time.sleep(args.wait_time)
+    WebDriverWait(driver, timeout).until(
+        EC.presence_of_element_located((By.CLASS_NAME, BOOK_CLASS))
+    )
+
+
+def parse_book_entry(text: str) -> Tuple[str, str]:
+    """Split the library entry text into title and author."""
+    book_title, book_author = text.split("\n")[:2]
+    return book_title, book_author
+
+
+def annotations_loaded(book_title: str, previous_pane=None):
+    """Wait condition: the annotation pane was replaced, shows the given book
+    and its highlights (or the marker of a book without any) are in.
+
+    Kindle swaps the title in before the highlight list, so the title alone
+    does not tell that the highlights are loaded.
+    """
+    replaced = EC.staleness_of(previous_pane) if previous_pane else None
+
+    def condition(driver):
+        if replaced and not replaced(driver):
+            return False
         try:
-            for h in driver.find_elements(By.ID, "highlight"):
-                book_info["highlights"].append(h.text)
+            pane = driver.find_element(By.ID, ANNOTATIONS_ID)
+            title = pane.find_element(By.CLASS_NAME, BOOK_TITLE_CLASS)
+        except NoSuchElementException:
+            return False
+        if title.text.strip() != book_title.strip():
+            return False
+        return bool(
+            pane.find_elements(By.ID, HIGHLIGHT_ID)
+            or pane.find_elements(By.ID, NO_HIGHLIGHTS_ID)
+        )
+
+    return condition
+
+
+def extract_book_highlights(driver, book, timeout: float = 10) -> Dict:
+    """Open a book in the library pane and collect its highlights.
+
+    Waits until the annotation pane of the clicked book replaced the previous one
+    and its highlights are loaded, instead of sleeping for a fixed time.
+    Raises TimeoutException if they never are.
+    """
+    book_title, book_author = parse_book_entry(book.text)
+    panes = driver.find_elements(By.ID, ANNOTATIONS_ID)
+    book.click()
+    WebDriverWait(driver, timeout).until(
+        annotations_loaded(book_title, panes[0] if panes else None)
+    )
+    pane = driver.find_element(By.ID, ANNOTATIONS_ID)
+    return {
+        "title": book_title,
+        "author": book_author,
+        "highlights": [h.text for h in pane.find_elements(By.ID, HIGHLIGHT_ID)],
+    }
+
+
+def completed_titles(output_file: str) -> Set[str]:
+    """Titles already saved in the output file, used to resume a scrape."""
+    if not os.path.exists(output_file):
+        return set()
+    return set(HighlightsFile(output_file))
+
+
+def scrape_highlights(
+    driver, output_file: str, resume: bool = True, timeout: float = 10
+) -> Iterator[Dict]:
+    """Scrape the highlights of every book in the library.
+
+    Every book is appended to the JSON lines `output_file` as soon as it is done.
+    With `resume`, the books already in the file are skipped.
+    """
+    done = completed_titles(output_file) if resume else set()
+    if not resume:
+        for path in (output_file, f"{output_file}.idx"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    for book in driver.find_elements(By.CLASS_NAME, BOOK_CLASS):
+        book_title, _ = parse_book_entry(book.text)
+        if book_title in done:
+            print("Already extracted, skipping: " + book_title)
+            continue
+        print("Extracting highlights for: " + book_title)
+        try:
+            book_info = extract_book_highlights(driver, book, timeout=timeout)
         except Exception as e:
             print(f"could not extract highlights for: {book_title} - {e}")
-        book_data[book_title] = book_info
-    json.dump(
-        book_data, open("kindle_highlights.json", "w"), indent=4, ensure_ascii=False
+            continue
+        append_book(output_file, book_info)
+        yield book_info
+
+
+def main():
+    parse = argparse.ArgumentParser(
+        description="Extract Kindle highlights from your Amazon account"
+    )
+    parse.add_argument("--email", type=str, required=True, help="Your Amazon email")
+    parse.add_argument(
+        "--password", type=str, required=True, help="Your Amazon password"
+    )
+    parse.add_argument(
+        "--wait-time",
+        type=int,
+        required=False,
+        default=10,
+        help="Maximum time to wait for the highlights of a book to load",
+    )
+    parse.add_argument(
+        "--output",
+        type=str,
+        default="kindle_highlights.jsonl",
+        help="Output JSON lines file, one book per line",
+    )
+    parse.add_argument(
+        "--restart",
+        action="store_true",
+        help="Start from scratch instead of resuming from the last completed book",
     )
+    args = parse.parse_args()
+
+    driver = create_driver()
+    try:
+        login(driver, args.email, args.password)
+    except Exception as e:
+        print(f"Error during login process: {e}")
+        driver.save_screenshot("login_error.png")
+        print(f"Current URL: {driver.current_url}")
+        print("Page source snippet:")
+        print(driver.page_source[:500] + "...")
+        driver.quit()
+        exit(1)
 
-    driver.quit()
+    # Rest of the login handling
+    handle_security_challenge(driver)
+
+    try:
+        wait_for_library(driver)
+        for _ in scrape_highlights(
+            driver, args.output, resume=not args.restart, timeout=args.wait_time
+        ):
+            pass
+    finally:
+        driver.quit()
+
+
+if __name__ == "__main__":
+    main()
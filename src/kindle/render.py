@@ -0,0 +1,107 @@
+"""Obsidian note rendering for the Kindle agent."""
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from highlights import highlights_fingerprint
+
+summary_ref_pattern = re.compile(r"\(ref: ((?:\[[0-9]+\](?:, )?)+)\)")
+ref_number_pattern = re.compile(r"\[([0-9]+)\]")
+concept_tag_strip = re.compile(r"[*,.']")
+author_prefix = re.compile(r"[bB]y: ?")
+
+
+def parse_summary_references(summary: str) -> Dict[str, Dict]:
+    """Extract references from the summary text."""
+    paragraphs = {}
+    # Split by paragraphs and process each one
+    for i, para in enumerate(summary.split("\n\n")):
+        # Check if the paragraph has references
+        ref_match = summary_ref_pattern.search(para)
+        if ref_match:
+            # Extract the paragraph content without the reference part
+            content = para.replace(ref_match.group(0), "").strip()
+            # Extract reference numbers
+            ref_numbers = ref_number_pattern.findall(ref_match.group(1))
+            # Convert to zero-based indices (for array access)
+            references = [int(num) - 1 for num in ref_numbers]
+            paragraphs[f"para_{i}"] = {"content": content, "references": references}
+        else:
+            paragraphs[f"para_{i}"] = {"content": para, "references": []}
+
+    return paragraphs
+
+
+def _source_links(references: List[int], n_highlights: int) -> str:
+    # Create a link to the highlight in the format ^highlight-N
+    return ", ".join(
+        f"[[#^highlight-{ref_idx + 1}]]"
+        for ref_idx in references
+        if 0 <= ref_idx < n_highlights
+    )
+
+
+def concept_tag(name: str) -> str:
+    """Obsidian tag of a concept name."""
+    return "#" + "-".join(concept_tag_strip.sub("", name).lower().split())
+
+
+def render_obsidian_note(
+    title: str,
+    author: str,
+    highlights: List[str],
+    summary: str,
+    concepts: List[Dict[str, str]],
+    tags: List[str],
+    date: Optional[str] = None,
+) -> str:
+    """Create the content for an Obsidian note with citations."""
+    date = date or datetime.now().strftime("%Y-%m-%d")
+    n_highlights = len(highlights)
+
+    # Format summary with citations
+    summary_md = []
+    for para_data in parse_summary_references(summary).values():
+        links = _source_links(para_data["references"], n_highlights)
+        if links:
+            summary_md.append(f"{para_data['content']} (Sources: {links})")
+        else:
+            summary_md.append(para_data["content"])
+
+    # Format concepts as markdown + tags with citations
+    concepts_md = []
+    for c in concepts:
+        concept_text = f"### {c['name']}\n{concept_tag(c['name'])} \n{c['description']}"
+        links = _source_links(c.get("references") or [], n_highlights)
+        if links:
+            concept_text = f"{concept_text}\n\nSources: {links}"
+        concepts_md.append(concept_text)
+
+    # Format highlights as markdown with quote blocks and unique IDs for linking
+    highlights_md = [
+        f"> {highlight} ^highlight-{i}" for i, highlight in enumerate(highlights, 1)
+    ]
+
+    # Create the note content
+    return "".join(
+        [
+            "---\n",
+            f'title: "{title}"\n',
+            f'author: "{author_prefix.sub("", author).strip()}"\n',
+            f"date: {date}\n",
+            f"tags: {' '.join(tags)}\n",
+            f"highlights_fingerprint: {highlights_fingerprint(highlights)}\n",
+            "---\n\n",
+            f"# {title}\n",
+            f"*{author}*\n\n",
+            "## Summary\n\n",
+            "\n\n".join(summary_md),
+            "\n\n## Key Concepts\n\n",
+            "\n\n".join(concepts_md),
+            "\n\n## Highlights\n\n",
+            "\n\n".join(highlights_md),
+            "\n",
+        ]
+    )
+
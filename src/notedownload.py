@@ -1,6 +1,5 @@
 import logging
 import os
-import re
 import uuid
 
 from azure.identity import DeviceCodeCredential
@@ -11,8 +10,8 @@ from config import CLIENT_ID
 
 logger = logging.getLogger(__file__)
 
-xml_finder = re.compile("<\?xml version=")
-xml_finito_finder = re.compile("</inkml:ink>")  # this is the ending tag
+xml_start_marker = b"<?xml version="
+xml_end_marker = b"</inkml:ink>"  # this is the ending tag
 
 
 class NoteDownloader:
@@ -33,23 +32,23 @@ class NoteDownloader:
         self.client = GraphClient(credential=credential, scopes=scopes)
         self.target_note_location = target_note_location
 
-    def __locate_xml_part(self, response_content: str):
+    def __locate_xml_part(self, response_content: bytes) -> str:
         """
         OneNote Graph API returns lotta rubbish alongside
         the actual XML response, so let's strip the XML
-        out of the response
+        out of the response. The boundaries are located on the raw
+        bytes and only the XML slice gets decoded.
         """
-        if isinstance(response_content, bytes):
-            # make sure we're working with a string
-            response_content = str(response_content)
-        match_start = xml_finder.search(response_content)
-        match_end = xml_finito_finder.search(response_content)
-        if (not match_start) or (not match_end):
+        if isinstance(response_content, str):
+            response_content = response_content.encode('utf-8')
+        start = response_content.find(xml_start_marker)
+        end = response_content.find(xml_end_marker, max(start, 0))
+        if start == -1 or end == -1:
             raise ValueError(
                 "Could not locate boundaries of the XML in the response!")
-        start = match_start.span()[0]
-        end = match_end.span()[-1]
-        return response_content[start:end]
+        end += len(xml_end_marker)
+        return bytes(memoryview(response_content)[start:end]).decode(
+            'utf-8', errors='replace')
 
     def __iterate_pages(self):
         result = self.client.get('/me/onenote/pages').json()
@@ -93,7 +92,9 @@ class NoteDownloader:
                 note_info['parentSection']['displayName'].replace(" ", "_"))
             os.makedirs(note_path, exist_ok=True)
             # no need to parse the XML, let's download first
-            with open(os.path.join(note_path, f"{note_title}.xml"), 'w') as f:
+            with open(os.path.join(note_path, f"{note_title}.xml"),
+                      'w',
+                      encoding='utf-8') as f:
                 f.write(note)
 
 
@@ -3,13 +3,32 @@ import warnings
 
 import click
 
-from .elastic import (create_es_instance, run_note_upload, run_zotero_upload,
-                      stream_pdfs)
-from .interface.search import basic_search, search_format
-from .interface.term import SearchApp
-
+# the command dependencies (spaCy, Textual, ES clients, models) are
+# imported inside the commands to keep the CLI startup fast
 warnings.filterwarnings(action='ignore')
 
+backend_option = click.option(
+    "--backend",
+    type=click.Choice(["elastic", "sqlite"]),
+    default="elastic",
+    envvar="ONENUTIL_SEARCH_BACKEND",
+    show_default=True,
+    help="Search backend, sqlite needs no running server")
+
+
+def instrumentation_options(fn):
+    """Add the --metrics and --profile options of the upload commands"""
+    fn = click.option(
+        "--metrics",
+        type=click.Path(dir_okay=False),
+        help="Save the stage timings, as JSON for a .json file "
+        "and in the Prometheus text format otherwise")(fn)
+    fn = click.option("--profile",
+                      type=click.Path(dir_okay=False),
+                      help="Run under cProfile and save the stats "
+                      "(pstats format) to this file")(fn)
+    return fn
+
 
 @click.group()
 def cli():
@@ -18,30 +37,157 @@ def cli():
 
 @cli.command(name='start', help="Start search application")
 def start_shell():
+    from .interface.term import SearchApp
     SearchApp.run(log="textual.log")
 
 
 @cli.command(name='search', help='Do a single search')
 @click.argument("phrase", type=str)
-def upload_folder(phrase: os.PathLike):
-    es_instance = create_es_instance()
-    results = basic_search(es_instance, phrase, "notes")
+@click.option("--passages",
+              is_flag=True,
+              help="Search the passages uploaded with `upload --passages`")
+@backend_option
+def upload_folder(phrase: os.PathLike, passages: bool, backend: str):
+    from .interface.backends import get_backend
+    from .interface.search import passage_search, search_format
+    search_backend = get_backend(backend)
+    if passages:
+        if backend != "elastic":
+            raise click.UsageError("--passages needs the elastic backend")
+        results = passage_search(search_backend.es, phrase)
+    else:
+        results = search_backend.search(phrase, "notes")
     search_format(results)
 
 
 @cli.command(name='upload', help='Upload a given folder to ES')
 @click.argument("path", type=click.Path(exists=True))
-def upload_folder(path: os.PathLike):
-    run_note_upload(path, stream_fn=stream_pdfs)
+@click.option("--passages",
+              is_flag=True,
+              help="Index the content as overlapping passages")
+@click.option("--passage-words",
+              default=200,
+              type=int,
+              help="Number of words per passage")
+@click.option("--overlap",
+              default=50,
+              type=int,
+              help="Number of words shared by consecutive passages")
+@click.option("--workers",
+              default=0,
+              type=int,
+              help="Extract in that many worker processes, restarted on "
+              "timeouts and memory overruns (0: in process)")
+@click.option("--timeout",
+              default=300.0,
+              type=float,
+              help="Seconds allowed for the text extraction and for the "
+              "tagging of a PDF, with --workers")
+@click.option("--max-memory",
+              "memory_mb",
+              type=int,
+              help="Memory cap of a worker in MB, with --workers")
+@click.option("--retry-quarantined",
+              is_flag=True,
+              help="Upload only the files quarantined by previous runs")
+@click.option("--duplicates",
+              type=click.Choice(["keep", "skip", "merge"]),
+              default="skip",
+              show_default=True,
+              help="Near-duplicate PDFs: keep them, skip them, or merge "
+              "their path into the first copy (elastic only)")
+@click.option("--duplicate-threshold",
+              type=float,
+              default=0.8,
+              show_default=True,
+              help="Text similarity above which PDFs are near-duplicates")
+@backend_option
+@instrumentation_options
+def upload_folder(path: os.PathLike, passages: bool, passage_words: int,
+                  overlap: int, workers: int, timeout: float, memory_mb: int,
+                  retry_quarantined: bool, duplicates: str,
+                  duplicate_threshold: float, backend: str, metrics: str,
+                  profile: str):
+    from .elastic import run_note_upload, stream_pdfs
+    from .instrument import Instrumentation, profiled
+    if passages and backend != "elastic":
+        raise click.UsageError("--passages needs the elastic backend")
+    if duplicates == "merge" and backend != "elastic":
+        raise click.UsageError("--duplicates merge needs the elastic backend")
+    instrumentation = Instrumentation()
+    with profiled(profile):
+        run_note_upload(path,
+                        stream_fn=stream_pdfs,
+                        passages=passages,
+                        passage_words=passage_words,
+                        overlap=overlap,
+                        backend=backend,
+                        instrumentation=instrumentation,
+                        retry_quarantined=retry_quarantined,
+                        workers=workers,
+                        timeout=timeout,
+                        memory_mb=memory_mb,
+                        duplicates=duplicates,
+                        duplicate_threshold=duplicate_threshold)
+    if metrics:
+        instrumentation.export(metrics)
     print("Upload completed successfully")
 
 
 @cli.command(name='zotero-upload', help='Upload zotero data to ES')
-def upload_zotero():
+@click.option("--full",
+              is_flag=True,
+              default=False,
+              help="Re-upload the whole library instead of the changed items")
+@click.option("--tag-workers",
+              type=int,
+              default=1,
+              help="Number of tag extraction workers, "
+              "each loads its own spaCy pipeline")
+@click.option("--embed-workers",
+              type=int,
+              default=1,
+              help="Number of embedding workers")
+@click.option("--batch-size",
+              type=int,
+              default=16,
+              help="Batch size of the tag and embedding extraction")
+@click.option("--keep-duplicates",
+              is_flag=True,
+              help="Upload the near-duplicate articles too")
+@instrumentation_options
+def upload_zotero(full: bool, tag_workers: int, embed_workers: int,
+                  batch_size: int, keep_duplicates: bool, metrics: str,
+                  profile: str):
     # TODO: check for the environment secrets
-    run_zotero_upload()
+    from .elastic import run_zotero_upload
+    from .instrument import Instrumentation, profiled
+    instrumentation = Instrumentation()
+    with profiled(profile):
+        run_zotero_upload(full_sync=full,
+                          tag_workers=tag_workers,
+                          embed_workers=embed_workers,
+                          batch_size=batch_size,
+                          instrumentation=instrumentation,
+                          skip_duplicates=not keep_duplicates)
+    if metrics:
+        instrumentation.export(metrics)
     print("Upload completed successfully")
 
 
+@cli.command(name='models', help='Load the models and report their cost')
+@click.option("--model",
+              "names",
+              multiple=True,
+              type=click.Choice(["spacy", "embeddings", "ocr"]),
+              default=["spacy", "embeddings"],
+              help="Model to load, can be repeated")
+def load_models(names):
+    from rich.console import Console
+
+    from .extract.models import preload
+    Console().print(preload(names))
+
+
 if __name__ == "__main__":
     cli()
@@ -1,21 +1,34 @@
 import glob
+import hashlib
 import os
-import re
-import string
-from typing import Callable, Dict, Iterable
+from collections import deque
+from functools import lru_cache
+from typing import (TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable,
+                    List, Optional, Tuple)
 
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, SerializationError
 from elasticsearch.helpers import streaming_bulk
-from nltk.corpus import stopwords
-from rich.progress import track
+from elasticsearch.serializer import JSONSerializer
+from rich.console import Console
+from rich.progress import Progress, track
 from tqdm import tqdm
 
-from .extract.pdf import extract_text_pdf
-from .extract.ranking import TagExtractor
-from .interface.zotero_con import ZoteroCon
+from .extract.models import registry
+from .instrument import Instrumentation, TimedBulkClient
+from .quarantine import Quarantine
+from .schemas import serialization
 from .schemas.results import ZoteroExtractionResult
+from .workers import IsolatedRunner
 
-eng_stopwords = stopwords.words('english')
+if TYPE_CHECKING:
+    from .extract.dedup import NearDuplicateIndex
+    from .extract.graph import GraphStatistics
+    from .extract.ranking import TagExtractor
+    from .interface.zotero_con import ZoteroCon
+
+
+# what `stream_pdfs` does with near-duplicates
+DUPLICATE_POLICIES = ("keep", "skip", "merge")
 
 
 def create_note_index(es: Elasticsearch, index: str = "notes"):
@@ -44,6 +57,9 @@ def create_note_index(es: Elasticsearch, index: str = "notes"):
                 "path": {
                     "type": "text"
                 },
+                "duplicates": {
+                    "type": "keyword"
+                },
                 "topic": {
                     "type": "keyword"
                 }
@@ -79,14 +95,18 @@ def create_article_index(es: Elasticsearch,
                 "title": {
                     "type": "text"
                 },
+                # the facet fields keep their global ordinals built
+                # at refresh instead of on the first aggregation
                 "keywords": {
-                    "type": "keyword"
+                    "type": "keyword",
+                    "eager_global_ordinals": True
                 },
                 "summary": {
                     "type": "text"
                 },
                 "authors": {
-                    "type": "keyword"
+                    "type": "keyword",
+                    "eager_global_ordinals": True
                 },
                 "embedding": {
                     "type": "dense_vector",
@@ -99,6 +119,48 @@ def create_article_index(es: Elasticsearch,
     es.indices.create(index=index, body=article_map)
 
 
+def create_passage_index(es: Elasticsearch, index: str = "passages"):
+    """Index of the note passages, see `stream_passages`.
+    The term vectors make highlighting a passage cheap"""
+    passage_map = {
+        "settings": {
+            "analysis": {
+                "analyzer": {
+                    "note_analyzer": {
+                        "type": "standard",
+                    },
+                },
+            },
+        },
+        "mappings": {
+            "properties": {
+                "content": {
+                    "type": "text",
+                    "analyzer": "note_analyzer",
+                    "term_vector": "with_positions_offsets"
+                },
+                "parent_id": {
+                    "type": "keyword"
+                },
+                "passage": {
+                    "type": "integer"
+                },
+                "name": {
+                    "type": "text"
+                },
+                "keywords": {
+                    "type": "keyword"
+                },
+                "path": {
+                    "type": "keyword"
+                }
+            }
+        }
+    }
+    es.indices.delete(index, ignore=[400, 404])
+    es.indices.create(index=index, body=passage_map)
+
+
 def create_note_doc(metadata_file: os.PathLike) -> Dict[str, str]:
     """Perform basic document creation from metadata"""
     bsn = os.path.basename(metadata_file)
@@ -106,6 +168,7 @@ def create_note_doc(metadata_file: os.PathLike) -> Dict[str, str]:
         content = f.read()
     return {
         "_index": "notes",
+        "_id": note_id(metadata_file),
         "_source": {
             "name": bsn,
             "content": content,
@@ -114,56 +177,296 @@ def create_note_doc(metadata_file: os.PathLike) -> Dict[str, str]:
     }
 
 
-def stream_documents(metadata_folder: os.PathLike) -> Iterable[Dict[str, str]]:
-    """Streams the docs to ES server"""
-    for fn in tqdm(glob.glob(os.path.join(metadata_folder, "*.txt")),
-                   desc="Streaming notes..."):
-        yield create_note_doc(fn)
+def stream_documents(
+        metadata_folder: os.PathLike,
+        instrumentation: Optional[Instrumentation] = None,
+        quarantine: Optional[Quarantine] = None,
+        quarantined_only: bool = False) -> Iterable[Dict[str, str]]:
+    """Streams the docs to ES server
+    :param quarantine: where the unreadable files go
+    :param quarantined_only: only retry the quarantined files of the folder
+    """
+    instrumentation = instrumentation or Instrumentation()
+    quarantine = quarantine if quarantine is not None else Quarantine()
+    if quarantined_only:
+        fn_list = [
+            fn for fn in quarantine.items(metadata_folder)
+            if fn.endswith(".txt") and os.path.exists(fn)
+        ]
+    else:
+        fn_list = glob.glob(os.path.join(metadata_folder, "*.txt"))
+    for fn in tqdm(fn_list, desc="Streaming notes..."):
+        try:
+            with instrumentation.timer("read", label=fn):
+                doc = create_note_doc(fn)
+        except (OSError, UnicodeDecodeError) as e:
+            instrumentation.count("quarantined")
+            quarantine.add(fn, "error", f"{type(e).__name__}: {e}")
+            continue
+        yield doc
+
+
+class FastJSONSerializer(JSONSerializer):
+    """Serializer encoding the bulk bodies with orjson when available.
+    Embeddings are written straight from their float32 arrays, the other
+    types (dates, Decimal, UUID, ...) as by the default serializer"""
+
+    def dumps(self, data):
+        if isinstance(data, str):
+            return data
+        try:
+            return serialization.dumps(data,
+                                       default=self.default).decode("utf-8")
+        except (ValueError, TypeError) as e:
+            raise SerializationError(data, e)
+
+    def loads(self, s):
+        try:
+            return serialization.loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
 
 
 def create_es_instance() -> Elasticsearch:
     """Creates es instance"""
-    return Elasticsearch()
+    return Elasticsearch(serializer=FastJSONSerializer())
 
 
-def stream_pdfs(pdf_folder: os.PathLike) -> Iterable[Dict[str, str]]:
-    """Streams pdf text to ES server"""
+def duplicate_action(path: str, original: str) -> Dict:
+    """Bulk action adding `path` to the duplicates of the `original` note"""
+    return {
+        "_op_type": "update",
+        "_index": "notes",
+        "_id": note_id(original),
+        "script": {
+            "source": "if (ctx._source.duplicates == null) "
+            "{ ctx._source.duplicates = [] } "
+            "if (!ctx._source.duplicates.contains(params.path)) "
+            "{ ctx._source.duplicates.add(params.path) }",
+            "params": {
+                "path": path
+            }
+        }
+    }
+
+
+def pdf_note_doc(
+        fn: str,
+        tag_extractor: 'TagExtractor',
+        instrumentation: Instrumentation,
+        dedup: Optional['NearDuplicateIndex'] = None) -> Optional[Dict]:
+    """Extract the note document of a PDF.
+    :param dedup: near-duplicates seen so far, checked before the tagging
+    :returns: the bulk action, a `duplicate_action` for a near-duplicate,
+        None if the PDF has no text
+    """
+    from .extract.pdf import extract_text_pdf
+    with instrumentation.timer("pdf_extract", label=fn):
+        content = extract_text_pdf(filename=fn)
+    if not content:
+        return None
+    if dedup is not None:
+        with instrumentation.timer("dedup", label=fn):
+            original = dedup.check(fn, content)
+        if original is not None:
+            return duplicate_action(fn, original)
+    return tagged_note_doc(fn, content, tag_extractor, instrumentation)
+
+
+def tagged_note_doc(fn: str, content: str, tag_extractor: 'TagExtractor',
+                    instrumentation: Instrumentation) -> Dict:
+    """The note document of the extracted text of a PDF.
+    The stopwords of the file name keywords and of the tags are those of the
+    language detected in the content.
+    """
+    from .extract.keywords import detect_language, filename_keywords
+    with instrumentation.timer("filename_keywords", label=fn):
+        language = detect_language(content)
+        bsn = os.path.basename(fn).replace(".pdf", "").lower()
+        keywords = filename_keywords(fn, language)
+    result = tag_extractor(content, language, instrumentation, label=fn)
+    tags = result.keywords
+    return {
+        "_index": "notes",
+        "_id": note_id(fn),
+        "_source": {
+            "name": bsn,
+            "keywords": tags + [k for k in keywords if k not in tags],
+            "summary": result.summary,
+            "path": fn,
+            "content": content
+        }
+    }
+
+
+@lru_cache(maxsize=None)
+def _worker_tag_extractor() -> 'TagExtractor':
+    from .extract.ranking import TagExtractor
+    return TagExtractor()
+
+
+def isolated_pdf_step(task: Tuple[str, ...]) -> Tuple[Any, Dict[str, float]]:
+    """One step of `pdf_note_doc` run in a worker process, the models are
+    loaded once per worker. ("extract", fn) gives the text of the PDF and
+    ("tag", fn, content) its document, the near-duplicate check runs in
+    between in the parent, which holds the index.
+    :returns: the text or the document, and the seconds spent in every stage
+    """
+    from .extract.pdf import extract_text_pdf
+    instrumentation = Instrumentation()
+    step, fn = task[:2]
+    if step == "extract":
+        with instrumentation.timer("pdf_extract", label=fn):
+            value = extract_text_pdf(filename=fn)
+    else:
+        value = tagged_note_doc(fn, task[2], _worker_tag_extractor(),
+                                instrumentation)
+    return value, {
+        name: timings.total
+        for name, timings in instrumentation.stages.items()
+    }
+
+
+def stream_pdfs(pdf_folder: os.PathLike,
+                instrumentation: Optional[Instrumentation] = None,
+                quarantine: Optional[Quarantine] = None,
+                quarantined_only: bool = False,
+                workers: int = 0,
+                timeout: float = 300.0,
+                memory_mb: Optional[int] = None,
+                duplicates: str = "skip",
+                duplicate_threshold: float = 0.8) -> Iterable[Dict[str, str]]:
+    """Streams pdf text to ES server.
+    A PDF failing to extract is quarantined instead of stopping the upload.
+    :param instrumentation: records the time of every extraction stage
+    :param quarantine: where the failing PDFs go
+    :param quarantined_only: only retry the quarantined PDFs of the folder
+    :param workers: extract in that many worker processes, killed and
+        restarted on timeouts and memory overruns, 0 to extract in process
+    :param timeout: seconds allowed per extraction or tagging of a PDF,
+        with workers
+    :param memory_mb: memory cap of a worker, with workers
+    :param duplicates: what to do with the near-duplicates of a PDF already
+        streamed: keep them, skip them, or merge them into the first one
+        (an update adding their path to its `duplicates`, elastic only)
+    :param duplicate_threshold: shingle similarity of near-duplicates
+    """
+    from .extract.dedup import NearDuplicateIndex
+    if duplicates not in DUPLICATE_POLICIES:
+        raise ValueError(f"Unknown duplicates policy: {duplicates}")
+    instrumentation = instrumentation or Instrumentation()
+    quarantine = quarantine if quarantine is not None else Quarantine()
+    dedup = None
+    if duplicates != "keep":
+        dedup = NearDuplicateIndex(threshold=duplicate_threshold)
+    if quarantined_only:
+        fn_list = [
+            fn for fn in quarantine.items(pdf_folder)
+            if fn.endswith(".pdf") and os.path.exists(fn)
+        ]
+    else:
+        fn_list = glob.glob(os.path.join(pdf_folder, "*.pdf"))
+
+    def empty(fn: str):
+        print("Content empty, skipping...: ", fn)
+        instrumentation.count("empty")
+        quarantine.release(fn)
+
+    def failed(fn: str, stage: str, error: str):
+        print(f"Quarantined ({stage}): {fn}: {error}")
+        instrumentation.count("quarantined")
+        quarantine.add(fn, stage, error)
+
+    def duplicate(fn: str, action: Dict) -> Optional[Dict]:
+        print("Near-duplicate, "
+              f"{'merging' if duplicates == 'merge' else 'skipping'}...: ", fn)
+        instrumentation.count("duplicates")
+        quarantine.release(fn)
+        return action if duplicates == "merge" else None
+
+    if workers:
+        runner = IsolatedRunner(isolated_pdf_step,
+                                workers=workers,
+                                timeout=timeout,
+                                memory_mb=memory_mb)
+        # the extracted text comes back here for the near-duplicate check,
+        # only the other PDFs are sent back to be tagged
+        results = runner.run(("extract", fn) for fn in fn_list)
+        # near-duplicates of the PDFs being tagged and their merge actions,
+        # streamed after the document they update
+        waiting: Dict[str, List[Tuple[str, Optional[Dict]]]] = {}
+        with Progress() as progress:
+            streamed = progress.add_task("Streaming notes...",
+                                         total=len(fn_list))
+            for result in results:
+                step, fn = result.task[:2]
+                if result.ok:
+                    value, stages = result.value
+                    for stage, seconds in stages.items():
+                        instrumentation.record(stage, seconds, label=fn)
+                if not result.ok:
+                    failed(fn, result.stage, result.error)
+                    for copy, _ in waiting.pop(fn, []):
+                        failed(copy, "duplicate", f"{fn} failed to upload")
+                elif step == "tag":
+                    yield value
+                    for _, action in waiting.pop(fn, []):
+                        if action is not None:
+                            yield action
+                elif not value:
+                    empty(fn)
+                else:
+                    original = None
+                    if dedup is not None:
+                        with instrumentation.timer("dedup", label=fn):
+                            original = dedup.check(fn, value)
+                    if original is None:
+                        waiting[fn] = []
+                        runner.push(("tag", fn, value))
+                        continue
+                    action = duplicate(fn, duplicate_action(fn, original))
+                    if original in waiting:
+                        waiting[original].append((fn, action))
+                    elif action is not None:
+                        yield action
+                progress.advance(streamed)
+        return
+
+    from .extract.ranking import TagExtractor
     tag_extractor = TagExtractor()
-    fn_list = glob.glob(os.path.join(pdf_folder, "*.pdf"))
     for fn in track(fn_list,
                     total=len(fn_list),
                     description="Streaming notes..."):
-        content = extract_text_pdf(filename=fn)
-        if not content:
-            print("Content empty, skipping...: ", fn)
+        try:
+            doc = pdf_note_doc(fn, tag_extractor, instrumentation, dedup)
+        except Exception as e:
+            failed(fn, "error", f"{type(e).__name__}: {e}")
             continue
-        bsn = os.path.basename(fn).replace(".pdf", "")
-        bsn = bsn.lower()
-        exclude = set(string.punctuation)
-        s = ''.join(ch for ch in bsn if ch not in exclude)
-        keywords = re.findall(r'\w+', s)
-        keywords = [w for w in keywords if not w.lower() in eng_stopwords]
-
-        tag_extraction = tag_extractor(content)
-        yield {
-            "_index": "notes",
-            "_source": {
-                "name": bsn,
-                "keywords": tag_extraction.keywords,
-                "summary": tag_extraction.summary,
-                "path": fn,
-                "content": content
-            }
-        }
+        if doc is None:
+            empty(fn)
+            continue
+        if doc.get("_op_type") == "update":
+            doc = duplicate(fn, doc)
+            if doc is None:
+                continue
+        yield doc
 
 
-def stream_zotero() -> Iterable[Dict[str, str]]:
-    """Streams zotero data to ES server"""
-    zotero_streamer = ZoteroCon.create_zotero_connection()
+def stream_zotero(zotero_streamer: 'ZoteroCon',
+                  full_sync: bool = False,
+                  statistics: Optional['GraphStatistics'] = None,
+                  **pipeline_kwargs) -> Iterable[Dict[str, str]]:
+    """Streams zotero data to ES server
+    :param statistics: keyword and author statistics to update
+    :param pipeline_kwargs: worker and batch settings, see `ZoteroCon`
+    """
     item: ZoteroExtractionResult
-    for item in zotero_streamer():
+    for item in zotero_streamer(full_sync=full_sync, **pipeline_kwargs):
+        if statistics is not None:
+            statistics.add_zotero_entry(item)
         yield {
             "_index": "articles",
+            "_id": item.article_key,
             "_source": {
                 "title": item.article_name,
                 "keywords": item.article_tags.keywords,
@@ -175,26 +478,243 @@ def stream_zotero() -> Iterable[Dict[str, str]]:
         }
 
 
-def run_zotero_upload():
-    """Upload zotero data to ES server"""
-    stream = stream_zotero()
+def run_zotero_upload(full_sync: bool = False,
+                      tag_workers: int = 1,
+                      embed_workers: int = 1,
+                      batch_size: int = 16,
+                      instrumentation: Optional[Instrumentation] = None,
+                      skip_duplicates: bool = True):
+    """Upload zotero data to ES server.
+    Only the items changed since the previous upload are sent,
+    unless `full_sync` is set.
+    :param full_sync: recreate the index and upload the whole library
+    :param tag_workers: number of tagging threads
+    :param embed_workers: number of embedding threads
+    :param batch_size: batch size of the tagging and embedding stages
+    :param instrumentation: collects the stage timings of the run
+    :param skip_duplicates: skip the near-duplicates of the articles
+        already uploaded, see `extract.dedup.NearDuplicateIndex`
+    """
+    from .extract.dedup import NearDuplicateIndex
+    from .extract.graph import GraphStatistics
+    from .interface.search import refresh_global_facets
+    from .interface.zotero_con import ZoteroCon
+    zotero_streamer = ZoteroCon.create_zotero_connection()
     es = create_es_instance()
-    # create or replace the index
-    create_article_index(es)
-    for ok, response in streaming_bulk(es, actions=stream, index="articles"):
-        if not ok:
+    if full_sync or not es.indices.exists(index="articles"):
+        # create or replace the index
+        create_article_index(es)
+        full_sync = True
+    statistics = GraphStatistics() if full_sync else GraphStatistics.load()
+    dedup = None
+    if skip_duplicates:
+        dedup = (NearDuplicateIndex()
+                 if full_sync else NearDuplicateIndex.load())
+    instrumentation = instrumentation or Instrumentation()
+    stream = stream_zotero(zotero_streamer,
+                           full_sync=full_sync,
+                           statistics=statistics,
+                           tag_workers=tag_workers,
+                           embed_workers=embed_workers,
+                           batch_size=batch_size,
+                           instrumentation=instrumentation,
+                           dedup=dedup)
+    failed = 0
+    for ok, response in streaming_bulk(TimedBulkClient(es, instrumentation),
+                                       actions=stream,
+                                       index="articles",
+                                       raise_on_error=False):
+        instrumentation.count("docs" if ok else "failed")
+        if ok:
+            zotero_streamer.acknowledge(response["index"]["_id"])
+        else:
+            failed += 1
             print(response)
+    if not failed:
+        zotero_streamer.commit_sync()
+    statistics.save()
+    if dedup is not None:
+        dedup.save()
+    refresh_global_facets(es, index="articles")
+    console = Console()
+    if zotero_streamer.pipeline is not None:
+        console.print(zotero_streamer.pipeline.metrics)
+    console.print(instrumentation.report())
+    console.print(registry.report())
 
 
-def run_note_upload(file_folder: os.PathLike, stream_fn: Callable):
-    """Upload data using a given stream"""
-    stream = stream_fn(file_folder)
+def note_id(path: str) -> str:
+    """Stable document id of a note"""
+    return hashlib.sha1(path.encode("utf-8")).hexdigest()
+
+
+def stream_passages(stream: Iterable[Dict],
+                    passage_words: int = 200,
+                    overlap: int = 50,
+                    index: str = "passages") -> Iterable[Dict]:
+    """Split the content of the streamed notes into overlapping passages.
+    The notes are kept without their content, each passage is a document
+    of the passages index pointing to its note with `parent_id`.
+    :param stream: note documents, e.g. from `stream_pdfs`
+    :param passage_words: number of words per passage
+    :param overlap: number of words shared by consecutive passages
+    """
+    from .extract.pdf import split_passages
+    for doc in stream:
+        if "_source" not in doc:
+            # e.g. a `duplicate_action`
+            yield doc
+            continue
+        source = doc["_source"]
+        parent_id = doc.get("_id") or note_id(source["path"])
+        yield {
+            "_index": doc["_index"],
+            "_id": parent_id,
+            "_source": {k: v
+                        for k, v in source.items() if k != "content"}
+        }
+        for i, passage in enumerate(
+                split_passages(source.get("content", ""), passage_words,
+                               overlap)):
+            yield {
+                "_index": index,
+                "_id": f"{parent_id}-{i}",
+                "_source": {
+                    "parent_id": parent_id,
+                    "passage": i,
+                    "name": source.get("name", ""),
+                    "keywords": source.get("keywords", []),
+                    "path": source["path"],
+                    "content": passage
+                }
+            }
+
+
+def _track_paths(stream: Iterable[Dict], paths: Dict[str, str],
+                 duplicate_paths: Dict[str, Deque[str]]) -> Iterable[Dict]:
+    """Remember the path of every document id, bulk responses only have
+    the id. The `duplicate_action`s have the id of their original, their
+    paths are queued under it in order."""
+    for doc in stream:
+        if "_source" in doc:
+            paths[doc["_id"]] = doc["_source"]["path"]
+        elif doc.get("_op_type") == "update":
+            duplicate_paths.setdefault(doc["_id"], deque()).append(
+                doc["script"]["params"]["path"])
+        yield doc
+
+
+def run_note_upload(file_folder: os.PathLike,
+                    stream_fn: Callable,
+                    passages: bool = False,
+                    passage_words: int = 200,
+                    overlap: int = 50,
+                    backend: str = "elastic",
+                    instrumentation: Optional[Instrumentation] = None,
+                    quarantine: Optional[Quarantine] = None,
+                    retry_quarantined: bool = False,
+                    max_retries: int = 5,
+                    **stream_kwargs):
+    """Upload data using a given stream.
+    Files failing to extract or rejected by the server are quarantined,
+    the rejections caused by an overloaded server (429) are first retried
+    with an exponential backoff.
+    :param stream_fn: takes the folder, an `Instrumentation`,
+        a `Quarantine` and `quarantined_only`
+    :param passages: index the content as passages, see `stream_passages`
+    :param backend: search backend to index into,
+        see `interface.backends.BACKENDS`
+    :param instrumentation: collects the stage timings of the run
+    :param quarantine: the failing files, see `quarantine.Quarantine`
+    :param retry_quarantined: upload only the quarantined files into the
+        existing index
+    :param max_retries: retries of a rejected bulk chunk
+    :param stream_kwargs: passed to `stream_fn`,
+        e.g. the worker settings of `stream_pdfs`
+    """
+    instrumentation = instrumentation or Instrumentation()
+    quarantine = quarantine if quarantine is not None else Quarantine()
+    paths: Dict[str, str] = {}
+    duplicate_paths: Dict[str, Deque[str]] = {}
+    stream = _track_paths(
+        stream_fn(file_folder,
+                  instrumentation=instrumentation,
+                  quarantine=quarantine,
+                  quarantined_only=retry_quarantined,
+                  **stream_kwargs), paths, duplicate_paths)
+    if backend != "elastic":
+        if passages:
+            raise ValueError("Passage indexing needs the elastic backend")
+        if stream_kwargs.get("duplicates") == "merge":
+            raise ValueError("Merging duplicates needs the elastic backend")
+        from .interface.backends import get_backend
+        search_backend = get_backend(backend)
+        rejected = set()
+
+        def reject(doc_id: str, error: str):
+            path = paths.get(doc_id)
+            if path is not None:
+                rejected.add(path)
+                quarantine.add(path, "bulk", error)
+
+        try:
+            if not retry_quarantined:
+                search_backend.create_index("notes")
+            failed = search_backend.index(
+                tqdm(instrumentation.counted(stream),
+                     desc=f'Indexing documents [{file_folder}]...'),
+                on_failure=reject)
+        finally:
+            search_backend.close()
+        if failed:
+            instrumentation.count("failed", failed)
+        for path in paths.values():
+            if path not in rejected:
+                quarantine.release(path)
+        if len(quarantine):
+            print(f"{len(quarantine)} files quarantined in {quarantine.path}, "
+                  "retry them with --retry-quarantined")
+        Console().print(instrumentation.report())
+        return
     es = create_es_instance()
-    # create or replace the index
-    create_note_index(es)
+    if not retry_quarantined or not es.indices.exists(index="notes"):
+        # create or replace the index
+        create_note_index(es)
+        if passages:
+            create_passage_index(es)
+    if passages:
+        stream = stream_passages(stream, passage_words, overlap)
     for ok, response in streaming_bulk(
-            es,
+            TimedBulkClient(es, instrumentation),
             actions=tqdm(stream,
-                         desc=f'Uploading documents [{file_folder}]...')):
-        if not ok:
-            print(response)
+                         desc=f'Uploading documents [{file_folder}]...'),
+            max_retries=max_retries,
+            initial_backoff=2,
+            max_backoff=60,
+            raise_on_error=False,
+            raise_on_exception=False):
+        instrumentation.count("docs" if ok else "failed")
+        ((op_type, item), ) = response.items()
+        doc_id = str(item.get("_id", ""))
+        if op_type == "update":
+            # a duplicate merged into its original, the responses of
+            # the same id come back in order
+            pending = duplicate_paths.get(doc_id)
+            path = pending.popleft() if pending else None
+            releases = True
+        else:
+            # passages are `<note id>-<passage>`, only the note releases
+            # its file
+            path = paths.get(doc_id.split("-")[0])
+            releases = doc_id in paths
+        if path is None:
+            if not ok:
+                print(response)
+        elif not ok:
+            quarantine.add(path, "bulk", str(item.get("error")))
+        elif releases:
+            quarantine.release(path)
+    if len(quarantine):
+        print(f"{len(quarantine)} files quarantined in {quarantine.path}, "
+              "retry them with --retry-quarantined")
+    Console().print(instrumentation.report())
@@ -0,0 +1,203 @@
+import json
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..paths import cache_path
+from .keywords import tokenize
+
+DEFAULT_DEDUP_PATH = cache_path("zotero_duplicates.npz")
+# hashes are permuted modulo a Mersenne prime larger than the 32 bit
+# shingle hashes, with coefficients small enough not to overflow uint64
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xffffffff)
+
+
+def shingle_hashes(text: str, shingle: int = 5) -> np.ndarray:
+    """crc32 hashes of the distinct word shingles of the text"""
+    tokens = tokenize(text)
+    grams = {
+        " ".join(tokens[i:i + shingle])
+        for i in range(max(len(tokens) - shingle + 1, 1))
+    } if tokens else set()
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams),
+                       dtype=np.uint64,
+                       count=len(grams))
+
+
+def lsh_parameters(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Number of bands and rows per band whose S-curve turns at the
+    threshold, (1 / bands) ** (1 / rows) ~ threshold"""
+    return min(((num_perm // rows, rows) for rows in range(1, num_perm + 1)),
+               key=lambda br: abs((1 / br[0])**(1 / br[1]) - threshold))
+
+
+class MinHasher:
+    """MinHash signatures of the word shingles of a text"""
+
+    def __init__(self,
+                 num_perm: int = 128,
+                 shingle: int = 5,
+                 seed: int = 1,
+                 chunk_size: int = 4096) -> None:
+        """
+        :param num_perm: signature length
+        :param shingle: number of words per shingle
+        :param seed: seed of the hash permutations
+        :param chunk_size: shingles permuted at once, bounds the memory
+            taken by long texts
+        """
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2**31, num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, 2**31, num_perm, dtype=np.uint64)[:, None]
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self.chunk_size = chunk_size
+
+    def __call__(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text, self.shingle)
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        for start in range(0, len(hashes), self.chunk_size):
+            chunk = hashes[start:start + self.chunk_size][None, :]
+            permuted = (self.a * chunk + self.b) % _MERSENNE_PRIME & _MAX_HASH
+            np.minimum(signature, permuted.min(axis=1), out=signature)
+        return signature.astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """MinHash LSH index of the documents seen so far.
+    A document is a near-duplicate of an indexed one when the estimated
+    Jaccard similarity of their shingles reaches the threshold, e.g. a
+    preprint and its published version, or one file under two names.
+    """
+
+    def __init__(self,
+                 threshold: float = 0.8,
+                 num_perm: int = 128,
+                 shingle: int = 5,
+                 seed: int = 1,
+                 path: Optional[os.PathLike] = None) -> None:
+        """
+        :param threshold: minimum estimated Jaccard similarity
+        :param num_perm: signature length
+        :param shingle: number of words per shingle
+        :param seed: seed of the hash permutations
+        :param path: where `save` writes the index
+        """
+        self.threshold = threshold
+        self.shingle = shingle
+        self.seed = seed
+        self.path = path or DEFAULT_DEDUP_PATH
+        self.hasher = MinHasher(num_perm, shingle, seed)
+        self.bands, self.rows = lsh_parameters(threshold, num_perm)
+        self.keys: List[str] = []
+        self.key_ids: Dict[str, int] = {}
+        self.signatures: List[np.ndarray] = []
+        self.buckets: List[Dict[bytes, List[int]]] = [
+            {} for _ in range(self.bands)
+        ]
+        # duplicate key -> key of the indexed document
+        self.duplicates: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def query(self,
+              signature: np.ndarray,
+              exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """The most similar indexed document above the threshold
+        :returns: its key and estimated similarity, None if there is none
+        """
+        candidates = set()
+        for buckets, band_key in zip(self.buckets,
+                                     self._band_keys(signature)):
+            candidates.update(buckets.get(band_key, ()))
+        best = None
+        for doc_id in candidates:
+            key = self.keys[doc_id]
+            if key == exclude:
+                continue
+            similarity = float(
+                np.count_nonzero(signature == self.signatures[doc_id]) /
+                len(signature))
+            if similarity >= self.threshold and (best is None
+                                                 or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    def add(self, key: str, signature: np.ndarray):
+        """Index a document, replacing a previous version of it"""
+        doc_id = self.key_ids.get(key)
+        if doc_id is None:
+            doc_id = self.key_ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.signatures.append(signature)
+        else:
+            for buckets, band_key in zip(
+                    self.buckets, self._band_keys(self.signatures[doc_id])):
+                buckets[band_key].remove(doc_id)
+            self.signatures[doc_id] = signature
+        for buckets, band_key in zip(self.buckets,
+                                     self._band_keys(signature)):
+            buckets.setdefault(band_key, []).append(doc_id)
+
+    def check(self, key: str, text: str) -> Optional[str]:
+        """Look the document up, and index it if it is no near-duplicate
+        :returns: the key of the document it duplicates, or None
+        """
+        self.duplicates.pop(key, None)
+        signature = self.hasher(text)
+        match = self.query(signature, exclude=key)
+        if match is not None:
+            self.duplicates[key] = match[0]
+            return match[0]
+        self.add(key, signature)
+        return None
+
+    def save(self, path: Optional[os.PathLike] = None):
+        """Save the index, through a temporary file"""
+        path = path or self.path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        signatures = (np.stack(self.signatures) if self.signatures else
+                      np.zeros((0, self.hasher.num_perm), dtype=np.uint32))
+        with open(tmp_path, "wb") as f:
+            np.savez(f,
+                     params=np.array([
+                         self.threshold, self.hasher.num_perm, self.shingle,
+                         self.seed
+                     ]),
+                     keys=np.array(json.dumps(self.keys)),
+                     duplicates=np.array(json.dumps(self.duplicates)),
+                     signatures=signatures)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls,
+             path: Optional[os.PathLike] = None) -> 'NearDuplicateIndex':
+        """Load a saved index, or start with an empty one if there is none"""
+        path = path or DEFAULT_DEDUP_PATH
+        if not os.path.exists(path):
+            return cls(path=path)
+        with np.load(path, allow_pickle=False) as arrays:
+            threshold, num_perm, shingle, seed = arrays["params"]
+            index = cls(float(threshold),
+                        int(num_perm),
+                        int(shingle),
+                        int(seed),
+                        path=path)
+            index.duplicates = json.loads(str(arrays["duplicates"]))
+            for key, signature in zip(json.loads(str(arrays["keys"])),
+                                      arrays["signatures"]):
+                index.add(key, signature)
+        return index
@@ -1,23 +1,39 @@
-from sentence_transformers import SentenceTransformer
+from typing import List
 
 from ..schemas import EmbeddingsResult
+from .models import DEFAULT_EMBEDDINGS_MODEL, load_sentence_transformer
 
 
 class EmbeddingsExtractor:
 
-    def __init__(self, model_name: str = 'paraphrase-MiniLM-L6-v2') -> None:
+    def __init__(self, model_name: str = DEFAULT_EMBEDDINGS_MODEL) -> None:
         """Initialise the model
         :param model_name: the name of the model to use. From sentence embeddings library
         """
         self.model_name = model_name
-        self.model = self.__initialise_model(model_name=model_name)
+        self._model = None
 
-    def __initialise_model(self, model_name):
-        model = SentenceTransformer(f'sentence-transformers/{model_name}')
-        return model
+    @property
+    def model(self):
+        """The sentence transformer, loaded on first use and shared
+        through the model registry"""
+        if self._model is None:
+            self._model = load_sentence_transformer(self.model_name)
+        return self._model
 
     def __call__(self, text) -> EmbeddingsResult:
         embeddings = self.model.encode(text)
 
-        return EmbeddingsResult(embedding=embeddings.tolist()[0],
+        return EmbeddingsResult(embedding=embeddings[0],
                                 model_name=self.model_name)
+
+    def batch(self, texts: List[str]) -> List[EmbeddingsResult]:
+        """Embed many texts with a single encode call
+        :param texts: texts to embed
+        :returns: embeddings in the order of the texts
+        """
+        embeddings = self.model.encode(texts)
+        return [
+            EmbeddingsResult(embedding=embedding, model_name=self.model_name)
+            for embedding in embeddings
+        ]
@@ -1,16 +1,221 @@
+import json
+import os
+from array import array
 from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
 
+import numpy as np
+
+from ..paths import cache_path
 from ..schemas import ZoteroExtractionResult
 
+DEFAULT_STATISTICS_PATH = cache_path("graph_statistics.npz")
 
-class GraphStatistics:
+
+class CooccurrenceGraph:
+    """Term counts and symmetric term co-occurrence counts of one field.
+    Documents are appended as COO triplets and merged into the CSR
+    matrix before a query or a save, so adding a document is cheap."""
 
     def __init__(self):
-        self.stats = {'authors': Counter(), 'keywords': Counter(), 'total': 0}
+        from scipy.sparse import csr_matrix
+        self.terms: List[str] = []
+        self.term_ids: Dict[str, int] = {}
+        self.counts = array('q')
+        self.matrix = csr_matrix((0, 0), dtype=np.int64)
+        self._rows = array('q')
+        self._cols = array('q')
+        self._data = array('q')
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def _term_id(self, term: str) -> int:
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.terms)
+            self.terms.append(term)
+            self.counts.append(0)
+        return term_id
+
+    def add(self, terms: Iterable[str], weight: int = 1):
+        """Count the terms of one document and their pairs
+        :param weight: 1 to add the document, -1 to remove it
+        """
+        ids = [self._term_id(term) for term in dict.fromkeys(terms)]
+        for i in ids:
+            self.counts[i] += weight
+        for i in ids:
+            for j in ids:
+                if i != j:
+                    self._rows.append(i)
+                    self._cols.append(j)
+        self._data.extend([weight] * (len(ids) * (len(ids) - 1)))
+
+    def compact(self):
+        """Merge the pending triplets into the CSR matrix"""
+        from scipy.sparse import coo_matrix, csr_matrix
+        n = len(self.terms)
+        matrix = self.matrix
+        if matrix.shape[0] < n:
+            indptr = np.concatenate([
+                matrix.indptr,
+                np.full(n - matrix.shape[0], matrix.indptr[-1])
+            ])
+            matrix = csr_matrix((matrix.data, matrix.indices, indptr),
+                                shape=(n, n))
+        if self._data:
+            pending = coo_matrix(
+                (np.frombuffer(self._data, dtype=np.int64),
+                 (np.frombuffer(self._rows, dtype=np.int64),
+                  np.frombuffer(self._cols, dtype=np.int64))),
+                shape=(n, n)).tocsr()
+            matrix = matrix + pending
+            # removed documents leave explicit zeros behind
+            matrix.eliminate_zeros()
+            self._rows = array('q')
+            self._cols = array('q')
+            self._data = array('q')
+        self.matrix = matrix
+
+    @staticmethod
+    def _top(terms: List[str], ids: np.ndarray, values: np.ndarray,
+             k: int) -> List[Tuple[str, int]]:
+        if len(values) > k:
+            best = np.argpartition(-values, k)[:k]
+            ids, values = ids[best], values[best]
+        order = np.argsort(-values, kind="stable")
+        return [(terms[ids[i]], int(values[i])) for i in order
+                if values[i] > 0]
+
+    def count(self, term: str) -> int:
+        term_id = self.term_ids.get(term)
+        return 0 if term_id is None else self.counts[term_id]
+
+    def top_terms(self, k: int = 10) -> List[Tuple[str, int]]:
+        """Most frequent terms"""
+        counts = np.array(self.counts, dtype=np.int64)
+        return self._top(self.terms, np.arange(len(counts)), counts, k)
+
+    def related(self, term: str, k: int = 10) -> List[Tuple[str, int]]:
+        """Terms that most often appear in the same documents as `term`"""
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return []
+        self.compact()
+        start, end = self.matrix.indptr[term_id:term_id + 2]
+        return self._top(self.terms, self.matrix.indices[start:end],
+                         self.matrix.data[start:end], k)
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        self.compact()
+        return {
+            f"{prefix}_terms": np.array(self.terms, dtype=str),
+            f"{prefix}_counts": np.array(self.counts, dtype=np.int64),
+            f"{prefix}_data": self.matrix.data,
+            f"{prefix}_indices": self.matrix.indices,
+            f"{prefix}_indptr": self.matrix.indptr,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str) -> 'CooccurrenceGraph':
+        from scipy.sparse import csr_matrix
+        graph = cls()
+        graph.terms = arrays[f"{prefix}_terms"].tolist()
+        graph.term_ids = {term: i for i, term in enumerate(graph.terms)}
+        graph.counts = array('q', arrays[f"{prefix}_counts"].tolist())
+        n = len(graph.terms)
+        graph.matrix = csr_matrix(
+            (arrays[f"{prefix}_data"], arrays[f"{prefix}_indices"],
+             arrays[f"{prefix}_indptr"]),
+            shape=(n, n))
+        return graph
+
+
+class GraphStatistics:
+    """Keyword and author co-occurrence statistics of the article library,
+    updated as the extraction results stream in and persisted between runs.
+    Re-adding an article replaces its previous contribution."""
+
+    def __init__(self, path: Optional[os.PathLike] = None):
+        """
+        :param path: file used by `save`, defaults to the cache directory
+        """
+        self.path = path or DEFAULT_STATISTICS_PATH
+        self.keywords = CooccurrenceGraph()
+        self.authors = CooccurrenceGraph()
+        # article key -> (keywords, authors) counted for the article
+        self.documents: Dict[str, Tuple[List[str], List[str]]] = {}
+        self.total = 0
+
+    @property
+    def stats(self):
+        """Plain term counts"""
+        return {
+            'authors': +Counter(dict(zip(self.authors.terms,
+                                         self.authors.counts))),
+            'keywords': +Counter(dict(zip(self.keywords.terms,
+                                          self.keywords.counts))),
+            'total': self.total
+        }
 
     def add_zotero_entry(self, zotero_entry: ZoteroExtractionResult):
-        for keyword in zotero_entry.article_tags.keywords:
-            self.stats['keywords'][keyword] += 1
-        for author in zotero_entry.article_authors:
-            self.stats['authors'][author] += 1
-        self.stats['total'] += 1
+        keywords = list(zotero_entry.article_tags.keywords)
+        authors = list(zotero_entry.article_authors)
+        key = zotero_entry.article_key
+        if key:
+            previous = self.documents.pop(key, None)
+            if previous is not None:
+                self.keywords.add(previous[0], weight=-1)
+                self.authors.add(previous[1], weight=-1)
+                self.total -= 1
+            self.documents[key] = (keywords, authors)
+        self.keywords.add(keywords)
+        self.authors.add(authors)
+        self.total += 1
+
+    def related_keywords(self, keyword: str,
+                         k: int = 10) -> List[Tuple[str, int]]:
+        return self.keywords.related(keyword, k)
+
+    def co_authors(self, author: str, k: int = 10) -> List[Tuple[str, int]]:
+        return self.authors.related(author, k)
+
+    def top_keywords(self, k: int = 10) -> List[Tuple[str, int]]:
+        return self.keywords.top_terms(k)
+
+    def top_authors(self, k: int = 10) -> List[Tuple[str, int]]:
+        return self.authors.top_terms(k)
+
+    def save(self, path: Optional[os.PathLike] = None):
+        """Save the statistics, through a temporary file"""
+        path = path or self.path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f,
+                     total=np.array(self.total),
+                     documents=np.array(json.dumps(self.documents)),
+                     **self.keywords.to_arrays("keywords"),
+                     **self.authors.to_arrays("authors"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Optional[os.PathLike] = None) -> 'GraphStatistics':
+        """Load the saved statistics, or start empty if there are none"""
+        statistics = cls(path)
+        if not os.path.exists(statistics.path):
+            return statistics
+        with np.load(statistics.path, allow_pickle=False) as arrays:
+            statistics.total = int(arrays["total"])
+            statistics.documents = {
+                key: tuple(terms)
+                for key, terms in json.loads(str(arrays["documents"])).items()
+            }
+            statistics.keywords = CooccurrenceGraph.from_arrays(
+                arrays, "keywords")
+            statistics.authors = CooccurrenceGraph.from_arrays(
+                arrays, "authors")
+        return statistics
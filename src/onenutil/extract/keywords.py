@@ -0,0 +1,77 @@
+import os
+import re
+from functools import lru_cache
+from typing import FrozenSet, Iterable, List, Sequence
+
+# words are runs of letters and digits, anything else splits them
+compiled_token = re.compile(r'[^\W_]+')
+
+DEFAULT_LANGUAGE = "english"
+# NLTK stopword lists tried by `detect_language`
+LANGUAGES = ("english", "german", "french", "spanish", "italian",
+             "portuguese", "dutch")
+
+
+def tokenize(text: str, lowercase: bool = True) -> List[str]:
+    """Split the text into words
+    :param text: text to split
+    :param lowercase: lowercase the words
+    :returns: the words in order"""
+    return compiled_token.findall(text.lower() if lowercase else text)
+
+
+@lru_cache(maxsize=None)
+def stopwords(language: str = DEFAULT_LANGUAGE) -> FrozenSet[str]:
+    """NLTK stopwords of a language, loaded on first use.
+    Empty for the languages NLTK has no list for"""
+    from nltk.corpus import stopwords as nltk_stopwords
+    try:
+        return frozenset(nltk_stopwords.words(language))
+    except OSError:
+        return frozenset()
+
+
+def detect_language(text: str,
+                    languages: Sequence[str] = LANGUAGES,
+                    sample: int = 5000) -> str:
+    """Guess the language as the one whose stopwords are the most frequent
+    in the beginning of the text
+    :param text: text to look at
+    :param languages: candidate NLTK languages
+    :param sample: number of characters looked at
+    :returns: the language, `DEFAULT_LANGUAGE` when nothing matches"""
+    tokens = tokenize(text[:sample])
+    best, best_hits = DEFAULT_LANGUAGE, 0
+    for language in languages:
+        words = stopwords(language)
+        hits = sum(1 for token in tokens if token in words)
+        if hits > best_hits:
+            best, best_hits = language, hits
+    return best
+
+
+def remove_stopwords(tokens: Iterable[str],
+                     language: str = DEFAULT_LANGUAGE) -> List[str]:
+    words = stopwords(language)
+    return [token for token in tokens if token not in words]
+
+
+def filename_keywords(path: os.PathLike,
+                      language: str = DEFAULT_LANGUAGE) -> List[str]:
+    """Keywords of a file name, without its extension and stopwords"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return remove_stopwords(tokenize(name), language)
+
+
+def normalize_phrase(phrase: str, language: str = DEFAULT_LANGUAGE) -> str:
+    """Lowercase the phrase and trim its leading and trailing stopwords,
+    e.g. "The Attention Mechanism" -> "attention mechanism"
+    :returns: the phrase, empty if it has only stopwords"""
+    tokens = tokenize(phrase)
+    words = stopwords(language)
+    start, end = 0, len(tokens)
+    while start < end and tokens[start] in words:
+        start += 1
+    while end > start and tokens[end - 1] in words:
+        end -= 1
+    return " ".join(tokens[start:end])
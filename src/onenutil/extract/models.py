@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List
+
+from rich.console import Console, ConsoleOptions, RenderResult
+from rich.table import Table
+
+from ..workers import process_rss
+
+DEFAULT_SPACY_MODEL = "en_core_web_sm"
+DEFAULT_EMBEDDINGS_MODEL = "paraphrase-MiniLM-L6-v2"
+DEFAULT_OCR_MODEL = "microsoft/trocr-base-handwritten"
+
+
+def _rss_bytes() -> int:
+    """Current resident memory of the process, 0 if unknown"""
+    return process_rss(os.getpid()) or 0
+
+
+@dataclass
+class ModelLoadInfo:
+    """Store the load statistics of a model"""
+    name: str
+    load_time: float
+    memory_delta: int
+
+
+@dataclass
+class ModelReport:
+    """Store the load statistics of all the loaded models"""
+    models: List[ModelLoadInfo]
+
+    def __rich_console__(self, console: Console,
+                         options: ConsoleOptions) -> RenderResult:
+        """
+        Render the models table
+        """
+        table = Table(title="Loaded models")
+        table.add_column("Model", justify="left")
+        table.add_column("Load time [s]", justify="right")
+        table.add_column("Memory [MB]", justify="right")
+        for info in self.models:
+            table.add_row(info.name, f"{info.load_time:.2f}",
+                          f"{info.memory_delta / 2**20:.1f}")
+        yield table
+
+
+class ModelRegistry:
+    """Process-wide store of the loaded models.
+    Each model is loaded once, on first request, and then shared by
+    every extractor in the process. The `workers.IsolatedRunner` workers
+    are spawned, not forked, so each of them loads its own models once.
+    """
+
+    def __init__(self) -> None:
+        self._models: Dict[str, Any] = {}
+        self._info: Dict[str, ModelLoadInfo] = {}
+        self._lock = threading.RLock()
+
+    def get(self, name: str, loader: Callable[[], Any]) -> Any:
+        """Get the model, loading it with `loader` if needed
+        :param name: unique model name
+        :param loader: function creating the model
+        :returns: the shared model instance
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._models:
+                rss = _rss_bytes()
+                start = time.perf_counter()
+                self._models[name] = loader()
+                self._info[name] = ModelLoadInfo(
+                    name=name,
+                    load_time=time.perf_counter() - start,
+                    memory_delta=max(_rss_bytes() - rss, 0))
+            return self._models[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def unload(self, name: str):
+        """Drop the reference to the model"""
+        with self._lock:
+            self._models.pop(name, None)
+            self._info.pop(name, None)
+
+    def report(self) -> ModelReport:
+        """Load time and memory footprint of the loaded models"""
+        return ModelReport(list(self._info.values()))
+
+
+registry = ModelRegistry()
+
+
+def load_spacy(model_name: str = DEFAULT_SPACY_MODEL, shared: bool = True):
+    """Get the shared spaCy pipeline with the textrank component
+    :param shared: False for a private pipeline, e.g. for a thread, since
+        a spaCy pipeline must not be called from several threads at once
+    """
+
+    def loader():
+        import pytextrank  # noqa: F401, registers the textrank pipe
+        import spacy
+        nlp = spacy.load(model_name)
+        # add PyTextRank to the spaCy pipeline
+        nlp.add_pipe("textrank")
+        return nlp
+
+    if not shared:
+        return loader()
+    return registry.get(f"spacy/{model_name}+textrank", loader)
+
+
+def load_sentence_transformer(model_name: str = DEFAULT_EMBEDDINGS_MODEL):
+    """Get the shared sentence transformer"""
+
+    def loader():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(f'sentence-transformers/{model_name}')
+
+    return registry.get(f"sentence-transformers/{model_name}", loader)
+
+
+def load_trocr(model_name: str = DEFAULT_OCR_MODEL):
+    """Get the shared TrOCR processor and model"""
+
+    def loader():
+        from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+        processor = TrOCRProcessor.from_pretrained(model_name)
+        model = VisionEncoderDecoderModel.from_pretrained(model_name)
+        return processor, model
+
+    return registry.get(model_name, loader)
+
+
+MODEL_LOADERS = {
+    "spacy": load_spacy,
+    "embeddings": load_sentence_transformer,
+    "ocr": load_trocr,
+}
+
+
+def preload(names: Iterable[str] = ("spacy", "embeddings")) -> ModelReport:
+    """Load the models up front, e.g. to report their load time and
+    memory with the `models` command
+    :param names: any of `MODEL_LOADERS` keys
+    :returns: the registry report
+    """
+    for name in names:
+        MODEL_LOADERS[name]()
+    return registry.report()
@@ -1,67 +1,129 @@
 import glob
 import os
+import re
 import tempfile
-import uuid
-from typing import Iterable, List, Tuple
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Tuple
 
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
-import ocrmypdf
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+
+from .models import load_trocr
+
+if TYPE_CHECKING:
+    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+
+# P5 magic, width, height and maxval separated by whitespace or comments
+compiled_pgm_header = re.compile(
+    rb'P5(?:\s|#[^\n]*\n)+(\d+)(?:\s|#[^\n]*\n)+(\d+)'
+    rb'(?:\s|#[^\n]*\n)+(\d+)\s')
 
 
 def create_model():
-    processor = TrOCRProcessor.from_pretrained(
-        "microsoft/trocr-base-handwritten")
-    model = VisionEncoderDecoderModel.from_pretrained(
-        "microsoft/trocr-base-handwritten")
-    return processor, model
+    """Get the shared TrOCR processor and model"""
+    return load_trocr()
+
+
+def to_rgb(img: np.ndarray) -> np.ndarray:
+    """Repeat a grayscale raster into the three channels TrOCR expects"""
+    if img.ndim == 2:
+        return np.repeat(img[..., None], 3, axis=2)
+    return img
 
 
 def ocr_from_splits(img: np.ndarray,
                     splits: List[Tuple[int, int]],
-                    processor: TrOCRProcessor,
-                    model: VisionEncoderDecoderModel,
+                    processor: 'TrOCRProcessor',
+                    model: 'VisionEncoderDecoderModel',
                     pad: int = 10) -> Iterable[str]:
     """Having line splits for a note, try to obtain OCR"""
     for i in range(0, len(splits) - 1):
         cut = img[splits[i][1] - pad:splits[i + 1][1] + pad]
-        pixel_values = processor(cut, return_tensors="pt").pixel_values
+        pixel_values = processor(to_rgb(cut),
+                                 return_tensors="pt").pixel_values
         generated_ids = model.generate(pixel_values)
         generated_text = processor.batch_decode(generated_ids,
                                                 skip_special_tokens=True)[0]
         yield generated_text
 
 
+def read_pgm(path: os.PathLike) -> np.ndarray:
+    """Map a binary (P5) PGM file as a read-only array, without a copy"""
+    with open(path, 'rb') as f:
+        header = f.read(512)
+    fields = compiled_pgm_header.match(header)
+    if fields is None or int(fields.group(3)) > 255:
+        # unusual or 16 bit rasters
+        return np.asarray(Image.open(path).convert("L"))
+    width, height = int(fields.group(1)), int(fields.group(2))
+    return np.memmap(path,
+                     dtype=np.uint8,
+                     mode='r',
+                     offset=fields.end(),
+                     shape=(height, width))
+
+
+def iter_page_rasters(pdf_filename: os.PathLike,
+                      dpi: int = 500,
+                      thread_count: int = 1) -> Iterator[np.ndarray]:
+    """Rasterize the pages of a PDF as grayscale arrays.
+    poppler writes `thread_count` pages at a time as PGM files in a temporary
+    directory, mapped into the arrays, so only the current pages are held
+    in memory whatever the number of pages. An array is only valid until
+    the next one is requested.
+    :param dpi: rasterization resolution
+    :param thread_count: number of poppler processes
+    """
+    n_pages = pdfinfo_from_path(pdf_filename)["Pages"]
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        for first in range(1, n_pages + 1, thread_count):
+            paths = convert_from_path(pdf_filename,
+                                      dpi,
+                                      output_folder=tmpdirname,
+                                      first_page=first,
+                                      last_page=min(
+                                          n_pages, first + thread_count - 1),
+                                      fmt="ppm",
+                                      grayscale=True,
+                                      paths_only=True,
+                                      thread_count=thread_count)
+            for path in paths:
+                img = read_pgm(path)
+                yield img
+                del img
+                # the mapping of a yielded array survives the unlink
+                os.remove(path)
+
+
 def compute_ocr_from_note(pdf_filename: os.PathLike,
-                          metadata_folder: os.PathLike):
-    """Compute the OCR for a single note"""
-    pages = convert_from_path(pdf_filename, 500)
+                          metadata_folder: os.PathLike,
+                          dpi: int = 500,
+                          thread_count: int = 1):
+    """Compute the OCR for a single note
+    :param dpi: rasterization resolution of the pages
+    :param thread_count: number of pages rasterized in parallel
+    """
+    processor, model = create_model()
     savename = os.path.join(metadata_folder, os.path.basename(pdf_filename))
     note_contents = []
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        for i, page in enumerate(pages):
-            tfn = str(uuid.uuid4())
-            fn = os.path.join(tmpdirname, f'{tfn}.jpg')
-            page.save(fn)
-            img = Image.open(fn)
-            splits = y_intensity_histogram(img)
-            content = ocr_from_splits(img, splits)
-            note_contents.append(content)
+    for img in iter_page_rasters(pdf_filename, dpi, thread_count):
+        _, splits = y_intensity_histogram(img)
+        content = ocr_from_splits(img, splits, processor, model)
+        note_contents.append("\n".join(content))
     with open(savename, 'w') as f:
         f.write("\n".join(note_contents))
 
 
 def transform_folder(src_folder: os.PathLike, save_folder: os.PathLike):
+    import ocrmypdf
     for fn in glob.glob(os.path.join(src_folder, "*.pdf")):
         savename = os.path.join(save_folder, os.path.basename(fn))
         ocrmypdf.ocr(fn, savename, deskew=True, force_ocr=True)
 
 
 def show_img(img):
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(dpi=400)
     ax.axis("off")
     ax.imshow(img)
@@ -102,6 +164,7 @@ def y_intensity_histogram(img, min_width=60, display=False):
         merged_sections.append((x[start], x[text_sections[i]] + piece_stride))
         start = text_sections[i + 1]
     if display:
+        import matplotlib.pyplot as plt
         _, ax = plt.subplots(dpi=200)
         for (start, stop) in merged_sections:
             if stop - start < min_width:
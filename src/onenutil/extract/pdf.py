@@ -1,7 +1,7 @@
+import mmap
 import os
-import re
-import string
 from io import StringIO
+from typing import List
 
 from pdfminer.converter import TextConverter
 from pdfminer.layout import LAParams
@@ -10,18 +10,23 @@ from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
 from pdfminer.pdfpage import PDFPage
 from pdfminer.pdfparser import PDFParser
 
-compiled_word = re.compile(r'[^\W\d\-]*$')
-compiled_whitespace = re.compile(r'\s+')
+from .keywords import tokenize
 
 
 def extract_text_pdf(filename: os.PathLike) -> str:
     """Extract text from a pdf file
     :param filename: pdf path
     :returns: extracted text from a pdf"""
+    if os.path.getsize(filename) == 0:
+        # empty files cannot be mapped
+        return ""
     output_string = StringIO()
     try:
-        with open(filename, 'rb') as in_file:
-            parser = PDFParser(in_file)
+        # the parser seeks all over the file, reading from a mapping avoids
+        # copying it through the file buffers
+        with open(filename, 'rb') as in_file, mmap.mmap(
+                in_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            parser = PDFParser(mapped)
             doc = PDFDocument(parser)
             rsrcmgr = PDFResourceManager()
             device = TextConverter(rsrcmgr, output_string, laparams=LAParams())
@@ -41,14 +46,26 @@ def format_pdf(text: str, remove_numbers: bool = True) -> str:
     :returns: formatted text"""
 
     # this removes line carry
-    text = text.replace("-\n", "").replace("- \n",
-                                           "").replace("-",
-                                                       " ").replace("\"", "")
-    text = text.replace(".\n", ". ").replace(". \n",
-                                             ". ").replace("fig.??", "")
-    # substitute multiple whitespace to one
-    text = compiled_whitespace.sub(' ', text)
-    tokens = text.strip().split()
-    clean_tokens = [t for t in tokens if compiled_word.match(t)]
-    text = ' '.join(clean_tokens)
-    return text
+    text = text.replace("-\n", "").replace("- \n", "").replace("fig.??", "")
+    tokens = tokenize(text, lowercase=False)
+    if remove_numbers:
+        tokens = [t for t in tokens if t.isalpha()]
+    return ' '.join(tokens)
+
+
+def split_passages(text: str,
+                   passage_words: int = 200,
+                   overlap: int = 50) -> List[str]:
+    """Split the text into overlapping passages of whole words
+    :param text: text to split
+    :param passage_words: number of words per passage
+    :param overlap: number of words shared by consecutive passages
+    :returns: the passages, a single one for short texts"""
+    if not 0 <= overlap < passage_words:
+        raise ValueError("overlap must be smaller than passage_words")
+    words = text.split()
+    step = passage_words - overlap
+    return [
+        ' '.join(words[start:start + passage_words])
+        for start in range(0, max(len(words) - overlap, 1), step)
+    ] if words else []
@@ -1,11 +1,17 @@
-from dataclasses import dataclass
+from contextlib import nullcontext
 from math import sqrt
-from typing import List
-
-import pytextrank
-import spacy
+from typing import TYPE_CHECKING, List, Optional
 
 from ..schemas import TagResult
+from .keywords import detect_language, normalize_phrase
+from .models import load_spacy
+
+if TYPE_CHECKING:
+    from ..instrument import Instrumentation
+
+
+def _no_timer(stage: str, label: Optional[str] = None, items: int = 1):
+    return nullcontext()
 
 
 class TagExtractor:
@@ -13,27 +19,70 @@ class TagExtractor:
 
     def __init__(self,
                  limit_phrases: int = 4,
-                 limit_sentences: int = 3) -> None:
-        self.nlp = self.__initialise_spacy()
+                 limit_sentences: int = 3,
+                 shared: bool = True) -> None:
+        """
+        :param shared: use the spaCy pipeline of the model registry,
+            False to load a private one, e.g. for another thread
+        """
+        self._nlp = None
         self.limit_phrases = limit_phrases
         self.limit_sentences = limit_sentences
+        self.shared = shared
 
-    def __initialise_spacy(self):
-        nlp = spacy.load("en_core_web_sm")
-        # add PyTextRank to the spaCy pipeline
-        nlp.add_pipe("textrank")
-        return nlp
+    @property
+    def nlp(self):
+        """The spaCy pipeline, loaded on first use and shared
+        through the model registry unless `shared` is False"""
+        if self._nlp is None:
+            self._nlp = load_spacy(shared=self.shared)
+        return self._nlp
 
-    def __call__(self, text: str) -> TagResult:
-        doc = self.nlp(text)
-        tags = self.extract_tags(doc)
-        summary = self.extract_summary(doc)
+    def __call__(self,
+                 text: str,
+                 language: Optional[str] = None,
+                 instrumentation: Optional['Instrumentation'] = None,
+                 label: Optional[str] = None) -> TagResult:
+        """
+        :param language: stopword language, detected from the text if None
+        :param instrumentation: times the spacy parse, the keywords and the
+            summary as separate stages
+        :param label: document the times are attributed to
+        """
+        timer = instrumentation.timer if instrumentation else _no_timer
+        with timer("spacy", label=label):
+            doc = self.nlp(text)
+        with timer("keywords", label=label):
+            tags = self.extract_tags(doc, language)
+        with timer("summary", label=label):
+            summary = self.extract_summary(doc)
         return TagResult(tags, summary)
 
-    def extract_tags(self, doc) -> List[str]:
-        # examine the top-ranked phrases in the document
-        phrases = [phrase.text for phrase in doc._.phrases]
-        return phrases[:self.limit_phrases]
+    def batch(self, texts: List[str], batch_size: int = 16) -> List[TagResult]:
+        """Extract the tags from many texts at once with `nlp.pipe`
+        :param texts: texts to process
+        :param batch_size: spaCy batch size
+        :returns: tag results in the order of the texts
+        """
+        return [
+            TagResult(self.extract_tags(doc), self.extract_summary(doc))
+            for doc in self.nlp.pipe(texts, batch_size=batch_size)
+        ]
+
+    def extract_tags(self, doc, language: Optional[str] = None) -> List[str]:
+        """The top-ranked phrases of the document, normalized and without
+        duplicates
+        :param language: stopword language, detected from the text if None
+        """
+        language = language or detect_language(doc.text)
+        tags = []
+        for phrase in doc._.phrases:
+            tag = normalize_phrase(phrase.text, language)
+            if tag and tag not in tags:
+                tags.append(tag)
+                if len(tags) == self.limit_phrases:
+                    break
+        return tags
 
     def extract_summary(self, doc) -> List[str]:
         sent_bounds = [[s.start, s.end, set([])] for s in doc.sents]
@@ -0,0 +1,245 @@
+import cProfile
+import json
+import math
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from rich.console import Console, ConsoleOptions, RenderResult
+from rich.table import Table
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of unsorted values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+@dataclass
+class StageTimings:
+    """Per-document latencies of a stage"""
+    name: str
+    items: int = 0
+    total: float = 0.0
+    # seconds per item of every recorded call
+    latencies: List[float] = field(default_factory=list, repr=False)
+
+    @property
+    def p50(self) -> float:
+        return percentile(self.latencies, 50)
+
+    @property
+    def p95(self) -> float:
+        return percentile(self.latencies, 95)
+
+
+@dataclass
+class InstrumentationReport:
+    """End of run report: stage latencies, slowest documents, docs/s"""
+    stages: List[StageTimings]
+    slowest: List[Tuple[str, float]]
+    docs: int
+    wall_time: float
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.docs / self.wall_time if self.wall_time else 0.0
+
+    def __rich_console__(self, console: Console,
+                         options: ConsoleOptions) -> RenderResult:
+        """
+        Render the report tables
+        """
+        table = Table(title=f"Upload stages [{self.docs} docs, "
+                      f"{self.docs_per_second:.2f} docs/s]")
+        table.add_column("Stage", justify="left")
+        table.add_column("Items", justify="right")
+        table.add_column("Total (s)", justify="right")
+        table.add_column("Share", justify="right")
+        table.add_column("p50 (ms)", justify="right")
+        table.add_column("p95 (ms)", justify="right")
+        busy = sum(stage.total for stage in self.stages) or 1.0
+        for stage in self.stages:
+            table.add_row(stage.name, str(stage.items), f"{stage.total:.2f}",
+                          f"{100 * stage.total / busy:.0f}%",
+                          f"{1000 * stage.p50:.1f}", f"{1000 * stage.p95:.1f}")
+        yield table
+        if self.slowest:
+            slowest = Table(title="Slowest documents")
+            slowest.add_column("Document", justify="left")
+            slowest.add_column("Time (s)", justify="right")
+            for label, seconds in self.slowest:
+                slowest.add_row(label, f"{seconds:.2f}")
+            yield slowest
+
+
+class Instrumentation:
+    """Lightweight timers and counters for the upload stages.
+    Thread safe, so the pipeline workers can share one instance."""
+
+    def __init__(self, slowest: int = 10) -> None:
+        """
+        :param slowest: number of slowest documents kept in the report
+        """
+        self.n_slowest = slowest
+        self.stages: Dict[str, StageTimings] = {}
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.per_document: Dict[str, float] = defaultdict(float)
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    def record(self,
+               stage: str,
+               seconds: float,
+               label: Optional[str] = None,
+               items: int = 1):
+        """Record a call of a stage
+        :param label: document the time is attributed to
+        :param items: number of documents processed by the call
+        """
+        with self.lock:
+            timings = self.stages.get(stage)
+            if timings is None:
+                timings = self.stages[stage] = StageTimings(stage)
+            timings.items += items
+            timings.total += seconds
+            timings.latencies.append(seconds / max(items, 1))
+            if label is not None:
+                self.per_document[label] += seconds
+
+    @contextmanager
+    def timer(self,
+              stage: str,
+              label: Optional[str] = None,
+              items: int = 1) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, label, items)
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] += n
+
+    def counted(self, stream: Iterable[Any],
+                name: str = "docs") -> Iterator[Any]:
+        """Count the items passing through the stream"""
+        for item in stream:
+            self.count(name)
+            yield item
+
+    def report(self) -> InstrumentationReport:
+        with self.lock:
+            slowest = sorted(self.per_document.items(),
+                             key=lambda x: x[1],
+                             reverse=True)[:self.n_slowest]
+            return InstrumentationReport(
+                stages=list(self.stages.values()),
+                slowest=slowest,
+                docs=self.counters["docs"],
+                wall_time=time.perf_counter() - self.start)
+
+    def to_json(self) -> dict:
+        report = self.report()
+        return {
+            "docs": report.docs,
+            "wall_time": report.wall_time,
+            "docs_per_second": report.docs_per_second,
+            "counters": dict(self.counters),
+            "stages": {
+                stage.name: {
+                    "items": stage.items,
+                    "total": stage.total,
+                    "p50": stage.p50,
+                    "p95": stage.p95,
+                }
+                for stage in report.stages
+            },
+            "slowest": [{
+                "document": label,
+                "seconds": seconds
+            } for label, seconds in report.slowest],
+        }
+
+    def to_prometheus(self, prefix: str = "onenutil") -> str:
+        """Prometheus text exposition format"""
+        report = self.report()
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for stage in report.stages:
+            label = f'stage="{stage.name}"'
+            lines += [
+                f'{prefix}_stage_seconds{{{label},quantile="0.5"}} '
+                f'{stage.p50}',
+                f'{prefix}_stage_seconds{{{label},quantile="0.95"}} '
+                f'{stage.p95}',
+                f'{prefix}_stage_seconds_sum{{{label}}} {stage.total}',
+                f'{prefix}_stage_seconds_count{{{label}}} {stage.items}',
+            ]
+        for name, value in sorted(self.counters.items()):
+            lines += [
+                f"# TYPE {prefix}_{name}_total counter",
+                f"{prefix}_{name}_total {value}",
+            ]
+        lines += [
+            f"# TYPE {prefix}_docs_per_second gauge",
+            f"{prefix}_docs_per_second {report.docs_per_second}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: os.PathLike):
+        """Save the metrics, as JSON for a .json path and
+        in the Prometheus text format otherwise"""
+        with open(path, "w") as f:
+            if str(path).endswith(".json"):
+                json.dump(self.to_json(), f, indent=4)
+            else:
+                f.write(self.to_prometheus())
+
+
+class TimedBulkClient:
+    """Elasticsearch client proxy timing the bulk requests,
+    pass it to `streaming_bulk` in place of the client"""
+
+    def __init__(self, es, instrumentation: Instrumentation) -> None:
+        self.es = es
+        self.instrumentation = instrumentation
+
+    def bulk(self, *args, **kwargs):
+        body = kwargs.get("body", args[0] if args else "")
+        # every document takes an action and a source line
+        if isinstance(body, (str, bytes)):
+            lines = body.count("\n" if isinstance(body, str) else b"\n")
+        else:
+            lines = len(body)
+        with self.instrumentation.timer("es_bulk", items=max(1, lines // 2)):
+            return self.es.bulk(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.es, name)
+
+
+@contextmanager
+def profiled(path: Optional[os.PathLike], top: int = 20) -> Iterator[None]:
+    """Run the block under cProfile and save the stats to `path`
+    (pstats format, readable by snakeviz, gprof2dot, ...).
+    Does nothing when `path` is None."""
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
@@ -0,0 +1,255 @@
+"""Search backends for the notes.
+
+Both backends take the documents made by `stream_pdfs` / `stream_documents`
+(bulk actions with `_index` and `_source`) and return hits in the
+`basic_search` format, so that `search_format` prints either of them.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional
+
+from ..paths import cache_path
+
+compiled_query_word = re.compile(r'\w+')
+# a document without source (e.g. a duplicate update), with values that
+# cannot be stored, or rejected by sqlite
+_INSERT_ERRORS = (sqlite3.Error, KeyError, TypeError, ValueError)
+
+
+class SearchBackend(ABC):
+    """Indexes note documents and searches them"""
+    name: str
+
+    @abstractmethod
+    def create_index(self, index: str = "notes"):
+        """Create or replace the index"""
+
+    @abstractmethod
+    def index(self,
+              docs: Iterable[Dict],
+              index: str = "notes",
+              on_failure: Optional[Callable[[str, str], None]] = None) -> int:
+        """Index the documents, a failing document does not stop the others
+        :param docs: bulk actions, the `_index` of the action wins over
+            `index`
+        :param on_failure: called with the id and the error of every
+            failed document
+        :returns: number of failed documents
+        """
+
+    @abstractmethod
+    def search(self, phrase: str, index: str = "notes",
+               size: int = 10) -> List[Dict]:
+        """Search the content of the documents
+        :returns: hits with `_score`, `_index`, `_source` and
+            `highlight.content`
+        """
+
+    def close(self):
+        ...
+
+
+class ElasticBackend(SearchBackend):
+    """Search through the Elasticsearch server"""
+    name = "elastic"
+
+    def __init__(self):
+        from ..elastic import create_es_instance
+        self.es = create_es_instance()
+
+    def create_index(self, index: str = "notes"):
+        from ..elastic import create_note_index
+        create_note_index(self.es, index=index)
+
+    def index(self,
+              docs: Iterable[Dict],
+              index: str = "notes",
+              on_failure: Optional[Callable[[str, str], None]] = None) -> int:
+        from elasticsearch.helpers import streaming_bulk
+        failed = 0
+        for ok, response in streaming_bulk(self.es,
+                                           actions=docs,
+                                           index=index,
+                                           raise_on_error=False):
+            if not ok:
+                failed += 1
+                print(response)
+                if on_failure is not None:
+                    (item, ) = response.values()
+                    on_failure(str(item.get("_id", "")),
+                               str(item.get("error")))
+        return failed
+
+    def search(self, phrase: str, index: str = "notes",
+               size: int = 10) -> List[Dict]:
+        from .search import basic_search
+        return basic_search(self.es, phrase, index)[:size]
+
+
+class SQLiteBackend(SearchBackend):
+    """Local search with a SQLite FTS5 table, no server needed.
+    Documents are ranked with bm25 and highlighted with `snippet()`."""
+    name = "sqlite"
+    # bm25 weights of the name, content and keywords columns
+    weights = (2.0, 1.0, 1.5)
+
+    def __init__(self, db_path: os.PathLike = None, batch_size: int = 500):
+        """
+        :param db_path: the sqlite file, defaults to the cache directory
+        :param batch_size: number of documents inserted per transaction
+        """
+        self.db_path = db_path or cache_path("notes_search.sqlite")
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        try:
+            # the FTS rowid is the id of the document in `sources`
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5("
+                "name, content, keywords)")
+        except sqlite3.OperationalError as e:
+            raise RuntimeError(
+                "The sqlite search backend needs SQLite with FTS5") from e
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sources ("
+                          "id INTEGER PRIMARY KEY, "
+                          "idx TEXT NOT NULL, "
+                          "doc_id TEXT NOT NULL, "
+                          "source TEXT NOT NULL, "
+                          "UNIQUE (idx, doc_id))")
+        self.conn.commit()
+
+    def create_index(self, index: str = "notes"):
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM documents WHERE rowid IN "
+                "(SELECT id FROM sources WHERE idx = ?)", (index, ))
+            self.conn.execute("DELETE FROM sources WHERE idx = ?", (index, ))
+            self.conn.commit()
+
+    @staticmethod
+    def doc_id(doc: Dict) -> str:
+        return str(doc.get("_id", doc.get("_source", {}).get("path", "")))
+
+    def _insert_doc(self, doc: Dict, index: str):
+        source = doc["_source"]
+        idx = doc.get("_index", index)
+        doc_id = self.doc_id(doc)
+        stored = json.dumps({k: v for k, v in source.items() if k != "content"})
+        row = self.conn.execute(
+            "SELECT id FROM sources WHERE idx = ? AND doc_id = ?",
+            (idx, doc_id)).fetchone()
+        if row is None:
+            rowid = self.conn.execute(
+                "INSERT INTO sources (idx, doc_id, source) "
+                "VALUES (?, ?, ?)", (idx, doc_id, stored)).lastrowid
+        else:
+            # replace a document indexed again under the same id
+            rowid = row[0]
+            self.conn.execute("DELETE FROM documents WHERE rowid = ?",
+                              (rowid, ))
+            self.conn.execute("UPDATE sources SET source = ? WHERE id = ?",
+                              (stored, rowid))
+        self.conn.execute(
+            "INSERT INTO documents (rowid, name, content, keywords) "
+            "VALUES (?, ?, ?, ?)",
+            (rowid, source.get("name", ""), source.get(
+                "content", ""), " ".join(source.get("keywords", []))))
+
+    def _insert(self, docs: List[Dict], index: str,
+                on_failure: Optional[Callable[[str, str], None]]) -> int:
+        """Insert the batch in one transaction, or document by document
+        if it fails, so that only the failing documents are left out
+        :returns: number of failed documents
+        """
+        with self.lock:
+            try:
+                for doc in docs:
+                    self._insert_doc(doc, index)
+                self.conn.commit()
+                return 0
+            except _INSERT_ERRORS:
+                self.conn.rollback()
+            failed = 0
+            for doc in docs:
+                try:
+                    self._insert_doc(doc, index)
+                    self.conn.commit()
+                except _INSERT_ERRORS as e:
+                    self.conn.rollback()
+                    failed += 1
+                    if on_failure is not None:
+                        on_failure(self.doc_id(doc),
+                                   f"{type(e).__name__}: {e}")
+            return failed
+
+    def index(self,
+              docs: Iterable[Dict],
+              index: str = "notes",
+              on_failure: Optional[Callable[[str, str], None]] = None) -> int:
+        failed = 0
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                failed += self._insert(batch, index, on_failure)
+                batch = []
+        if batch:
+            failed += self._insert(batch, index, on_failure)
+        return failed
+
+    @staticmethod
+    def match_query(phrase: str) -> str:
+        """FTS5 query of the phrase, all of its words are required.
+        Quoting the words keeps FTS5 operators and punctuation out."""
+        return " ".join(f'"{word}"'
+                        for word in compiled_query_word.findall(phrase))
+
+    def search(self, phrase: str, index: str = "notes",
+               size: int = 10) -> List[Dict]:
+        query = self.match_query(phrase)
+        if not query:
+            return []
+        weights = ", ".join(str(w) for w in self.weights)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT sources.idx, sources.doc_id, sources.source, "
+                f"bm25(documents, {weights}) AS score, "
+                "snippet(documents, 1, '<em>', '</em>', '...', 32) "
+                "FROM documents JOIN sources ON sources.id = documents.rowid "
+                "WHERE documents MATCH ? AND sources.idx = ? "
+                "ORDER BY score LIMIT ?", (query, index, size)).fetchall()
+        return [{
+            "_index": idx,
+            "_id": doc_id,
+            # bm25() is lower for better matches
+            "_score": -score,
+            "_source": json.loads(source),
+            "highlight": {
+                "content": [snippet]
+            }
+        } for idx, doc_id, source, score, snippet in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+BACKENDS = {
+    ElasticBackend.name: ElasticBackend,
+    SQLiteBackend.name: SQLiteBackend,
+}
+
+
+def get_backend(name: str = "elastic", **kwargs) -> SearchBackend:
+    """Create the search backend by name, see `BACKENDS`"""
+    try:
+        return BACKENDS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown search backend: {name}, "
+                         f"choose one of {list(BACKENDS)}") from None
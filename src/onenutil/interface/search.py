@@ -1,12 +1,17 @@
+import json
+import os
+import time
 import xml
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 from elasticsearch import Elasticsearch
 from elasticsearch_dsl import (DenseVector, Document, FacetedSearch, Keyword,
                                TermsFacet, Text)
+from elasticsearch_dsl.connections import connections
 from prompt_toolkit import HTML, print_formatted_text
 from prompt_toolkit.styles import Style
 
+from onenutil.paths import cache_path
 from onenutil.schemas import ArticleSearchResult
 
 style = Style.from_dict({
@@ -36,6 +41,58 @@ def basic_search(es: Elasticsearch, phrase: str, index: str) -> List[str]:
     return [r for r in results['hits']['hits']]
 
 
+def passage_search(es: Elasticsearch,
+                   phrase: str,
+                   index: str = 'passages',
+                   size: int = 10,
+                   passages_per_doc: int = 3) -> List[Dict]:
+    """Search the note passages and collapse them to their notes.
+    The hits have the same shape as the `basic_search` ones, with the
+    highlights taken from the best passages of each note.
+    :param phrase: basic query string search on the passages
+    :param size: number of notes to return
+    :param passages_per_doc: number of passages highlighted per note
+    """
+    query = {
+        "size": size,
+        "query": {
+            "simple_query_string": {
+                "query": phrase,
+                "fields": ["content"]
+            }
+        },
+        "_source": ["parent_id", "name", "path", "keywords"],
+        "collapse": {
+            "field": "parent_id",
+            "inner_hits": {
+                "name": "passages",
+                "size": passages_per_doc,
+                "_source": False,
+                "highlight": {
+                    "fields": {
+                        # fast vector highlighter, reads the term vectors
+                        "content": {
+                            "type": "fvh"
+                        }
+                    }
+                }
+            }
+        }
+    }
+    results = es.search(index=index, body=query)
+    hits = results['hits']['hits']
+    for hit in hits:
+        passages = hit['inner_hits']['passages']['hits']['hits']
+        hit['highlight'] = {
+            'content': [
+                fragment for passage in passages
+                for fragment in passage.get('highlight', {}).get(
+                    'content', [])
+            ]
+        }
+    return hits
+
+
 def search_format(search_list: List[Dict[str, str]], k: int = 10):
     """Format the search results according to some basic formatting style.
     :param search_list: list of plain search results returned
@@ -83,46 +140,196 @@ class ArticleSearch(FacetedSearch):
     }
     fields = ['title', 'keywords', 'summary']
 
+    def __init__(self,
+                 query=None,
+                 filters={},
+                 sort=(),
+                 search_after: Optional[list] = None,
+                 compute_facets: bool = True,
+                 pit: Optional[str] = None):
+        """
+        :param pit: id of the point in time to search, instead of the index
+        """
+        self.search_after = search_after
+        self.compute_facets = compute_facets
+        self.pit = pit
+        super().__init__(query, filters, sort)
+
+    def search(self):
+        s = super().search()
+        if self.pit:
+            # a point in time search must not name the index
+            s = s.index().extra(pit={
+                "id": self.pit,
+                "keep_alive": PIT_KEEP_ALIVE
+            })
+        if self.search_after:
+            s = s.extra(search_after=list(self.search_after))
+        return s
+
+    def aggregate(self, search):
+        if self.compute_facets:
+            super().aggregate(search)
+
+
+FacetTerms = List[Tuple[str, int]]
+
+
+def global_facets_path(index: str) -> str:
+    return cache_path(f"facets_{index}.json")
 
-def search_dsl(phrase: str, index: str = 'articles') -> List[str]:
+
+def refresh_global_facets(es: Elasticsearch,
+                          index: str = 'articles',
+                          size: int = 50) -> Dict:
+    """Compute the top facets of the whole index and save them,
+    run after every upload.
+    :param size: number of top terms kept per facet
+    """
+    es.indices.refresh(index=index)
+    response = es.search(index=index,
+                         body={
+                             "size": 0,
+                             "track_total_hits": True,
+                             "aggs": {
+                                 name: {
+                                     "terms": {
+                                         "field": name,
+                                         "size": size
+                                     }
+                                 }
+                                 for name in ArticleSearch.facets
+                             }
+                         })
+    total = response["hits"]["total"]
+    snapshot = {
+        "index": index,
+        "updated": time.time(),
+        "doc_count": total["value"] if isinstance(total, dict) else total,
+    }
+    for name, agg in response["aggregations"].items():
+        snapshot[name] = [[bucket["key"], bucket["doc_count"]]
+                          for bucket in agg["buckets"]]
+    path = global_facets_path(index)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(snapshot, f)
+    os.replace(f"{path}.tmp", path)
+    _global_facets.pop(index, None)
+    return snapshot
+
+
+# index -> (file modification time, snapshot)
+_global_facets: Dict[str, Tuple[float, Dict]] = {}
+
+
+def load_global_facets(index: str = 'articles') -> Optional[Dict]:
+    """The saved global facets snapshot, None if there is none yet.
+    Re-read only when the file changes"""
+    path = global_facets_path(index)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _global_facets.get(index)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r") as f:
+            cached = _global_facets[index] = (mtime, json.load(f))
+    return cached[1]
+
+
+def search_facets(phrase: str,
+                  index: str = 'articles') -> Tuple[FacetTerms, FacetTerms]:
+    """Compute the facets scoped to the query, without fetching hits
+    :returns: keyword and author terms
+    """
+    ArticleSearch.index = index.strip()
+    response = ArticleSearch(phrase)[0:0].execute()
+    return ([(tag, count) for (tag, count, _) in response.facets.keywords],
+            [(author, count)
+             for (author, count, _) in response.facets.authors])
+
+
+# relevance order with a tie breaker, so that every hit has sort values
+# to continue from with `search_after`. `_doc` is not unique across the
+# shards, `_shard_doc` is, but only in a point in time
+PAGING_SORT = ("_score", "_shard_doc")
+# how long a point in time is kept between two pages
+PIT_KEEP_ALIVE = "5m"
+
+
+def search_dsl(phrase: str,
+               index: str = 'articles',
+               size: int = 10,
+               offset: int = 0,
+               search_after: Optional[list] = None,
+               facets: str = 'query',
+               pit: Optional[str] = None) -> ArticleSearchResult:
     """Search using the elasticsearch_dsl library.
+    The hits are paged in a point in time, so that new uploads do not
+    shift the pages.
     :param phrase: basic query string search on content field
+    :param size: number of hits to return
+    :param offset: number of hits to skip (`from`), for deep pages prefer
+        `search_after`
+    :param search_after: sort values of the last hit of the previous page,
+        see `ArticleSearchResult.next_search_after`
+    :param pit: point in time of the previous page, see
+        `ArticleSearchResult.pit`, a new one is opened if not given
+    :param facets: 'query' computes the facets of the query,
+        'cached' returns the global facets saved after the last upload
+        and skips the aggregations (falls back to 'query' if there is no
+        snapshot); query facets can then be fetched with `search_facets`
     """
-    ArticleSearch.index = index.strip()
-    s = ArticleSearch(phrase)
-    response = s.execute()
-    tag_terms = [(tag, count) for (tag, count, _) in response.facets.keywords]
-    authors_terms = [(authors, count)
-                     for (authors, count, _) in response.facets.authors]
-
-    scores = []
-    highlights = []
-    titles = []
-    tags = []
-    paths = []
-    for hit in response.hits:
-        scores.append(hit.meta.score)
-        titles.append(hit.title)
-        highlight = []
-        for k in hit.meta.highlight:
-            highlight.append("\n".join(hit.meta.highlight[k]))
-        highlight = "\n".join(highlight)
-        highlights.append(highlight)
-        tags.append(",".join(hit.keywords))
-        paths.append(hit.path)
-
-    return ArticleSearchResult(scores=scores,
-                               highlights=highlights,
-                               titles=titles,
-                               tags=tags,
-                               paths=paths,
-                               keyword_terms=tag_terms,
-                               authors_terms=authors_terms)
+    index = index.strip()
+    snapshot = load_global_facets(index) if facets == 'cached' else None
+    ArticleSearch.index = index
+    if pit is None:
+        pit = connections.get_connection().open_point_in_time(
+            index=index, keep_alive=PIT_KEEP_ALIVE)["id"]
+    s = ArticleSearch(phrase,
+                      sort=PAGING_SORT,
+                      search_after=search_after,
+                      compute_facets=snapshot is None,
+                      pit=pit)
+    if search_after:
+        offset = 0
+    response = s[offset:offset + size].execute()
+    if snapshot is None:
+        tag_terms = [(tag, count)
+                     for (tag, count, _) in response.facets.keywords]
+        authors_terms = [(authors, count)
+                         for (authors, count, _) in response.facets.authors]
+    else:
+        tag_terms = [tuple(term) for term in snapshot.get("keywords", [])]
+        authors_terms = [tuple(term) for term in snapshot.get("authors", [])]
 
+    # read the columns straight from the raw response,
+    # without wrapping every hit
+    raw_response = response.to_dict()
+    hits = raw_response["hits"]
+    raw_hits = hits["hits"]
+    total = hits.get("total", 0)
+    if isinstance(total, dict):
+        total = total["value"]
+    sources = [hit["_source"] for hit in raw_hits]
+    return ArticleSearchResult(
+        scores=[hit["_score"] for hit in raw_hits],
+        highlight_fragments=[hit.get("highlight", {}) for hit in raw_hits],
+        titles=[source.get("title", "") for source in sources],
+        keywords=[source.get("keywords", []) for source in sources],
+        paths=[source.get("path", "") for source in sources],
+        keyword_terms=tag_terms,
+        authors_terms=authors_terms,
+        total=total,
+        offset=offset,
+        sort_values=[hit.get("sort") for hit in raw_hits],
+        facets_scope="query" if snapshot is None else "global",
+        # the id can change from one response to the next
+        pit=raw_response.get("pit_id", pit))
 
-if __name__ == "__main__":
-    from elasticsearch_dsl.connections import connections
 
+if __name__ == "__main__":
     connections.create_connection(hosts=["localhost"])
     phrase = "machine learning"
     search_list = search_dsl(phrase)
@@ -2,14 +2,12 @@ import cmd
 import shlex
 import sys
 
-from elasticsearch.client import Elasticsearch
 from prompt_toolkit import HTML, print_formatted_text
 from prompt_toolkit.formatted_text import FormattedText
 from prompt_toolkit.styles import Style
 
-from src.onenutil.elastic import create_es_instance
-
-from .search import basic_search, search_format
+from .backends import SearchBackend, get_backend
+from .search import search_format
 
 # The style sheet.
 style = Style.from_dict({
@@ -20,9 +18,15 @@ style = Style.from_dict({
 class NoteSearchShell(cmd.Cmd):
     intro = 'Welcome to notes-search shell.\tType help or ? to list commands.\n'
     prompt = '(notes) '
-    es_instance: Elasticsearch = create_es_instance()
     index = "notes"
 
+    def __init__(self, backend: str = "elastic", **kwargs):
+        """
+        :param backend: search backend name, see `backends.BACKENDS`
+        """
+        super().__init__(**kwargs)
+        self.backend: SearchBackend = get_backend(backend)
+
     def do_search(self, arg):
         """
         Do basic note search.
@@ -36,7 +40,7 @@ class NoteSearchShell(cmd.Cmd):
 
             return
         print(f"Performing a search on: {arg_parsed}")
-        result = basic_search(self.es_instance, arg_parsed[0], self.index)
+        result = self.backend.search(arg_parsed[0], self.index)
         search_format(result)
 
     def do_quit(self, _):
@@ -1,5 +1,5 @@
 import glob
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import rich.box
 from elasticsearch import NotFoundError
@@ -13,7 +13,8 @@ from textual.widgets import Header, ScrollView, Static
 from textual_inputs import TextInput
 
 from onenutil.elastic import create_es_instance
-from onenutil.interface.search import search_dsl
+from onenutil.extract.graph import GraphStatistics
+from onenutil.interface.search import search_dsl, search_facets
 from onenutil.schemas.results import ArticleSearchResult
 
 
@@ -42,8 +43,22 @@ class SearchApp(App):
                  driver_class: None = None,
                  log: str = "",
                  log_verbosity: int = 1,
-                 title: str = "Note search"):
+                 title: str = "Note search",
+                 page_size: int = 100,
+                 rows_per_view: int = 20):
+        """
+        :param page_size: number of hits fetched per search request
+        :param rows_per_view: number of result rows rendered at once
+        """
         super().__init__(screen, driver_class, log, log_verbosity, title)
+        self.page_size = page_size
+        self.rows_per_view = rows_per_view
+        self.search_results: Optional[ArticleSearchResult] = None
+        self.first_row = 0
+        # related terms come from the statistics saved by the upload,
+        # so typing does not cost an aggregation request
+        self.statistics = GraphStatistics.load()
+        self.facet_groups: List[List[Tuple[str, int]]] = []
         self.es = create_es_instance()
         connections.create_connection(hosts=["localhost"])
 
@@ -59,6 +74,9 @@ class SearchApp(App):
     async def on_load(self):
         await self.bind("enter", "search", "Search")
         await self.bind("q", "quit", "quit")
+        await self.bind("pagedown", "next_rows", "Next results")
+        await self.bind("pageup", "previous_rows", "Previous results")
+        await self.bind("ctrl+f", "query_facets", "Query facets")
 
     async def populate_facets(self, facets: List[List[Tuple[str, int]]]):
         table = Table(show_lines=True, highlight=True, expand=True)
@@ -74,41 +92,107 @@ class SearchApp(App):
                   border_style='yellow',
                   box=rich.box.SQUARE))
 
+    def related_terms(self,
+                      phrase: str,
+                      k: int = 10) -> List[Tuple[str, int]]:
+        """Keywords or co-authors related to the phrase"""
+        phrase = phrase.strip()
+        return (self.statistics.related_keywords(phrase, k)
+                or self.statistics.co_authors(phrase, k))
+
+    async def handle_input_on_change(self, message) -> None:
+        if message.sender is self.text_input:
+            related = self.related_terms(self.text_input.value)
+            await self.populate_facets(self.facet_groups + [related])
+
     async def populate_search_results(self,
                                       search_results: ArticleSearchResult):
+        self.search_results = search_results
+        self.first_row = 0
+        self.facet_groups = [
+            search_results.keyword_terms, search_results.authors_terms
+        ]
+        await self.populate_facets(
+            self.facet_groups + [self.related_terms(self.search_value)])
+        await self.render_results()
+
+    async def render_results(self):
+        """Render only the visible window of the results.
+        The highlights and file links are formatted for these rows only"""
+        search_results = self.search_results
         table = Table(show_lines=True, highlight=True, expand=True)
         table.add_column("Score")
         table.add_column("Article", justify="left")
         table.add_column("Highlight", justify="right")
         table.add_column("Tags", justify="right")
-        highlight_format = "[bold red]"
-        for (highlight, score, title, tag,
-             path) in zip(search_results.highlights, search_results.scores,
-                          search_results.titles, search_results.tags,
-                          search_results.paths):
-            highlight = highlight.replace("<em>", highlight_format).replace(
-                "</em>", f"[/]").replace("\n", " ")
-            fns = glob.glob(f"/Users/jm/Zotero/storage/{path}/*.pdf")
+        last_row = min(self.first_row + self.rows_per_view,
+                       len(search_results))
+        for i in range(self.first_row, last_row):
+            title = search_results.titles[i]
+            fns = glob.glob(
+                f"/Users/jm/Zotero/storage/{search_results.paths[i]}/*.pdf")
             if fns:
                 local_path = "file://{}".format(fns[0]).replace(" ", "%20")
                 title_str = f"[link={local_path}]{title}[/link]"
             else:
                 title_str = title
-            table.add_row(str(score), title_str, highlight, tag)
-        await self.populate_facets(
-            [search_results.keyword_terms, search_results.authors_terms])
+            table.add_row(str(search_results.scores[i]), title_str,
+                          search_results.rich_highlight(i),
+                          search_results.tags(i))
         await self.body.update(
             Panel(table,
-                  title="Search results",
+                  title=f"Search results [{self.first_row + 1}-{last_row}"
+                  f" of {search_results.total}]",
                   border_style='red',
                   box=rich.box.SQUARE))
 
+    async def action_next_rows(self):
+        if self.search_results is None:
+            return
+        next_row = self.first_row + self.rows_per_view
+        if (next_row + self.rows_per_view > len(self.search_results)
+                and self.search_results.has_more):
+            # fetch the next page before the window runs out of hits
+            self.search_results.extend(
+                search_dsl(self.search_value,
+                           self.index_str.value,
+                           size=self.page_size,
+                           search_after=self.search_results.next_search_after,
+                           facets='cached',
+                           pit=self.search_results.pit))
+        if next_row < len(self.search_results):
+            self.first_row = next_row
+            await self.render_results()
+
+    async def action_previous_rows(self):
+        if self.search_results is None or self.first_row == 0:
+            return
+        self.first_row = max(0, self.first_row - self.rows_per_view)
+        await self.render_results()
+
+    async def action_query_facets(self):
+        if self.search_results is None:
+            return
+        if self.search_results.facets_scope != "query":
+            keyword_terms, authors_terms = search_facets(
+                self.search_value, self.index_str.value)
+            self.search_results.keyword_terms = keyword_terms
+            self.search_results.authors_terms = authors_terms
+            self.search_results.facets_scope = "query"
+            self.facet_groups = [keyword_terms, authors_terms]
+        await self.populate_facets(
+            self.facet_groups + [self.related_terms(self.search_value)])
+
     async def action_search(self):
         self.search_value = self.text_input.value
         if self.search_value:
             try:
+                # the facet panel starts from the cached global facets,
+                # the query facets are computed on request
                 search_result = search_dsl(self.search_value,
-                                           self.index_str.value)
+                                           self.index_str.value,
+                                           size=self.page_size,
+                                           facets='cached')
                 await self.populate_search_results(search_result)
             except NotFoundError:
                 await self.body.update(
@@ -0,0 +1,95 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from ..paths import cache_path
+
+
+class ZoteroItemCache:
+    """Local SQLite cache of Zotero items keyed by the item `version`.
+    Also stores the last synced library version, which is later passed
+    as the `since` parameter to the Zotero API."""
+
+    def __init__(self, cache_path: os.PathLike) -> None:
+        """Open (or create) the cache
+        :param cache_path: path to the sqlite file
+        """
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.cache_path = cache_path
+        # the cache is shared by the pipeline threads
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("CREATE TABLE IF NOT EXISTS items ("
+                          "key TEXT PRIMARY KEY, "
+                          "version INTEGER NOT NULL, "
+                          "data TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta ("
+                          "name TEXT PRIMARY KEY, "
+                          "value TEXT NOT NULL)")
+        self.conn.commit()
+
+    @classmethod
+    def for_library(cls, library_id: str) -> 'ZoteroItemCache':
+        """Create the cache under the default cache directory"""
+        return cls(cache_path(f"zotero_{library_id}.sqlite"))
+
+    def get_library_version(self, item_type: str) -> Optional[int]:
+        """Get the library version of the last completed sync
+        :param item_type: the type of item that was synced
+        :return: the version or None if never synced
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE name = ?",
+                (f"version:{item_type}", )).fetchone()
+        return int(row[0]) if row else None
+
+    def set_library_version(self, item_type: str, version: int):
+        """Record a completed sync"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                (f"version:{item_type}", str(version)))
+            self.conn.commit()
+
+    def get_version(self, key: str) -> Optional[int]:
+        """Get the cached version of an item"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT version FROM items WHERE key = ?",
+                (key, )).fetchone()
+        return row[0] if row else None
+
+    def get(self, key: str) -> Optional[dict]:
+        """Get the cached item"""
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM items WHERE key = ?",
+                                    (key, )).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def is_current(self, item: dict) -> bool:
+        """Check if the item is already cached at its current version"""
+        return self.get_version(item['key']) == item['version']
+
+    def store(self, item: dict):
+        """Store or update an item"""
+        data = json.dumps(item)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO items (key, version, data) "
+                "VALUES (?, ?, ?)", (item['key'], item['version'], data))
+            self.conn.commit()
+
+    def clear(self):
+        """Drop all the cached items and sync versions"""
+        with self.lock:
+            self.conn.execute("DELETE FROM items")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
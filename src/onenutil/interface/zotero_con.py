@@ -1,23 +1,58 @@
 import getpass
 import os
-from typing import Iterable
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
 
 from pyzotero import zotero
 from rich.progress import track
 
 from ..extract.embeddings import EmbeddingsExtractor
 from ..extract.ranking import TagExtractor
+from ..instrument import Instrumentation
+from ..pipeline import Pipeline, Stage
 from ..schemas import ZoteroExtractionResult
+from .zotero_cache import ZoteroItemCache
+
+if TYPE_CHECKING:
+    from ..extract.dedup import NearDuplicateIndex
 
 
 class ZoteroCon:
 
-    def __init__(self, library_id: str, api_key: str) -> None:
+    def __init__(self,
+                 library_id: str,
+                 api_key: str,
+                 cache_path: os.PathLike = None,
+                 page_size: int = 100,
+                 prefetch_pages: int = 4) -> None:
+        """
+        :param cache_path: path to the local item cache.
+            Defaults to ~/.cache/onenutil/zotero_<library_id>.sqlite
+        :param page_size: items per API request, Zotero caps it at 100
+        :param prefetch_pages: how many pages can be fetched ahead
+            of the extraction
+        """
         self.zot = zotero.Zotero(library_id=library_id,
                                  library_type='user',
                                  api_key=api_key)
+        if cache_path:
+            self.cache = ZoteroItemCache(cache_path)
+        else:
+            self.cache = ZoteroItemCache.for_library(library_id)
+        self.page_size = page_size
+        self.prefetch_pages = prefetch_pages
+        self.remote_version: Optional[int] = None
+        self.pipeline: Optional[Pipeline] = None
+        self._pending: Dict[str, dict] = {}
+        self.dedup: Optional['NearDuplicateIndex'] = None
+        self.instrumentation = Instrumentation()
         self.embeddings_extractor = EmbeddingsExtractor()
         self.tag_extractor = TagExtractor()
+        self.tag_workers = 1
+        # tag extractors of the tagging threads
+        self._local = threading.local()
 
     @classmethod
     def create_zotero_connection(cls,
@@ -35,14 +70,53 @@ class ZoteroCon:
 
         return cls(library_id=library_id, api_key=api_key)
 
-    def get_items(self, item_type: str = "journalArticle") -> Iterable[dict]:
-        """Get the items from the Zotero library
+    def get_items(self,
+                  item_type: str = "journalArticle",
+                  since: Optional[int] = None) -> Iterable[dict]:
+        """Get the items from the Zotero library. The pages are fetched
+        in a background thread, so that the extraction can run while
+        the next pages are being downloaded.
         :param item_type: the type of item to get
+        :param since: only get the items modified after this library version
         :return: the items
         """
-        itms = self.zot.everything(self.zot.items(itemType=item_type))
-        total = len(itms)
-        for item in track(itms,
+        params = {'itemType': item_type, 'limit': self.page_size}
+        if since is not None:
+            params['since'] = since
+        with self.instrumentation.timer("fetch"):
+            first_page = self.zot.items(**params)
+        total = int(
+            self.zot.request.headers.get('Total-Results', len(first_page)))
+        pages = queue.Queue(maxsize=self.prefetch_pages)
+
+        def fetch_remaining_pages():
+            try:
+                start = len(first_page)
+                while start < total:
+                    with self.instrumentation.timer("fetch"):
+                        page = self.zot.items(start=start, **params)
+                    if not page:
+                        break
+                    pages.put(page)
+                    start += len(page)
+            except Exception as e:
+                pages.put(e)
+            finally:
+                pages.put(None)
+
+        def iterate_pages():
+            yield first_page
+            while True:
+                page = pages.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+
+        threading.Thread(target=fetch_remaining_pages, daemon=True).start()
+        items = (item for page in iterate_pages() for item in page)
+        for item in track(items,
                           total=total,
                           description="Parsing Zotero library"):
             yield item
@@ -53,26 +127,151 @@ class ZoteroCon:
     def get_embeddings(self, summary: str):
         return self.embeddings_extractor(summary)
 
-    def __call__(self) -> Iterable[ZoteroExtractionResult]:
-        """Extract the tags and embeddings from the Zotero library"""
-        for item in self.get_items():
-            abstract_content = item['data'].get('abstractNote', '')
-            title = item['data'].get('title', '')
-            if (not abstract_content) or (not title):
-                # this is empty
-                continue
-            tags = self.get_tags(abstract_content)
-            embeddings = self.get_embeddings(tags.summary)
-            authors = [
-                f"{dat.get('firstName', '')} {dat.get('lastName', '')}"
-                for dat in item['data']['creators']
-            ]
-            path = item['links'].get('attachment', '')
-            if path:
-                path = os.path.basename(path['href'])
-            yield ZoteroExtractionResult(article_tags=tags,
-                                         article_embeddings=embeddings,
-                                         article_name=item['data']['title'],
-                                         article_authors=authors,
-                                         article_path=path,
-                                         abstract=abstract_content)
+    def _prepare_item(self, item: dict, full_sync: bool) -> Optional[dict]:
+        """Filter out the unchanged and empty items and
+        collect the fields needed for the extraction"""
+        if not full_sync and self.cache.is_current(item):
+            return None
+        abstract_content = item['data'].get('abstractNote', '')
+        title = item['data'].get('title', '')
+        if (not abstract_content) or (not title):
+            # this is empty
+            self.cache.store(item)
+            return None
+        if self.dedup is not None and self.dedup.check(
+                item['key'], f"{title}\n{abstract_content}") is not None:
+            # a near-duplicate of an article already extracted,
+            # e.g. the preprint of a published version. Not cached, it is
+            # checked again in case the original changes or goes away
+            self.instrumentation.count("duplicates")
+            return None
+        authors = [
+            f"{dat.get('firstName', '')} {dat.get('lastName', '')}"
+            for dat in item['data']['creators']
+        ]
+        path = item['links'].get('attachment', '')
+        if path:
+            path = os.path.basename(path['href'])
+        # cached only once its upload is acknowledged
+        self._pending[item['key']] = item
+        return {
+            "item": item,
+            "title": title,
+            "abstract": abstract_content,
+            "authors": authors,
+            "path": path
+        }
+
+    def _record_batch(self, stage: str, records: List[dict], start: float):
+        """Split the time of a batch evenly between its articles"""
+        seconds = (time.perf_counter() - start) / len(records)
+        for record in records:
+            self.instrumentation.record(stage, seconds, label=record["title"])
+
+    def _thread_tag_extractor(self) -> TagExtractor:
+        """The tag extractor of the calling thread. A spaCy pipeline is not
+        thread safe, so with several tagging threads each loads its own."""
+        if self.tag_workers == 1:
+            return self.tag_extractor
+        extractor = getattr(self._local, "tag_extractor", None)
+        if extractor is None:
+            extractor = self._local.tag_extractor = TagExtractor(shared=False)
+        return extractor
+
+    def _tag_stage(self, records: List[dict]) -> List[dict]:
+        start = time.perf_counter()
+        tags = self._thread_tag_extractor().batch(
+            [record["abstract"] for record in records])
+        self._record_batch("tags", records, start)
+        for record, tag in zip(records, tags):
+            record["tags"] = tag
+        return records
+
+    def _embed_stage(self,
+                     records: List[dict]) -> List[ZoteroExtractionResult]:
+        # the first summary sentence is embedded, same as `get_embeddings`
+        start = time.perf_counter()
+        embeddings = self.embeddings_extractor.batch(
+            [(record["tags"].summary or [""])[0] for record in records])
+        self._record_batch("embeddings", records, start)
+        return [
+            ZoteroExtractionResult(article_tags=record["tags"],
+                                   article_embeddings=embedding,
+                                   article_name=record["title"],
+                                   article_authors=record["authors"],
+                                   article_path=record["path"],
+                                   abstract=record["abstract"],
+                                   article_key=record["item"]['key'],
+                                   article_version=record["item"]['version'])
+            for record, embedding in zip(records, embeddings)
+        ]
+
+    def __call__(self,
+                 item_type: str = "journalArticle",
+                 full_sync: bool = False,
+                 tag_workers: int = 1,
+                 embed_workers: int = 1,
+                 batch_size: int = 16,
+                 queue_size: int = 64,
+                 instrumentation: Optional[Instrumentation] = None,
+                 dedup: Optional['NearDuplicateIndex'] = None
+                 ) -> Iterable[ZoteroExtractionResult]:
+        """Extract the tags and embeddings from the Zotero library.
+        Only the items changed since the last committed sync are extracted,
+        see `commit_sync`, less those whose upload was already acknowledged,
+        see `acknowledge`.
+        The fetch, tagging and embedding run as separate pipeline stages,
+        the stage metrics are available in `self.pipeline.metrics`.
+        :param item_type: the type of item to get
+        :param full_sync: ignore the local cache and extract everything
+        :param tag_workers: number of tagging threads, each with its own
+            spaCy pipeline when there are several
+        :param embed_workers: number of embedding threads
+        :param batch_size: maximum batch size of the tagging and embedding
+        :param queue_size: maximum number of items waiting between stages
+        :param instrumentation: records the per-article stage timings
+        :param dedup: index of the articles extracted so far, their
+            near-duplicates are skipped before the tagging and embedding
+        """
+        if instrumentation is not None:
+            self.instrumentation = instrumentation
+        self.dedup = dedup
+        self._pending.clear()
+        self.tag_workers = tag_workers
+        since = None
+        if not full_sync:
+            since = self.cache.get_library_version(item_type)
+        self.remote_version = self.zot.last_modified_version()
+        items = self.get_items(item_type=item_type, since=since)
+        self.pipeline = Pipeline(
+            source=items,
+            stages=[
+                Stage("filter", lambda batch: [
+                    self._prepare_item(item, full_sync) for item in batch
+                ]),
+                Stage("tags",
+                      self._tag_stage,
+                      workers=tag_workers,
+                      batch_size=batch_size),
+                Stage("embeddings",
+                      self._embed_stage,
+                      workers=embed_workers,
+                      batch_size=batch_size),
+            ],
+            queue_size=queue_size,
+            sink_name="es-bulk")
+        yield from self.pipeline
+
+    def acknowledge(self, key: str):
+        """Cache an extracted item once its upload went through.
+        An item whose upload failed or was interrupted is not cached,
+        so the next call extracts it again."""
+        item = self._pending.pop(key, None)
+        if item is not None:
+            self.cache.store(item)
+
+    def commit_sync(self, item_type: str = "journalArticle"):
+        """Mark the library version fetched by the last call as synced.
+        Call it once the extracted items have been uploaded."""
+        if self.remote_version is not None:
+            self.cache.set_library_version(item_type, self.remote_version)
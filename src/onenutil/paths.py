@@ -0,0 +1,10 @@
+import os
+
+# the files kept between runs: item caches, indexes, statistics
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache",
+                                 "onenutil")
+
+
+def cache_path(name: str) -> str:
+    """Path of a file in the cache directory"""
+    return os.path.join(DEFAULT_CACHE_DIR, name)
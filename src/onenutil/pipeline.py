@@ -0,0 +1,222 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, List, Optional
+
+from rich.console import Console, ConsoleOptions, RenderResult
+from rich.table import Table
+
+_END = object()
+
+
+@dataclass
+class StageMetrics:
+    """Store the throughput and queue statistics of a pipeline stage"""
+    name: str
+    workers: int = 1
+    items: int = 0
+    busy_time: float = 0.0
+    wall_time: float = 0.0
+    max_queue_depth: int = 0
+    queue_depth_sum: int = 0
+    queue_samples: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, items: int, busy_time: float, queue_depth: int):
+        with self.lock:
+            self.items += items
+            self.busy_time += busy_time
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+            self.queue_depth_sum += queue_depth
+            self.queue_samples += 1
+
+    @property
+    def throughput(self) -> float:
+        """Items per second of stage wall time"""
+        return self.items / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def mean_queue_depth(self) -> float:
+        if not self.queue_samples:
+            return 0.0
+        return self.queue_depth_sum / self.queue_samples
+
+
+@dataclass
+class PipelineMetrics:
+    """Store the metrics of all the stages"""
+    stages: List[StageMetrics]
+
+    def __rich_console__(self, console: Console,
+                         options: ConsoleOptions) -> RenderResult:
+        """
+        Render the metrics table
+        """
+        table = Table(title="Pipeline stages")
+        table.add_column("Stage", justify="left")
+        table.add_column("Workers", justify="right")
+        table.add_column("Items", justify="right")
+        table.add_column("Busy [s]", justify="right")
+        table.add_column("Items/s", justify="right")
+        table.add_column("Input queue (mean/max)", justify="right")
+        for stage in self.stages:
+            table.add_row(
+                stage.name, str(stage.workers), str(stage.items),
+                f"{stage.busy_time:.2f}", f"{stage.throughput:.2f}",
+                f"{stage.mean_queue_depth:.1f}/{stage.max_queue_depth}")
+        yield table
+
+
+@dataclass
+class Stage:
+    """A pipeline stage.
+    :param name: name shown in the metrics
+    :param fn: function that maps a batch (list) of items to a list of
+        results. Results that are None are dropped.
+    :param workers: number of threads running the stage
+    :param batch_size: maximum number of items passed to `fn` at once
+    """
+    name: str
+    fn: Callable[[List[Any]], List[Any]]
+    workers: int = 1
+    batch_size: int = 1
+
+
+class Pipeline:
+    """Run a source iterable through a chain of stages.
+    Stages are connected with bounded queues, so that a slow stage
+    applies backpressure instead of buffering the whole input.
+    Iterating over the pipeline yields the outputs of the last stage;
+    the time spent by the consumer is recorded as the `sink` stage.
+    """
+
+    def __init__(self,
+                 source: Iterable[Any],
+                 stages: List[Stage],
+                 queue_size: int = 64,
+                 source_name: str = "fetch",
+                 sink_name: str = "sink") -> None:
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.source_metrics = StageMetrics(source_name)
+        self.stage_metrics = [
+            StageMetrics(stage.name, workers=stage.workers)
+            for stage in stages
+        ]
+        self.sink_metrics = StageMetrics(sink_name)
+        self.error: Optional[BaseException] = None
+
+    @property
+    def metrics(self) -> PipelineMetrics:
+        return PipelineMetrics([self.source_metrics, *self.stage_metrics,
+                                self.sink_metrics])
+
+    def _run_source(self, out_q: queue.Queue, n_consumers: int):
+        start = time.perf_counter()
+        try:
+            iterator = iter(self.source)
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self.source_metrics.record(1,
+                                           time.perf_counter() - t0,
+                                           queue_depth=0)
+                out_q.put(item)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.source_metrics.wall_time = time.perf_counter() - start
+            for _ in range(n_consumers):
+                out_q.put(_END)
+
+    def _take_batch(self, in_q: queue.Queue, batch_size: int) -> List[Any]:
+        batch = [in_q.get()]
+        if batch[0] is _END:
+            return batch
+        while len(batch) < batch_size:
+            try:
+                item = in_q.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _END:
+                break
+        return batch
+
+    def _run_stage(self, stage: Stage, metrics: StageMetrics,
+                   in_q: queue.Queue, out_q: queue.Queue, n_consumers: int,
+                   remaining: List[int], lock: threading.Lock):
+        start = time.perf_counter()
+        try:
+            finished = False
+            while not finished and self.error is None:
+                depth = in_q.qsize()
+                batch = self._take_batch(in_q, stage.batch_size)
+                if batch[-1] is _END:
+                    batch.pop()
+                    finished = True
+                if not batch:
+                    continue
+                t0 = time.perf_counter()
+                results = stage.fn(batch)
+                metrics.record(len(batch), time.perf_counter() - t0, depth)
+                for result in results:
+                    if result is not None:
+                        out_q.put(result)
+        except BaseException as e:
+            self.error = e
+        finally:
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+                metrics.wall_time = max(metrics.wall_time,
+                                        time.perf_counter() - start)
+            if last or self.error is not None:
+                for _ in range(n_consumers):
+                    out_q.put(_END)
+
+    def __iter__(self) -> Iterable[Any]:
+        queues = [
+            queue.Queue(maxsize=self.queue_size)
+            for _ in range(len(self.stages) + 1)
+        ]
+        consumers = [stage.workers for stage in self.stages] + [1]
+        threads = [
+            threading.Thread(target=self._run_source,
+                             args=(queues[0], consumers[0]),
+                             daemon=True)
+        ]
+        for i, (stage, metrics) in enumerate(
+                zip(self.stages, self.stage_metrics)):
+            lock = threading.Lock()
+            remaining = [stage.workers]
+            for _ in range(stage.workers):
+                threads.append(
+                    threading.Thread(target=self._run_stage,
+                                     args=(stage, metrics, queues[i],
+                                           queues[i + 1], consumers[i + 1],
+                                           remaining, lock),
+                                     daemon=True))
+        for thread in threads:
+            thread.start()
+
+        out_q = queues[-1]
+        start = time.perf_counter()
+        try:
+            while True:
+                depth = out_q.qsize()
+                item = out_q.get()
+                if item is _END:
+                    break
+                t0 = time.perf_counter()
+                yield item
+                self.sink_metrics.record(1, time.perf_counter() - t0, depth)
+        finally:
+            self.sink_metrics.wall_time = time.perf_counter() - start
+        if self.error is not None:
+            raise self.error
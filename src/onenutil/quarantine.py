@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .paths import cache_path
+
+DEFAULT_QUARANTINE_PATH = cache_path("quarantine.json")
+
+
+class Quarantine:
+    """Persistent list of the files that failed to upload, with the stage
+    and the error of their last failure. A later run can retry only these,
+    and a successful retry releases the file."""
+
+    def __init__(self, path: Optional[os.PathLike] = None) -> None:
+        """
+        :param path: the JSON file, defaults to the cache directory
+        """
+        self.path = path or DEFAULT_QUARANTINE_PATH
+        self.lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+
+    def __contains__(self, item: str) -> bool:
+        return os.path.abspath(item) in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, item: str, stage: str, error: str):
+        """Quarantine a file
+        :param stage: where it failed, e.g. extract, timeout, bulk
+        """
+        key = os.path.abspath(item)
+        with self.lock:
+            previous = self.entries.get(key, {})
+            self.entries[key] = {
+                "stage": stage,
+                "error": error,
+                "attempts": previous.get("attempts", 0) + 1,
+                "time": time.time(),
+            }
+            self._save()
+
+    def release(self, item: str):
+        """Remove a file that went through"""
+        key = os.path.abspath(item)
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self._save()
+
+    def items(self, folder: Optional[os.PathLike] = None) -> List[str]:
+        """The quarantined files, only those in `folder` if given"""
+        if folder is None:
+            return list(self.entries)
+        folder = os.path.abspath(folder)
+        return [
+            item for item in self.entries
+            if os.path.dirname(item) == folder
+        ]
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
@@ -1,11 +1,19 @@
-from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+import sys
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 from rich.console import Console, ConsoleOptions, RenderResult
 from rich.table import Table
 
+if TYPE_CHECKING:
+    import numpy as np
 
-@dataclass
+# slotted results weigh less per in-flight document and pickle faster
+# between the pipeline workers; slots need Python 3.10
+_slotted = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_slotted)
 class TagResult:
     """Store the results of the tag extraction"""
     keywords: List[str]
@@ -23,14 +31,20 @@ class TagResult:
         yield table
 
 
-@dataclass
+@dataclass(**_slotted)
 class EmbeddingsResult:
-    """Store the results of the embeddings extraction"""
-    embedding: List[float]
+    """Store the results of the embeddings extraction.
+    The embedding is kept as a contiguous float32 array"""
+    embedding: 'np.ndarray'
     model_name: str
 
+    def __post_init__(self):
+        import numpy as np
+        self.embedding = np.ascontiguousarray(self.embedding,
+                                              dtype=np.float32).reshape(-1)
 
-@dataclass
+
+@dataclass(**_slotted)
 class ZoteroExtractionResult:
     """Store the results of the Zotero extraction"""
     article_tags: TagResult
@@ -39,6 +53,8 @@ class ZoteroExtractionResult:
     article_authors: List[str]
     abstract: str = ""
     article_path: str = ""
+    article_key: str = ""
+    article_version: int = 0
 
     def __rich_console__(self, console: Console,
                          options: ConsoleOptions) -> RenderResult:
@@ -102,12 +118,71 @@ class SearchResult:
         return cls(query=query, results=es_search)
 
 
-@dataclass
+@dataclass(**_slotted)
 class ArticleSearchResult:
+    """Columnar search results, one list per field and one entry per hit.
+    The highlight fragments and tags are kept raw and only formatted
+    for the rows that get displayed."""
     scores: List[float]
-    highlights: List[str]
+    highlight_fragments: List[Dict[str, List[str]]]
     titles: List[str]
-    tags: List[str]
+    keywords: List[List[str]]
     keyword_terms: List[Tuple[str, int]]
     authors_terms: List[Tuple[str, int]]
     paths: List[str]
+    total: int = 0
+    offset: int = 0
+    sort_values: List[list] = field(default_factory=list)
+    # "query" facets are computed for the query, "global" ones are the
+    # cached top facets of the whole index
+    facets_scope: str = "query"
+    # point in time the hits were paged in, pass it with
+    # `next_search_after` to get the next page
+    pit: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def highlight(self, i: int) -> str:
+        """Highlight of the i-th hit, the fragments of every field
+        joined by new lines"""
+        return "\n".join("\n".join(fragments)
+                         for fragments in self.highlight_fragments[i].values())
+
+    def rich_highlight(self,
+                       i: int,
+                       highlight_format: str = "[bold red]") -> str:
+        """Highlight of the i-th hit as one line of rich markup"""
+        return self.highlight(i).replace("<em>", highlight_format).replace(
+            "</em>", "[/]").replace("\n", " ")
+
+    def tags(self, i: int) -> str:
+        """Comma separated keywords of the i-th hit"""
+        return ",".join(self.keywords[i])
+
+    @property
+    def highlights(self) -> List[str]:
+        """Highlights of all the hits"""
+        return [self.highlight(i) for i in range(len(self))]
+
+    @property
+    def next_search_after(self) -> Optional[list]:
+        """Sort values of the last hit, pass them as `search_after`
+        to get the next page"""
+        return self.sort_values[-1] if self.sort_values else None
+
+    @property
+    def has_more(self) -> bool:
+        """Whether the index has more hits than loaded"""
+        return self.offset + len(self) < self.total
+
+    def extend(self, page: 'ArticleSearchResult'):
+        """Append the hits of the next page, the facets are kept"""
+        self.scores.extend(page.scores)
+        self.highlight_fragments.extend(page.highlight_fragments)
+        self.titles.extend(page.titles)
+        self.keywords.extend(page.keywords)
+        self.paths.extend(page.paths)
+        self.sort_values.extend(page.sort_values)
+        self.total = page.total
+        self.pit = page.pit
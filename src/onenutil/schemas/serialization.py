@@ -0,0 +1,45 @@
+"""Fast JSON encoding of the extraction results.
+
+orjson is used when installed, with the standard library json as the
+fallback. numpy arrays, e.g. the float32 embeddings, are written as lists of
+numbers without going through lists of boxed floats first.
+"""
+import json
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """JSON encode, numpy arrays are written as lists of numbers
+    :param default: called on the objects neither encoder handles, returns
+        a serializable version of them or raises TypeError
+    """
+    if orjson is not None:
+        return orjson.dumps(obj,
+                            default=default,
+                            option=orjson.OPT_SERIALIZE_NUMPY)
+
+    def fallback(obj):
+        if hasattr(obj, "tolist"):
+            return obj.tolist()
+        if default is not None:
+            return default(obj)
+        raise TypeError(f"Object of type {type(obj).__name__} "
+                        "is not JSON serializable")
+
+    return json.dumps(obj,
+                      default=fallback,
+                      ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def loads(data) -> Any:
+    """JSON decode"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
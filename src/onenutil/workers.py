@@ -0,0 +1,217 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing.connection import wait
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+
+@dataclass
+class TaskResult:
+    """Outcome of a task: `value` on success, otherwise `stage` and `error`
+    tell what went wrong (error, timeout, memory or crash)"""
+    task: Any
+    value: Any = None
+    stage: str = ""
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def process_rss(pid: int) -> Optional[int]:
+    """Resident memory of a process in bytes, None if unknown"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _worker_main(conn, fn: Callable[[Any], Any]):
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        try:
+            conn.send(("ok", fn(task)))
+        except MemoryError as e:
+            # the worker state is unreliable, let it be restarted
+            conn.send(("memory", f"MemoryError: {e}"))
+            return
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+
+    def __init__(self, ctx, fn: Callable[[Any], Any]) -> None:
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main,
+                                   args=(child_conn, fn),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.deadline = 0.0
+
+    def submit(self, task: Any, timeout: float):
+        self.task = task
+        self.deadline = time.monotonic() + timeout
+        self.conn.send(task)
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class IsolatedRunner:
+    """Run a function over tasks in worker processes.
+    A task that runs past `timeout` or whose worker grows past
+    `memory_mb` gets its worker killed and restarted, and is reported as
+    failed instead of taking the whole run down. Only one task per worker
+    is in flight and results are produced as the consumer asks for them,
+    so memory stays bounded whatever the input size. The consumer can
+    `push` the follow-up task of a result, which runs before the rest of
+    the input.
+    """
+
+    def __init__(self,
+                 fn: Callable[[Any], Any],
+                 workers: int = 1,
+                 timeout: float = 300.0,
+                 memory_mb: Optional[int] = None,
+                 poll_interval: float = 0.5,
+                 start_method: str = "spawn") -> None:
+        """
+        :param fn: picklable (module level) function of one task
+        :param workers: number of worker processes
+        :param timeout: seconds allowed per task
+        :param memory_mb: resident memory cap of a worker, None for no cap
+        :param poll_interval: seconds between the memory checks
+        :param start_method: multiprocessing start method, spawn does not
+            inherit the models loaded in the parent
+        """
+        self.fn = fn
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit = memory_mb * 2**20 if memory_mb else None
+        self.poll_interval = poll_interval
+        self.ctx = multiprocessing.get_context(start_method)
+        self.restarts = 0
+        self._pushed: deque = deque()
+
+    def push(self, task: Any):
+        """Add a task while `run` is iterated, ahead of the remaining input"""
+        self._pushed.append(task)
+
+    def _over_memory(self, worker: _Worker) -> bool:
+        if self.memory_limit is None:
+            return False
+        rss = process_rss(worker.process.pid)
+        return rss is not None and rss > self.memory_limit
+
+    def run(self, tasks: Iterable[Any]) -> Iterator[TaskResult]:
+        """Run the tasks, results come in completion order"""
+        tasks = iter(tasks)
+        self._pushed.clear()
+        idle: List[_Worker] = [
+            _Worker(self.ctx, self.fn) for _ in range(self.workers)
+        ]
+        busy: List[_Worker] = []
+        exhausted = False
+        try:
+            while True:
+                while idle and (self._pushed or not exhausted):
+                    if self._pushed:
+                        task = self._pushed.popleft()
+                    else:
+                        try:
+                            task = next(tasks)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                    worker = idle.pop()
+                    worker.submit(task, self.timeout)
+                    busy.append(worker)
+                if not busy:
+                    return
+                wait_time = min(w.deadline for w in busy) - time.monotonic()
+                if self.memory_limit is not None:
+                    wait_time = min(wait_time, self.poll_interval)
+                ready = wait(
+                    [w.conn for w in busy] + [w.process.sentinel
+                                               for w in busy],
+                    timeout=max(0.0, wait_time))
+                now = time.monotonic()
+                for worker in list(busy):
+                    result = None
+                    restart = False
+                    if (worker.conn in ready
+                            or worker.process.sentinel in ready):
+                        try:
+                            status, payload = worker.conn.recv()
+                        except (EOFError, OSError):
+                            worker.process.join(timeout=1)
+                            status = "crash"
+                            payload = ("worker exited with code "
+                                       f"{worker.process.exitcode}")
+                        if status == "ok":
+                            result = TaskResult(worker.task, value=payload)
+                        else:
+                            result = TaskResult(worker.task,
+                                                stage=status,
+                                                error=payload)
+                            restart = status in ("memory", "crash")
+                    elif now > worker.deadline:
+                        result = TaskResult(
+                            worker.task,
+                            stage="timeout",
+                            error=f"timed out after {self.timeout:.0f} s")
+                        restart = True
+                    elif self._over_memory(worker):
+                        result = TaskResult(
+                            worker.task,
+                            stage="memory",
+                            error="worker over "
+                            f"{self.memory_limit // 2**20} MB")
+                        restart = True
+                    if result is None:
+                        continue
+                    busy.remove(worker)
+                    if restart:
+                        worker.kill()
+                        worker = _Worker(self.ctx, self.fn)
+                        self.restarts += 1
+                    idle.append(worker)
+                    yield result
+        finally:
+            for worker in idle + busy:
+                if worker in busy:
+                    worker.kill()
+                else:
+                    worker.stop()
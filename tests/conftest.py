@@ -0,0 +1,8 @@
+import os
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+# the Kindle scripts import each other as top-level modules
+for path in (SRC, os.path.join(SRC, "kindle")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("openai")
+pytest.importorskip("smolagents")
+
+from agent import KindleToObsidianAgent, is_rate_limit_error
+
+ANSWER = "- Antifragility: gains from disorder (ref: [1], [2])"
+BOOKS = {
+    f"Book {i}": {
+        "author": "Nassim Nicholas Taleb",
+        "highlights": [f"Highlight {j} of book {i}" for j in range(3)],
+    }
+    for i in range(5)
+}
+
+
+class ChatServer(ThreadingHTTPServer):
+    """OpenAI compatible /chat/completions endpoint, rate limiting the first
+    `rate_limited` requests and holding every answer for `latency` seconds."""
+
+    daemon_threads = True
+
+    def __init__(self, rate_limited: int = 0, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), ChatHandler)
+        self.rate_limited = rate_limited
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def api_base(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            limited = server.requests <= server.rate_limited
+        time.sleep(server.latency)
+        if limited:
+            # the client must not retry on its own, the agent backs off
+            self.send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                {"Retry-After": "0.01", "x-should-retry": "false"},
+            )
+        else:
+            self.send_json(200, completion(request))
+
+
+def completion(request: dict) -> dict:
+    message = {"role": "assistant", "content": ANSWER}
+    if request.get("tools"):
+        # the agent loop ends on the final_answer tool
+        message = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": "call_1",
+                    "type": "function",
+                    "function": {
+                        "name": "final_answer",
+                        "arguments": json.dumps({"answer": ANSWER}),
+                    },
+                }
+            ],
+        }
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": request["model"],
+        "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+@pytest.fixture
+def chat_server():
+    servers = []
+
+    def start(**kwargs) -> ChatServer:
+        server = ChatServer(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_agent(tmp_path, server: ChatServer, **kwargs) -> KindleToObsidianAgent:
+    highlights_file = tmp_path / "highlights.json"
+    highlights_file.write_text(json.dumps(BOOKS), encoding="utf-8")
+    return KindleToObsidianAgent(
+        str(highlights_file),
+        str(tmp_path / "notes"),
+        model_name="local-model",
+        openai_api_key="test",
+        api_base=server.api_base,
+        initial_backoff=0.01,
+        cache_file=str(tmp_path / "responses.db"),
+        **kwargs,
+    )
+
+
+def test_rate_limited_call_backs_off_and_retries(tmp_path, chat_server):
+    server = chat_server(rate_limited=2)
+    agent = make_agent(tmp_path, server, max_retries=3)
+    try:
+        assert agent.run_model("What is antifragility?") == ANSWER
+    finally:
+        agent.close()
+    assert server.requests == 3
+    with open(agent.log_file, encoding="utf-8") as f:
+        assert f.read().count("Rate limited, retrying in 0.0s") == 2
+
+
+def test_rate_limited_call_gives_up_after_max_retries(tmp_path, chat_server):
+    server = chat_server(rate_limited=10)
+    agent = make_agent(tmp_path, server, max_retries=2)
+    try:
+        with pytest.raises(Exception, match="Rate limit"):
+            agent.run_model("What is antifragility?")
+    finally:
+        agent.close()
+    assert server.requests == 3
+
+
+def test_books_in_flight_bounded_by_concurrency(tmp_path, chat_server):
+    server = chat_server(rate_limited=3, latency=0.02)
+    agent = make_agent(tmp_path, server, concurrency=2, enrich_workers=2)
+    lock = threading.Lock()
+    books = {"in_flight": 0, "max_in_flight": 0, "done": []}
+    process_book = agent.process_book
+
+    def tracked_process_book(title, book_data, min_highlights=3):
+        with lock:
+            books["in_flight"] += 1
+            books["max_in_flight"] = max(books["max_in_flight"], books["in_flight"])
+        try:
+            process_book(title, book_data, min_highlights)
+        finally:
+            with lock:
+                books["in_flight"] -= 1
+                books["done"].append(title)
+
+    agent.process_book = tracked_process_book
+    try:
+        agent.process_all_books()
+    finally:
+        agent.close()
+    assert sorted(books["done"]) == sorted(BOOKS)
+    assert books["max_in_flight"] == 2
+    notes = [name for name in os.listdir(agent.output_dir) if name.endswith(".md")]
+    assert len(notes) == len(BOOKS)
+    with open(agent.log_file, encoding="utf-8") as f:
+        log = f.read()
+    assert "Rate limited" in log
+    assert "Failed to process book" not in log
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_failing_book_is_skipped(tmp_path, chat_server, concurrency):
+    agent = make_agent(tmp_path, chat_server(), concurrency=concurrency)
+    process_book = agent.process_book
+
+    def failing_process_book(title, book_data, min_highlights=3):
+        if title == "Book 1":
+            raise ValueError("unexpected model answer")
+        process_book(title, book_data, min_highlights)
+
+    agent.process_book = failing_process_book
+    try:
+        agent.process_all_books()
+    finally:
+        agent.close()
+    notes = [name for name in os.listdir(agent.output_dir) if name.endswith(".md")]
+    assert len(notes) == len(BOOKS) - 1
+    with open(agent.log_file, encoding="utf-8") as f:
+        assert "Failed to process book: Book 1 - unexpected model answer" in f.read()
+
+
+@pytest.mark.parametrize(
+    "message, rate_limited",
+    [
+        ("Error code: 429 - {'error': {'type': 'requests'}}", True),
+        ("HTTP/1.1 429 Too Many Requests", True),
+        ("Rate limit reached for gpt-4o-mini", True),
+        ("This model's maximum context length is 4096 tokens, you asked 4290", False),
+        ("Invalid request req_429abc: 429 highlights exceed the limit", False),
+    ],
+)
+def test_rate_limit_errors(message, rate_limited):
+    assert is_rate_limit_error(RuntimeError(message)) == rate_limited
@@ -0,0 +1,27 @@
+import os
+import stat
+
+from files import write_atomic
+
+
+def mode(path) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_new_file_gets_the_default_permissions(tmp_path):
+    umask = os.umask(0)
+    os.umask(umask)
+    note = tmp_path / "note.md"
+    write_atomic(str(note), "# Note\n")
+    assert note.read_text(encoding="utf-8") == "# Note\n"
+    assert mode(note) == 0o666 & ~umask
+    assert os.listdir(tmp_path) == ["note.md"]
+
+
+def test_rewritten_file_keeps_its_permissions(tmp_path):
+    note = tmp_path / "note.md"
+    note.write_text("old", encoding="utf-8")
+    os.chmod(note, 0o664)
+    write_atomic(str(note), "new")
+    assert note.read_text(encoding="utf-8") == "new"
+    assert mode(note) == 0o664
@@ -0,0 +1,74 @@
+import json
+import os
+
+from highlights import HighlightsFile, append_book
+
+
+def book(title, *highlights):
+    return {"title": title, "author": "Author", "highlights": list(highlights)}
+
+
+def write_books(path, *books):
+    with open(path, "w", encoding="utf-8") as f:
+        for info in books:
+            f.write(json.dumps(info) + "\n")
+
+
+def test_appended_books_extend_the_index(tmp_path):
+    path = str(tmp_path / "highlights.jsonl")
+    write_books(path, book("A", "a1"), book("B", "b1"))
+    assert list(HighlightsFile(path)) == ["A", "B"]
+
+    append_book(path, book("C", "c1"))
+    with open(f"{path}.idx", encoding="utf-8") as f:
+        indexed_size = json.load(f)["size"]
+    highlights = HighlightsFile(path)
+    assert list(highlights) == ["A", "B", "C"]
+    assert highlights["C"]["highlights"] == ["c1"]
+    # the saved offsets were reused, only the new line was read
+    assert highlights._offsets["A"][0] == 0
+    assert indexed_size < highlights._indexed_size
+
+
+def test_rewritten_file_of_the_same_size_is_reindexed(tmp_path):
+    path = str(tmp_path / "highlights.jsonl")
+    write_books(path, book("AA", "a1"), book("B", "b1"))
+    HighlightsFile(path)
+
+    stat = os.stat(path)
+    write_books(path, book("A", "a1"), book("BB", "b1"))
+    # same size, only the time tells
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert HighlightsFile(path)["BB"]["title"] == "BB"
+
+
+def test_replaced_file_is_reindexed(tmp_path):
+    path = str(tmp_path / "highlights.jsonl")
+    write_books(path, book("A", "a1"))
+    HighlightsFile(path)
+
+    # longer and with the same first line, e.g. written next to it and moved
+    other = str(tmp_path / "other.jsonl")
+    write_books(other, book("A", "a1"), book("Longer title", "x" * 100))
+    os.replace(other, path)
+    assert list(HighlightsFile(path)) == ["A", "Longer title"]
+
+
+def test_rewritten_end_is_reindexed(tmp_path):
+    path = str(tmp_path / "highlights.jsonl")
+    write_books(path, book("A", "a1"), book("B", "b1"))
+    HighlightsFile(path)
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(book("A", "a1")) + "\n")
+        f.write(json.dumps(book("B2", "b1")) + "\n")
+        f.write(json.dumps(book("C", "c1")) + "\n")
+    assert list(HighlightsFile(path)) == ["A", "B2", "C"]
+
+
+def test_index_without_file_identity_is_rebuilt(tmp_path):
+    path = str(tmp_path / "highlights.jsonl")
+    write_books(path, book("A", "a1"))
+    with open(f"{path}.idx", "w", encoding="utf-8") as f:
+        json.dump({"size": 1, "offsets": {"Z": [0, 1]}}, f)
+    assert list(HighlightsFile(path)) == ["A"]
@@ -0,0 +1,112 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+from elasticsearch.serializer import JSONSerializer  # noqa: E402
+
+from onenutil import elastic  # noqa: E402
+from onenutil.quarantine import Quarantine  # noqa: E402
+
+
+class BulkServer:
+    """Elasticsearch client answering the bulk requests, rejecting the
+    duplicates of the `failing` paths"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.transport = SimpleNamespace(serializer=JSONSerializer())
+        self.indices = SimpleNamespace(exists=lambda index: True,
+                                       create=lambda index, body: None,
+                                       delete=lambda index, ignore: None)
+
+    def bulk(self, body, **kwargs):
+        lines = [json.loads(line) for line in body.splitlines()]
+        items = []
+        for action, source in zip(lines[::2], lines[1::2]):
+            ((op_type, meta), ) = action.items()
+            path = source.get("script", {}).get("params", {}).get("path")
+            item = {"_index": meta["_index"], "_id": meta["_id"], "status": 200}
+            if path in self.failing:
+                item.update(status=400,
+                            error={
+                                "type": "mapper_parsing_exception",
+                                "reason": "failed to parse"
+                            })
+            items.append({op_type: item})
+        return {
+            "took": 1,
+            "errors": any(item.get("error") for item in items),
+            "items": items
+        }
+
+
+def notes_with_duplicates(folder, instrumentation, quarantine,
+                          quarantined_only):
+    yield {
+        "_index": "notes",
+        "_id": elastic.note_id("a.pdf"),
+        "_source": {
+            "path": "a.pdf",
+            "content": "attention"
+        }
+    }
+    yield elastic.duplicate_action("b.pdf", "a.pdf")
+    yield elastic.duplicate_action("c.pdf", "a.pdf")
+
+
+def test_failed_duplicate_merge_quarantines_the_duplicate(
+        tmp_path, monkeypatch):
+    monkeypatch.setattr(elastic, "create_es_instance",
+                        lambda: BulkServer(failing={"b.pdf"}))
+    quarantine = Quarantine(str(tmp_path / "quarantine.json"))
+    quarantine.add("c.pdf", "bulk", "rejected before")
+    elastic.run_note_upload(str(tmp_path),
+                            notes_with_duplicates,
+                            quarantine=quarantine)
+    # the original went through, the merged duplicate is released
+    assert "b.pdf" in quarantine
+    assert "a.pdf" not in quarantine
+    assert "c.pdf" not in quarantine
+
+
+def notes(folder, instrumentation, quarantine, quarantined_only):
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        yield {
+            "_index": "notes",
+            "_id": elastic.note_id(name),
+            "_source": {
+                "path": name,
+                "name": name[0],
+                "content": f"attention note {name}",
+                # b.pdf cannot be stored
+                "keywords": [object()] if name == "b.pdf" else ["attention"]
+            }
+        }
+
+
+@pytest.mark.parametrize("batch_size", [1, 500])
+def test_failing_note_is_quarantined_on_sqlite(tmp_path, monkeypatch,
+                                               batch_size):
+    from onenutil.interface import backends
+    db_path = str(tmp_path / "notes.sqlite")
+    monkeypatch.setitem(
+        backends.BACKENDS, "sqlite",
+        lambda: backends.SQLiteBackend(db_path, batch_size=batch_size))
+    quarantine = Quarantine(str(tmp_path / "quarantine.json"))
+    quarantine.add("c.pdf", "bulk", "rejected before")
+    elastic.run_note_upload(str(tmp_path),
+                            notes,
+                            backend="sqlite",
+                            quarantine=quarantine)
+    assert "b.pdf" in quarantine
+    assert len(quarantine) == 1
+
+    backend = backends.SQLiteBackend(db_path)
+    try:
+        hits = backend.search("attention")
+    finally:
+        backend.close()
+    assert sorted(hit["_source"]["path"] for hit in hits) == ["a.pdf", "c.pdf"]
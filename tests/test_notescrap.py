@@ -0,0 +1,253 @@
+import os
+from typing import Optional, Tuple
+
+import pytest
+
+pytest.importorskip("selenium")
+bs4 = pytest.importorskip("bs4")
+
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
+from selenium.webdriver.common.by import By
+
+from highlights import append_book, load_highlights
+from notescrap import (
+    ANNOTATIONS_ID,
+    BOOK_CLASS,
+    HIGHLIGHT_ID,
+    NO_HIGHLIGHTS_ID,
+    extract_book_highlights,
+    scrape_highlights,
+    wait_for_library,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data", "kindle")
+BLACK_SWAN = [
+    "Missing a train is only painful if you run after it!",
+    "The inability to predict outliers implies the inability to predict the "
+    "course of history.",
+    "We respect what has happened, ignoring what could have happened.",
+]
+
+
+def saved_page(name: str):
+    with open(os.path.join(DATA, name), encoding="utf-8") as f:
+        return bs4.BeautifulSoup(f.read(), "html.parser")
+
+
+def find_all(tag, by: str, value: str):
+    if by == By.ID:
+        return tag.find_all(id=value)
+    if by == By.CLASS_NAME:
+        return tag.find_all(class_=value)
+    raise NotImplementedError(by)
+
+
+class SavedElement:
+    def __init__(self, driver: "SavedPageDriver", tag):
+        self.driver = driver
+        self.tag = tag
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.tag.stripped_strings)
+
+    def click(self):
+        self.driver.click(self.tag["id"])
+
+    def is_enabled(self) -> bool:
+        self.driver._tick()
+        # the element was swapped out of the page
+        if self.driver.page not in self.tag.parents:
+            raise StaleElementReferenceException()
+        return True
+
+    def find_element(self, by: str, value: str) -> "SavedElement":
+        return self.driver.first(find_all(self.tag, by, value))
+
+    def find_elements(self, by: str, value: str):
+        return [SavedElement(self.driver, tag) for tag in find_all(self.tag, by, value)]
+
+
+class SavedPageDriver:
+    """WebDriver replaying the saved notebook page.
+
+    The library shows up after `library_delay` lookups. Clicking a book swaps in
+    its saved annotation pane after `pane_delay` lookups, as if the page loaded it
+    in the background; books without a saved pane never load. With
+    `highlights_delay`, the pane first shows only the title and its highlights
+    follow that many lookups later, never if it is None. The books in `empty`
+    have their highlights replaced by the marker of a book without any.
+    """
+
+    def __init__(
+        self,
+        library_delay: int = 0,
+        pane_delay: int = 2,
+        highlights_delay: Optional[int] = 0,
+        empty: Tuple[str, ...] = (),
+    ):
+        self.page = saved_page("notebook.html")
+        self.library_delay = library_delay
+        self.pane_delay = pane_delay
+        self.highlights_delay = highlights_delay
+        self.empty = empty
+        self.loading = None
+        # lookups since the last click -> whether the swapped pane has highlights
+        self.swaps = {}
+        self.clicked = []
+
+    def click(self, asin: str):
+        self.clicked.append(asin)
+        if not os.path.exists(os.path.join(DATA, f"annotations_{asin}.html")):
+            self.loading = None
+            return
+        self.loading = [asin, 0]
+        if self.highlights_delay == 0:
+            self.swaps = {self.pane_delay: True}
+        else:
+            self.swaps = {self.pane_delay: False}
+            if self.highlights_delay is not None:
+                self.swaps[self.pane_delay + self.highlights_delay] = True
+
+    def _swap_pane(self, asin: str, with_highlights: bool):
+        pane = saved_page(f"annotations_{asin}.html").find(id=ANNOTATIONS_ID)
+        if not with_highlights or asin in self.empty:
+            for highlight in pane.find_all(id=HIGHLIGHT_ID):
+                highlight.parent.decompose()
+        if with_highlights and asin in self.empty:
+            pane.append(self.page.new_tag("div", attrs={"id": NO_HIGHLIGHTS_ID}))
+        self.page.find(id=ANNOTATIONS_ID).replace_with(pane)
+
+    def _tick(self):
+        self.library_delay -= 1
+        if self.loading is None:
+            return
+        self.loading[1] += 1
+        asin, lookups = self.loading
+        if lookups in self.swaps:
+            self._swap_pane(asin, self.swaps[lookups])
+
+    def first(self, tags) -> SavedElement:
+        if not tags:
+            raise NoSuchElementException()
+        return SavedElement(self, tags[0])
+
+    def find_elements(self, by: str, value: str):
+        self._tick()
+        if self.library_delay >= 0:
+            return []
+        return [SavedElement(self, tag) for tag in find_all(self.page, by, value)]
+
+    def find_element(self, by: str, value: str) -> SavedElement:
+        return self.first([element.tag for element in self.find_elements(by, value)])
+
+
+def library(driver: SavedPageDriver):
+    return {
+        book.text.split("\n")[0]: book
+        for book in driver.find_elements(By.CLASS_NAME, BOOK_CLASS)
+    }
+
+
+def test_wait_for_library():
+    wait_for_library(SavedPageDriver(library_delay=2), timeout=5)
+    with pytest.raises(TimeoutException):
+        wait_for_library(SavedPageDriver(library_delay=100), timeout=1)
+
+
+def test_highlights_wait_for_the_clicked_book():
+    driver = SavedPageDriver()
+    book = library(driver)["The Black Swan"]
+    # the pane still shows the first book until the clicked one loads
+    assert extract_book_highlights(driver, book, timeout=5) == {
+        "title": "The Black Swan",
+        "author": "By: Nassim Nicholas Taleb",
+        "highlights": BLACK_SWAN,
+    }
+    with pytest.raises(TimeoutException):
+        extract_book_highlights(driver, library(driver)["Atomic Habits"], timeout=1)
+
+
+def test_highlights_wait_for_the_late_highlight_list():
+    # the title of the clicked book shows up before its highlights
+    driver = SavedPageDriver(highlights_delay=3)
+    book = library(driver)["The Black Swan"]
+    assert extract_book_highlights(driver, book, timeout=5)["highlights"] == (
+        BLACK_SWAN
+    )
+    driver = SavedPageDriver(highlights_delay=None)
+    book = library(driver)["The Black Swan"]
+    with pytest.raises(TimeoutException):
+        extract_book_highlights(driver, book, timeout=1)
+
+
+def test_highlights_of_a_book_without_any():
+    driver = SavedPageDriver(empty=("B0047Y0F0K",))
+    book = library(driver)["The Black Swan"]
+    assert extract_book_highlights(driver, book, timeout=5)["highlights"] == []
+
+
+def test_highlights_wait_for_the_pane_to_be_replaced():
+    # clicking the book already shown reloads its pane
+    driver = SavedPageDriver(pane_delay=3)
+    book = library(driver)["Thinking, Fast and Slow"]
+    pane = driver.page.find(id=ANNOTATIONS_ID)
+    highlights = extract_book_highlights(driver, book, timeout=5)["highlights"]
+    assert driver.page.find(id=ANNOTATIONS_ID) is not pane
+    assert len(highlights) == 2
+
+
+def test_scrape_streams_the_books_to_the_output(tmp_path):
+    output = str(tmp_path / "highlights.jsonl")
+    scraped = scrape_highlights(SavedPageDriver(), output, timeout=1)
+    first = next(scraped)
+    assert first["title"] == "Thinking, Fast and Slow"
+    # written as soon as it is done
+    assert list(load_highlights(output)) == ["Thinking, Fast and Slow"]
+    # the book that never loads is skipped
+    assert [book["title"] for book in scraped] == ["The Black Swan"]
+    assert load_highlights(output)["The Black Swan"]["highlights"] == BLACK_SWAN
+
+
+def test_scrape_resumes_after_the_saved_books(tmp_path):
+    output = str(tmp_path / "highlights.jsonl")
+    append_book(
+        output,
+        {
+            "title": "Thinking, Fast and Slow",
+            "author": "By: Daniel Kahneman",
+            "highlights": ["saved before"],
+        },
+    )
+    driver = SavedPageDriver()
+    titles = [book["title"] for book in scrape_highlights(driver, output, timeout=1)]
+    assert titles == ["The Black Swan"]
+    assert driver.clicked == ["B0047Y0F0K", "B07D23CFGR"]
+
+    # only the book that failed is tried again
+    driver = SavedPageDriver()
+    assert list(scrape_highlights(driver, output, timeout=1)) == []
+    assert driver.clicked == ["B07D23CFGR"]
+    highlights = load_highlights(output)
+    assert list(highlights) == ["Thinking, Fast and Slow", "The Black Swan"]
+    assert highlights["Thinking, Fast and Slow"]["highlights"] == ["saved before"]
+
+
+def test_restart_drops_the_saved_books(tmp_path):
+    output = str(tmp_path / "highlights.jsonl")
+    append_book(
+        output,
+        {"title": "Thinking, Fast and Slow", "author": "", "highlights": ["old"]},
+    )
+    titles = [
+        book["title"]
+        for book in scrape_highlights(
+            SavedPageDriver(), output, resume=False, timeout=1
+        )
+    ]
+    assert titles == ["Thinking, Fast and Slow", "The Black Swan"]
+    assert load_highlights(output)["Thinking, Fast and Slow"]["highlights"] != ["old"]
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("pdf2image")
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from onenutil.extract.ocr import ocr_from_splits, read_pgm  # noqa: E402
+
+
+class ImageOnlyProcessor:
+    """The TrOCR image processor, with a stand-in for the tokenizer"""
+
+    def __init__(self):
+        self.image_processor = transformers.ViTImageProcessor(
+            size={"height": 384, "width": 384})
+
+    def __call__(self, images, return_tensors=None):
+        return self.image_processor(images, return_tensors=return_tensors)
+
+    def batch_decode(self, ids, skip_special_tokens=False):
+        return [" ".join(str(i) for i in row) for row in ids.tolist()]
+
+
+class RecordingModel:
+
+    def __init__(self):
+        self.shapes = []
+
+    def generate(self, pixel_values):
+        self.shapes.append(tuple(pixel_values.shape))
+        return torch.zeros((1, 2), dtype=torch.long)
+
+
+def write_page(path, height=300, width=200):
+    """A grayscale page raster, as poppler writes them"""
+    page = np.full((height, width), 255, dtype=np.uint8)
+    page[60:80, 20:180] = 0
+    page[160:180, 20:180] = 0
+    with open(path, "wb") as f:
+        f.write(b"P5\n%d %d\n255\n" % (width, height))
+        f.write(page.tobytes())
+
+
+def test_mapped_page_goes_through_the_processor(tmp_path):
+    path = str(tmp_path / "page-1.pgm")
+    write_page(path)
+    page = read_pgm(path)
+    assert isinstance(page, np.memmap) and page.ndim == 2
+
+    model = RecordingModel()
+    lines = list(
+        ocr_from_splits(page, [(0, 40), (0, 120), (0, 220)],
+                        ImageOnlyProcessor(), model))
+    assert lines == ["0 0", "0 0"]
+    assert model.shapes == [(1, 3, 384, 384)] * 2
@@ -0,0 +1,107 @@
+import pytest
+
+pytest.importorskip("elasticsearch_dsl")
+pytest.importorskip("prompt_toolkit")
+
+from elasticsearch_dsl.connections import connections  # noqa: E402
+
+from onenutil.interface import search  # noqa: E402
+
+
+class ShardedIndex:
+    """Elasticsearch client searching an index spread over shards, every
+    document of which matches with the same score.
+    Like Elasticsearch, `_doc` sorts on the document number in its shard
+    and `_shard_doc` on the shard and the document number, only in a point
+    in time."""
+
+    def __init__(self, titles, shards: int = 3):
+        self.docs = [{
+            "_id": str(i),
+            "shard": i % shards,
+            "doc": i // shards,
+            "title": title
+        } for i, title in enumerate(titles)]
+        self.pits = []
+        self.searches = []
+
+    def open_point_in_time(self, index, keep_alive=None):
+        self.pits.append(index)
+        return {"id": f"pit-{len(self.pits)}"}
+
+    def _sort_value(self, doc, key):
+        if key == "_score":
+            return 1.0
+        if key == "_doc":
+            return doc["doc"]
+        if key == "_shard_doc":
+            return (doc["shard"] << 32) + doc["doc"]
+        raise ValueError(key)
+
+    def search(self, index=None, body=None, **params):
+        body = dict(body or params)
+        self.searches.append({"index": index, **body})
+        if "pit" in body and index is not None:
+            raise ValueError("[indices] cannot be used with point in time")
+        if "_shard_doc" in body["sort"] and "pit" not in body:
+            raise ValueError("[_shard_doc] requires a point in time")
+        rows = sorted([[self._sort_value(doc, key)
+                        for key in body["sort"]], doc] for doc in self.docs)
+        if "search_after" in body:
+            rows = [row for row in rows if row[0] > body["search_after"]]
+        start = body.get("from", body.get("from_", 0))
+        rows = rows[start:start + body.get("size", 10)]
+        response = {
+            "took": 1,
+            "timed_out": False,
+            "hits": {
+                "total": {
+                    "value": len(self.docs),
+                    "relation": "eq"
+                },
+                "max_score": 1.0,
+                "hits": [{
+                    "_index": "articles",
+                    "_id": doc["_id"],
+                    "_score": 1.0,
+                    "_source": {
+                        "title": doc["title"],
+                        "keywords": [],
+                        "path": ""
+                    },
+                    "sort": sort
+                } for sort, doc in rows]
+            }
+        }
+        if "pit" in body:
+            response["pit_id"] = body["pit"]["id"]
+        return response
+
+
+@pytest.fixture
+def es(monkeypatch):
+    es = ShardedIndex([f"Article {i}" for i in range(10)])
+    connections.add_connection("default", es)
+    monkeypatch.setattr(search, "load_global_facets", lambda index: {
+        "keywords": [],
+        "authors": []
+    })
+    yield es
+    connections.remove_connection("default")
+
+
+def test_pages_with_tied_scores_have_every_hit_once(es):
+    result = search.search_dsl("attention", size=3, facets="cached")
+    assert result.pit == "pit-1"
+    while result.has_more:
+        result.extend(
+            search.search_dsl("attention",
+                              size=3,
+                              search_after=result.next_search_after,
+                              facets="cached",
+                              pit=result.pit))
+    assert sorted(result.titles) == sorted(doc["title"] for doc in es.docs)
+    # a single point in time for all the pages
+    assert es.pits == ["articles"]
+    assert all(s["index"] is None and s["pit"]["id"] == "pit-1"
+               for s in es.searches)
@@ -0,0 +1,56 @@
+import datetime
+import decimal
+import uuid
+
+import numpy as np
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+from elasticsearch import SerializationError  # noqa: E402
+
+from onenutil.elastic import FastJSONSerializer  # noqa: E402
+from onenutil.schemas import serialization  # noqa: E402
+
+
+@pytest.fixture(params=["json", "orjson"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(serialization, "orjson", None)
+    return request.param
+
+
+def test_embeddings_are_written_from_their_arrays(encoder):
+    embedding = np.array([0.1, -2.5, 3e-8], dtype=np.float32)
+    doc = serialization.loads(FastJSONSerializer().dumps({"vector": embedding}))
+    assert np.array_equal(np.array(doc["vector"], dtype=np.float32), embedding)
+
+
+def test_other_types_as_the_default_serializer(encoder):
+    doc = {
+        "created": datetime.datetime(2024, 5, 1, 12, 30),
+        "day": datetime.date(2024, 5, 1),
+        "price": decimal.Decimal("1.5"),
+        "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "score": np.float32(0.5),
+        "count": np.int64(3),
+        "title": "Überblick",
+    }
+    assert serialization.loads(FastJSONSerializer().dumps(doc)) == {
+        "created": "2024-05-01T12:30:00",
+        "day": "2024-05-01",
+        "price": 1.5,
+        "id": "12345678-1234-5678-1234-567812345678",
+        "score": 0.5,
+        "count": 3,
+        "title": "Überblick",
+    }
+
+
+def test_unserializable_objects_raise(encoder):
+    with pytest.raises(SerializationError):
+        FastJSONSerializer().dumps({"object": object()})
+    with pytest.raises(SerializationError):
+        FastJSONSerializer().loads("{")
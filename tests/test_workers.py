@@ -0,0 +1,40 @@
+import os
+import time
+
+from onenutil.workers import IsolatedRunner
+
+
+def step(task):
+    kind, value = task
+    if kind == "sleep":
+        time.sleep(value)
+    elif kind == "crash":
+        os._exit(3)
+    elif kind == "fail":
+        raise ValueError(value)
+    return kind, value * 2
+
+
+def test_failures_are_reported_and_workers_restarted():
+    runner = IsolatedRunner(step, workers=2, timeout=2.0)
+    tasks = [("double", 1), ("fail", "bad"), ("crash", 0), ("sleep", 30),
+             ("double", 2)]
+    results = {result.task: result for result in runner.run(tasks)}
+    assert results[("double", 1)].value == ("double", 2)
+    assert results[("double", 2)].value == ("double", 4)
+    assert results[("fail", "bad")].stage == "error"
+    assert results[("crash", 0)].stage == "crash"
+    assert results[("sleep", 30)].stage == "timeout"
+    assert runner.restarts == 2
+
+
+def test_pushed_tasks_run_ahead_of_the_input():
+    runner = IsolatedRunner(step, workers=1)
+    seen = []
+    for result in runner.run([("extract", 1), ("extract", 2)]):
+        seen.append(result.task)
+        kind, value = result.value
+        if kind == "extract":
+            # the follow-up of a result, e.g. tagging an extracted text
+            runner.push(("tag", value))
+    assert seen == [("extract", 1), ("tag", 2), ("extract", 2), ("tag", 4)]
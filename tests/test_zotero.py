@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyzotero")
+
+from onenutil.extract.dedup import NearDuplicateIndex  # noqa: E402
+from onenutil.interface.zotero_con import ZoteroCon  # noqa: E402
+from onenutil.schemas import EmbeddingsResult, TagResult  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(__file__), "data", "zotero")
+
+
+def recorded(name):
+    with open(os.path.join(DATA, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ZoteroServer(ThreadingHTTPServer):
+    """Replays recorded pages of the Zotero `/users/<id>/items` API with
+    their `Total-Results` and `Last-Modified-Version` headers, a recording
+    per `since` parameter"""
+
+    daemon_threads = True
+
+    def __init__(self, *recordings):
+        super().__init__(("127.0.0.1", 0), ZoteroHandler)
+        self.requests = []
+        self.replay(*recordings)
+
+    def replay(self, *recordings):
+        self.recordings = {
+            recording.get("since"): recording
+            for recording in recordings
+        }
+        self.version = max(recording["last_modified_version"]
+                           for recording in recordings)
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def pages(self):
+        """Parameters of the item page requests, less the version probes"""
+        return [request for request in self.requests if request["limit"] != 1]
+
+
+class ZoteroHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        if url.path != "/users/123456/items":
+            self.send_error(404)
+            return
+        query = dict(parse_qsl(url.query))
+        since = int(query["since"]) if "since" in query else None
+        start = int(query.get("start", 0))
+        limit = int(query.get("limit", 25))
+        server.requests.append({"start": start, "limit": limit, "since": since})
+        # nothing changed since a version that was not recorded
+        pages = server.recordings.get(since, {"pages": []})["pages"]
+        items = [item for page in pages for item in page]
+        body = json.dumps(items[start:start + limit]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Total-Results", str(len(items)))
+        self.send_header("Last-Modified-Version", str(server.version))
+        if start + limit < len(items):
+            query["start"] = str(start + limit)
+            next_url = f"{server.endpoint}{url.path}?{urlencode(query)}"
+            self.send_header("Link", f'<{next_url}>; rel="next"')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class KeywordTags:
+
+    def batch(self, texts, batch_size=16):
+        return [TagResult(text.lower().split()[:2], [text]) for text in texts]
+
+
+class ZeroEmbeddings:
+
+    def batch(self, texts):
+        return [
+            EmbeddingsResult(np.zeros(4, dtype=np.float32), "zeros")
+            for _ in texts
+        ]
+
+
+@pytest.fixture
+def server():
+    server = ZoteroServer(recorded("items.json"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def zotero(tmp_path, server):
+    con = ZoteroCon("123456", "key", cache_path=str(tmp_path / "items.sqlite"),
+                    page_size=2)
+    con.zot.endpoint = server.endpoint
+    con.tag_extractor = KeywordTags()
+    con.embeddings_extractor = ZeroEmbeddings()
+    return con
+
+
+def upload(con, failing=(), **kwargs):
+    """Consume an extraction like `run_zotero_upload`: acknowledge the
+    uploaded articles and commit the sync if none failed"""
+    extracted = []
+    for result in con(**kwargs):
+        extracted.append(result.article_key)
+        if result.article_key not in failing:
+            con.acknowledge(result.article_key)
+    if not failing:
+        con.commit_sync()
+    return sorted(extracted)
+
+
+def test_pages_are_extracted(zotero, server):
+    assert upload(zotero) == ["ATTN2017", "ATTNARXV", "RESNET15"]
+    assert [request["start"] for request in server.pages()] == [0, 2]
+    assert zotero.cache.get_library_version("journalArticle") == 10
+
+
+def test_failed_upload_is_extracted_again(zotero):
+    assert upload(zotero, failing={"RESNET15"}) == [
+        "ATTN2017", "ATTNARXV", "RESNET15"
+    ]
+    assert zotero.cache.get_library_version("journalArticle") is None
+    assert zotero.cache.get("RESNET15") is None
+
+    # the sync was not committed, everything is fetched again but only the
+    # article that did not make it is extracted
+    assert upload(zotero) == ["RESNET15"]
+    assert zotero.cache.get_library_version("journalArticle") == 10
+
+
+def test_interrupted_upload_is_extracted_again(zotero):
+    results = zotero()
+    next(results)
+    # e.g. the process died before the bulk answered
+    results.close()
+    assert upload(zotero) == ["ATTN2017", "ATTNARXV", "RESNET15"]
+
+
+def test_since_run_extracts_the_changed_items(zotero, server):
+    upload(zotero)
+    server.replay(recorded("items.json"), recorded("items_since_10.json"))
+    server.requests.clear()
+
+    assert upload(zotero) == ["ADAM2014", "ATTN2017"]
+    assert {request["since"] for request in server.pages()} == {10}
+    assert zotero.cache.get_version("ATTN2017") == 11
+    assert zotero.cache.get_library_version("journalArticle") == 12
+
+    server.requests.clear()
+    assert upload(zotero) == []
+    assert server.pages()[0]["since"] == 12
+
+
+def test_near_duplicates_are_skipped(zotero):
+    dedup = NearDuplicateIndex()
+    assert upload(zotero, dedup=dedup) == ["ATTN2017", "RESNET15"]
+    assert dedup.duplicates == {"ATTNARXV": "ATTN2017"}
+    # only the uploaded and the empty items are current
+    assert zotero.cache.get("ATTNARXV") is None
+    assert zotero.cache.get_version("NOABSTR1") == 9